@@ -1,8 +1,8 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
-import sys
-import traceback
+import logging
 from datetime import datetime
+from typing import Callable, List, Optional
 
 from botbuilder.core import (
     BotFrameworkAdapter,
@@ -10,7 +10,17 @@ from botbuilder.core import (
     ConversationState,
     TurnContext,
 )
-from botbuilder.schema import ActivityTypes, Activity
+from botbuilder.schema import ActivityTypes, Activity, ResourceResponse
+from botframework.connector.aio import ConnectorClient
+from botframework.connector.auth import AppCredentials, ClaimsIdentity, MicrosoftAppCredentials
+
+from auth_cache import ValidatedTokenCache
+from connector_pool import ConnectorClientPool
+from helpers.outbound_batching import OutboundBatchPolicy, merge_activities
+from helpers.tracing import span
+from storage import StateConflict
+
+logger = logging.getLogger(__name__)
 
 
 class AdapterWithErrorHandler(BotFrameworkAdapter):
@@ -18,18 +28,29 @@ class AdapterWithErrorHandler(BotFrameworkAdapter):
         self,
         settings: BotFrameworkAdapterSettings,
         conversation_state: ConversationState,
+        outbound_policy: Optional[OutboundBatchPolicy] = None,
+        connector_pool: Optional[ConnectorClientPool] = None,
+        token_cache: Optional[ValidatedTokenCache] = None,
     ):
         super().__init__(settings)
         self._conversation_state = conversation_state
+        # Channels whose messages are held until the end of the turn and merged.
+        self._outbound_policy = outbound_policy or OutboundBatchPolicy({})
+        # Clients of the connectors sharing their connections, and the
+        # identities of the Authorization headers already validated.
+        self._connector_pool = connector_pool
+        self._token_cache = token_cache
 
         # Catch-all for errors.
         async def on_error(context: TurnContext, error: Exception):
-            # This check writes out errors to console log
-            # NOTE: In production environment, you should consider logging this to Azure
-            #       application insights.
-            print(f"\n [on_turn_error] unhandled error: {error}", file=sys.stderr)
-# Sfix
-            traceback.print_exc()
+            # Another worker saved the conversation during the turn: its state
+            # is kept, and the turn is refused so the channel retries it on
+            # that state.
+            if isinstance(error, StateConflict):
+                raise error
+
+            # This check writes out errors to the log, local and application insights.
+            logger.error(f"[on_turn_error] unhandled error: {error}", exc_info=error)
 
             # Send a message to the user
             await context.send_activity("The bot encountered an error or bug.")
@@ -55,3 +76,72 @@ class AdapterWithErrorHandler(BotFrameworkAdapter):
             await self._conversation_state.delete(context)
 
         self.on_turn_error = on_error
+
+    async def _authenticate_request(
+        self, request: Activity, auth_header: str
+    ) -> ClaimsIdentity:
+        if self._token_cache is None or not auth_header:
+            return await super()._authenticate_request(request, auth_header)
+        key = self._token_cache.key(auth_header, request.channel_id, request.service_url)
+        identity = self._token_cache.get(key)
+        if identity is None:
+            identity = await super()._authenticate_request(request, auth_header)
+            self._token_cache.put(key, identity)
+        return identity
+
+    def _get_or_create_connector_client(
+        self, service_url: str, credentials: AppCredentials
+    ) -> ConnectorClient:
+        if self._connector_pool is None:
+            return super()._get_or_create_connector_client(service_url, credentials)
+        return self._connector_pool.client(
+            service_url, credentials or MicrosoftAppCredentials.empty()
+        )
+
+    # Activities held in the turn state until the end of the turn.
+    _OUTBOX_KEY = "AdapterWithErrorHandler.outbox"
+
+    async def process_activity(self, req, auth_header: str, logic: Callable):
+        """Run the turn, sending its messages merged at its end when the channel allows it."""
+
+        async def logic_then_flush(context: TurnContext):
+            # An invoke waits for its response within the turn: nothing held.
+            if context.activity.type == ActivityTypes.invoke or not self._outbound_policy.merges(
+                context.activity.channel_id
+            ):
+                return await logic(context)
+            context.turn_state[self._OUTBOX_KEY] = []
+            try:
+                return await logic(context)
+            except StateConflict:
+                # The turn is run again on the state saved by the other
+                # worker: its messages held are dropped, not sent twice.
+                context.turn_state.pop(self._OUTBOX_KEY, None)
+                raise
+            finally:
+                # The messages of on_turn_error are sent as they come.
+                await self._flush(context)
+
+        return await super().process_activity(req, auth_header, logic_then_flush)
+
+    async def _flush(self, context: TurnContext) -> List[ResourceResponse]:
+        """Send the activities held, merged, and stop holding them."""
+        outbox = context.turn_state.pop(self._OUTBOX_KEY, None)
+        if not outbox:
+            return []
+        return await self._send(context, merge_activities(outbox))
+
+    async def _send(
+        self, context: TurnContext, activities: List[Activity]
+    ) -> List[ResourceResponse]:
+        with span("send_activity", count=len(activities)):
+            return await super().send_activities(context, activities)
+
+    async def send_activities(
+        self, context: TurnContext, activities: List[Activity]
+    ) -> List[ResourceResponse]:
+        outbox = context.turn_state.get(self._OUTBOX_KEY)
+        if outbox is None:
+            return await self._send(context, activities)
+        outbox.extend(activities)
+        return [ResourceResponse(id="") for _ in activities]
@@ -16,38 +16,23 @@ from dotenv import load_dotenv
 load_dotenv(dotenv_path= 'C:\\Users\\serge\\OneDrive\\Data Sciences\\Data Sciences - Ingenieur IA\\10e projet\\Deliverables')
 
 import os
+import socket
 import sys
 if os.getcwd() not in sys.path:
     sys.path.append(os.getcwd())
 
 import logging
-from opencensus.ext.azure.log_exporter import AzureLogHandler
 logger = logging.getLogger(__name__)
-logger.addHandler(
-                    # AzureLogHandler(
-                    #                 connection_string= "InstrumentationKey=" \
-                    #     + f"{os.getenv('AppInsightsInstrumentationKey')}"
-                    # )
-                    AzureLogHandler(
-                                    connection_string= "InstrumentationKey=" \
-                        + f"{os.getenv('AppInsightsInstrumentationKey')};"  \
-                        +                               "IngestionEndpoint=" \
-                        + f"{os.getenv('AppInsightsIngestionEndpoint')}"
-                    )
-)
 logger.setLevel(level= logging.INFO)
+# The texts received, written to the local log only.
+messages_logger = logging.getLogger("messages")
 
 from http import HTTPStatus
 
 from aiohttp import web
 from aiohttp.web import middleware
 from aiohttp.web import Request, Response, json_response
-from botbuilder.core import (
-    BotFrameworkAdapterSettings,
-    ConversationState,
-    MemoryStorage,
-    UserState,
-)
+from botbuilder.core import BotFrameworkAdapterSettings
 from botbuilder.core.integration import aiohttp_error_middleware
 from botbuilder.schema import Activity
 from botbuilder.applicationinsights import ApplicationInsightsTelemetryClient
@@ -59,29 +44,105 @@ from botbuilder.integration.applicationinsights.aiohttp import (
 from config import DefaultConfig
 from dialogs.main_dialog import MainDialog
 from dialogs.specifying_dialog import Specifying_dialog
+from dialogs.slot_filling_dialog import Slot_filling_dialog
 from bots import DialogAndWelcomeBot
+from storage import (
+    ActivityDeduplicator,
+    BoundedMemoryStorage,
+    ConversationLeases,
+    DeltaConversationState,
+    DeltaUserState,
+    SqliteActivityDeduplicator,
+    SqliteConversationLeases,
+    SqliteStorage,
+    StateConflict,
+)
 
-from opencensus.trace.samplers import ProbabilitySampler
-from opencensus.trace.tracer import Tracer
 
 
 from adapter_with_error_handler import AdapterWithErrorHandler
+from auth_cache import ValidatedTokenCache, install_openid_metadata_cache, openid_metadata_stats
+from connector_pool import AppTokenCache, ConnectorClientPool
+from journey_details import UtteranceLog
 from journey_specifier_recognizer import Journey_specifier_recognizer
+from local_journey_recognizer import Local_journey_recognizer
+from luis_transport import CircuitBreaker
+from cascading_recognizer import LOCAL_TIER, LUIS_TIER, Cascading_recognizer
+from helpers.logging_pipeline import install_logging_pipeline
+from helpers.metrics_registry import REGISTRY
+from helpers.outbound_batching import OutboundBatchPolicy
+from helpers.recognition_cache import TurnRecognitionCache
+from helpers.slow_turn_capture import SlowTurnCapture
+from helpers.step_profiler import PROFILER
+from helpers.tracing import create_turn_tracer, span
+from turn_dispatcher import TurnDispatcher, TurnRejected
 
 CONFIG = DefaultConfig()
 
+# One pipeline writes the logs of every module, without blocking the turns.
+LOGGING_PIPELINE = install_logging_pipeline(CONFIG)
+
+PROFILER.enabled = CONFIG.PROFILE_STEPS
+PROFILER.measure_state = CONFIG.PROFILE_STEPS_STATE_SIZE
+UtteranceLog.max_utterances = CONFIG.UTTERANCE_LOG_SIZE
+
 # Create adapter.
 # See https://aka.ms/about-bot-adapter to learn more about how bots work.
 SETTINGS = BotFrameworkAdapterSettings(CONFIG.APP_ID, CONFIG.APP_PASSWORD)
 
 # Create MemoryStorage, UserState and ConversationState
-MEMORY = MemoryStorage()
-USER_STATE = UserState(MEMORY)
-CONVERSATION_STATE = ConversationState(MEMORY)
+# The idle conversations are forgotten so the memory stays bounded.
+if CONFIG.STATE_STORAGE == "sqlite":
+    MEMORY = SqliteStorage(
+        CONFIG.STATE_SQLITE_PATH,
+        idle_ttl=CONFIG.STATE_IDLE_TTL,
+        batch_delay=CONFIG.STATE_WRITE_BATCH_DELAY,
+        cache_size=CONFIG.STATE_MAX_ENTRIES,
+    )
+    DEDUPLICATOR = SqliteActivityDeduplicator(
+        CONFIG.STATE_SQLITE_PATH,
+        window=CONFIG.ACTIVITY_DEDUP_WINDOW,
+        max_entries=CONFIG.ACTIVITY_DEDUP_MAX_ENTRIES,
+    )
+    # The workers share the conversations: one at a time runs a turn of each.
+    LEASES = SqliteConversationLeases(
+        CONFIG.STATE_SQLITE_PATH,
+        ttl=CONFIG.CONVERSATION_LEASE_TTL,
+        wait=CONFIG.CONVERSATION_LEASE_WAIT,
+        retry_after=CONFIG.RETRY_AFTER,
+    )
+else:
+    MEMORY = BoundedMemoryStorage(CONFIG.STATE_MAX_ENTRIES, CONFIG.STATE_IDLE_TTL)
+    DEDUPLICATOR = ActivityDeduplicator(
+        window=CONFIG.ACTIVITY_DEDUP_WINDOW, max_entries=CONFIG.ACTIVITY_DEDUP_MAX_ENTRIES
+    )
+    LEASES = ConversationLeases()
+# The states are written only when they changed, and when the storage
+# allows it, only their properties changed.
+USER_STATE = DeltaUserState(MEMORY)
+CONVERSATION_STATE = DeltaConversationState(MEMORY)
 
 # Create adapter.
 # See https://aka.ms/about-bot-adapter to learn more about how bots work.
-ADAPTER = AdapterWithErrorHandler(SETTINGS, CONVERSATION_STATE)
+# The replies share kept-alive connections per connector and a cached token;
+# the validations of the requests received are cached as well.
+install_openid_metadata_cache(CONFIG.OPENID_METADATA_TTL)
+CONNECTOR_POOL = ConnectorClientPool(
+    AppTokenCache(CONFIG.APP_TOKEN_REFRESH_MARGIN),
+    connections_per_service=CONFIG.CONNECTOR_POOL_SIZE,
+    keepalive=CONFIG.CONNECTOR_KEEPALIVE,
+    timeout=CONFIG.CONNECTOR_TIMEOUT,
+)
+TOKEN_CACHE = (
+    ValidatedTokenCache(CONFIG.AUTH_TOKEN_CACHE_SIZE) if CONFIG.AUTH_TOKEN_CACHE_SIZE > 0 else None
+)
+ADAPTER = AdapterWithErrorHandler(
+    SETTINGS,
+    CONVERSATION_STATE,
+    OutboundBatchPolicy.from_setting(CONFIG.OUTBOUND_BATCHING),
+    connector_pool=CONNECTOR_POOL,
+    token_cache=TOKEN_CACHE,
+)
 
 # Create telemetry client.
 # Note the small 'client_queue_size'.  This is for demonstration purposes.  Larger queue sizes
@@ -94,16 +155,125 @@ TELEMETRY_CLIENT = ApplicationInsightsTelemetryClient(
     client_queue_size=10,
 )
 
-# Create a tracer for the dialogs that does not go well
-tracer = Tracer(sampler= ProbabilitySampler(1.0))
+# Trace the turns, keeping the errors, the slow ones and a few others.
+TRACER = create_turn_tracer(CONFIG)
 
 
 # Create dialogs and Bot
-RECOGNIZER = Journey_specifier_recognizer(CONFIG)
-SPECIFYING_DIALOG = Specifying_dialog()
+LOCAL_RECOGNIZER = Local_journey_recognizer(CONFIG)
+LUIS_RECOGNIZER = Journey_specifier_recognizer(
+    CONFIG, fallback=LOCAL_RECOGNIZER if LOCAL_RECOGNIZER.is_configured else None
+)
+RECOGNIZER = LUIS_RECOGNIZER
+if not RECOGNIZER.is_configured and LOCAL_RECOGNIZER.is_configured:
+    # Degraded mode: no LUIS, the messages are decoded by the local model.
+    logger.warning("LUIS is not configured, using the local model.")
+    RECOGNIZER = LOCAL_RECOGNIZER
+# The short answers to the prompts are decoded locally when possible.
+RECOGNIZER = Cascading_recognizer(CONFIG, RECOGNIZER, LOCAL_RECOGNIZER.model)
+SPECIFYING_DIALOG = (
+    Slot_filling_dialog() if CONFIG.DIALOG_MODE == "slot_filling" else Specifying_dialog()
+)
 DIALOG = MainDialog(RECOGNIZER, SPECIFYING_DIALOG, telemetry_client=TELEMETRY_CLIENT)
 BOT = DialogAndWelcomeBot(CONVERSATION_STATE, USER_STATE, DIALOG, TELEMETRY_CLIENT)
 
+# The turns of a conversation run one after the other, so they do not race
+# on its DialogState, and the bot sheds the load it cannot take.
+DISPATCHER = TurnDispatcher(
+    max_in_flight=CONFIG.MAX_IN_FLIGHT_TURNS,
+    max_waiting=CONFIG.MAX_QUEUED_TURNS,
+    max_per_conversation=CONFIG.MAX_QUEUED_TURNS_PER_CONVERSATION,
+    retry_after=CONFIG.RETRY_AFTER,
+)
+
+# Opt-in: the turns slower than their objective leave a capture on disk.
+ON_TURN = BOT.on_turn
+SLOW_TURN_CAPTURE = None
+if CONFIG.SLOW_TURN_CAPTURE:
+    SLOW_TURN_CAPTURE = SlowTurnCapture(
+        CONVERSATION_STATE,
+        CONFIG.SLOW_TURN_DIRECTORY,
+        threshold=CONFIG.SLOW_TURN_THRESHOLD,
+        captures_per_minute=CONFIG.SLOW_TURN_CAPTURES_PER_MINUTE,
+        max_files=CONFIG.SLOW_TURN_MAX_FILES,
+        interval=CONFIG.SLOW_TURN_SAMPLE_INTERVAL,
+    )
+    ON_TURN = SLOW_TURN_CAPTURE.wrap(BOT.on_turn)
+
+# Gauges of /metrics, read when scraped.
+REGISTRY.gauge("bot_in_flight_turns", "Turns running.", lambda: DISPATCHER.in_flight)
+REGISTRY.gauge(
+    "bot_queued_turns",
+    "Turns waiting for their conversation or a free slot.",
+    lambda: DISPATCHER.waiting,
+)
+REGISTRY.gauge(
+    "bot_active_conversations",
+    "Conversations with a turn running or waiting.",
+    lambda: DISPATCHER.conversations,
+)
+if isinstance(MEMORY, BoundedMemoryStorage):
+    # With SQLite the states are on disk, shared by the workers.
+    REGISTRY.gauge(
+        "bot_live_conversations",
+        "Conversations whose state is held in memory.",
+        lambda: sum(1 for key in list(MEMORY.memory) if "/conversations/" in key),
+    )
+# The answers of the local tier of the recognition, which skip LUIS.
+REGISTRY.gauge(
+    "bot_local_answers",
+    "Answers to the prompts decoded locally, without LUIS.",
+    lambda: sum(RECOGNIZER.stats()[LOCAL_TIER].values()),
+)
+REGISTRY.gauge(
+    "bot_luis_answers",
+    "Messages the local tier left to LUIS.",
+    lambda: sum(RECOGNIZER.stats()[LUIS_TIER].values()),
+)
+# The recognition by LUIS: its caches, the calls shared, the circuit and the hedges.
+REGISTRY.gauge(
+    "bot_luis_turn_cache_hits",
+    "Recognitions of a message already decoded during its turn.",
+    lambda: TurnRecognitionCache.hits,
+)
+REGISTRY.gauge(
+    "bot_luis_cache_hits",
+    "Results of LUIS served by the cache shared by the conversations.",
+    lambda: LUIS_RECOGNIZER.cache_stats.get("hits", 0),
+)
+REGISTRY.gauge(
+    "bot_luis_cache_misses",
+    "Results of LUIS missing from the cache shared by the conversations.",
+    lambda: LUIS_RECOGNIZER.cache_stats.get("misses", 0),
+)
+REGISTRY.gauge(
+    "bot_luis_calls_coalesced",
+    "Requests to LUIS answered by an identical call in flight.",
+    lambda: LUIS_RECOGNIZER.coalescing_stats["coalesced"],
+)
+REGISTRY.gauge(
+    "bot_luis_circuit_open",
+    "1 when the calls to LUIS fail fast, else 0.",
+    lambda: int(
+        LUIS_RECOGNIZER.transport_stats.get("circuit", {}).get("state") == CircuitBreaker.OPEN
+    ),
+)
+REGISTRY.gauge(
+    "bot_luis_fallback_answers",
+    "Messages decoded by the local recognizer as LUIS was unavailable.",
+    lambda: LUIS_RECOGNIZER.fallback_answers,
+)
+REGISTRY.gauge(
+    "bot_luis_hedges_fired",
+    "Second requests sent to LUIS as the first one was slow.",
+    lambda: LUIS_RECOGNIZER.hedge_stats.get("fired", 0),
+)
+REGISTRY.gauge(
+    "bot_luis_hedge_delay_seconds",
+    "Delay before a request to LUIS is hedged.",
+    lambda: LUIS_RECOGNIZER.hedge_stats.get("delay", 0),
+)
+
 
 
 
@@ -120,23 +290,60 @@ async def messages(req: Request) -> Response:
     # logger.info("Info - Entre avec un message - Sfix")
     # logger.warning("Warning - Entre dans messages - Sfix")
     # Main bot message handler.
-    if "application/json" in req.headers["Content-Type"]:
-        body = await req.json()
-    else:
-        logger.error(f"Request {req} header {req.headers['Content-Type']} to messages")
-        return Response(status=HTTPStatus.UNSUPPORTED_MEDIA_TYPE)
-
-    activity = Activity().deserialize(body)
-    auth_header = req.headers["Authorization"] if "Authorization" in req.headers else ""
-
-    # TODO See if kept because is creating a lot of data and it is expensive
-    if activity.has_content():
-        with tracer.span(name= "Msg") as span:
-            print(f"{activity.channel_data['clientActivityID']}|{activity.text}") 
-    response = await ADAPTER.process_activity(activity, auth_header, BOT.on_turn)
-    if response:
-        return json_response(data=response.body, status=response.status)
-    return Response(status=HTTPStatus.OK)
+    with TRACER.turn("turn") as turn_span:
+        with span("parse"):
+            if "application/json" in req.headers["Content-Type"]:
+                body = await req.json()
+            else:
+                logger.error(f"Request {req} header {req.headers['Content-Type']} to messages")
+                return Response(status=HTTPStatus.UNSUPPORTED_MEDIA_TYPE)
+
+            activity = Activity().deserialize(body)
+        auth_header = req.headers["Authorization"] if "Authorization" in req.headers else ""
+        turn_span.attributes["activity_type"] = activity.type
+
+        # TODO See if kept because is creating a lot of data and it is expensive
+        if activity.has_content():
+            messages_logger.info(f"{activity.channel_data['clientActivityID']}|{activity.text}")
+        conversation_id = activity.conversation.id if activity.conversation else ""
+        # A retry of the channel is acknowledged without running the turn again.
+        activity_key = DEDUPLICATOR.key(conversation_id, activity.id)
+        if await DEDUPLICATOR.is_duplicate(activity_key):
+            turn_span.attributes["duplicate"] = True
+            return Response(status=HTTPStatus.OK)
+
+        async def process_activity():
+            # Another worker may be running a turn of the conversation.
+            async with LEASES.hold(conversation_id):
+                with span("process_activity"):
+                    return await ADAPTER.process_activity(activity, auth_header, ON_TURN)
+
+        try:
+            # The time in the queue of the conversation is the dispatch less the processing.
+            with span("dispatch"):
+                response = await DISPATCHER.dispatch(conversation_id, process_activity)
+        except TurnRejected as rejection:
+            await DEDUPLICATOR.forget(activity_key)
+            logger.warning(f"Turn refused: {rejection}")
+            return Response(
+                status=HTTPStatus.SERVICE_UNAVAILABLE,
+                headers={"Retry-After": str(rejection.retry_after)},
+            )
+        except StateConflict as conflict:
+            # Another worker saved the conversation during the turn.
+            await DEDUPLICATOR.forget(activity_key)
+            logger.warning(f"Turn not saved: {conflict}")
+            return Response(
+                status=HTTPStatus.SERVICE_UNAVAILABLE,
+                headers={"Retry-After": str(CONFIG.RETRY_AFTER)},
+            )
+        except Exception:
+            # Let the retry of the channel run the turn.
+            await DEDUPLICATOR.forget(activity_key)
+            raise
+        if response:
+            return json_response(data=response.body, status=response.status)
+        return Response(status=HTTPStatus.OK)
 
 
 
@@ -152,11 +359,56 @@ async def alive(request, handler) -> Response:
     return response
 
 
+# Counters exported, by path.
+STATS = {
+    "/api/stats/turns": lambda: DISPATCHER.stats(),
+    "/api/stats/duplicates": lambda: DEDUPLICATOR.stats(),
+    "/api/stats/leases": lambda: LEASES.stats(),
+    "/api/stats/logging": lambda: LOGGING_PIPELINE.stats(),
+    "/api/stats/tracing": lambda: TRACER.stats(),
+    "/api/stats/luis": lambda: {
+        "cascade": RECOGNIZER.stats(),
+        "turn_cache": TurnRecognitionCache.stats(),
+        "cache": LUIS_RECOGNIZER.cache_stats,
+        "coalescing": LUIS_RECOGNIZER.coalescing_stats,
+        "transport": LUIS_RECOGNIZER.transport_stats,
+        "hedging": LUIS_RECOGNIZER.hedge_stats,
+    },
+    "/api/stats/steps": lambda: PROFILER.report(),
+    "/api/stats/state": lambda: {
+        "conversation": CONVERSATION_STATE.stats(),
+        "user": USER_STATE.stats(),
+        "storage": MEMORY.stats(),
+    },
+    "/api/stats/slow_turns": lambda: SLOW_TURN_CAPTURE.stats() if SLOW_TURN_CAPTURE else {},
+    "/api/stats/connector": lambda: {
+        "pool": CONNECTOR_POOL.stats(),
+        "validated_tokens": TOKEN_CACHE.stats() if TOKEN_CACHE else {},
+        "openid_metadata": openid_metadata_stats(),
+    },
+}
+
+
+@middleware
+async def turn_stats(request, handler) -> Response:
+    """Export the counters, and the metrics in the Prometheus text format."""
+    if request.method == "GET" and request.path in STATS:
+        return json_response(data=STATS[request.path]())
+    if request.method == "GET" and request.path == "/metrics":
+        return Response(
+            text=REGISTRY.render(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+    return await handler(request)
+
+
 def init_func(argv):
     """Create the routes to the different features."""
-    APP = web.Application(middlewares=[alive, bot_telemetry_middleware, aiohttp_error_middleware])
+    APP = web.Application(middlewares=[alive, turn_stats, bot_telemetry_middleware, aiohttp_error_middleware])
     APP.router.add_post("/api/messages", messages)
     APP.router.add_route('GET', '/health_check', alive)
+    APP.on_cleanup.append(lambda app: CONNECTOR_POOL.close())
+    APP.on_cleanup.append(lambda app: LUIS_RECOGNIZER.close())
     return APP
 
 
@@ -168,7 +420,16 @@ if __name__ == "__main__":
         properties = {'custom_dimensions': {'app': 'Fly Me Now', 'version': '0.9'}}
         # Use properties in logging statements
         logger.info('Launch', extra=properties)
-        web.run_app(APP, host=f"{os.environ['ServiceURL']}", port=CONFIG.PORT)
+        listen_fd = os.getenv("BotListenFd")
+        if listen_fd:
+            # Worker of prefork.py: serve on the socket shared by the workers.
+            web.run_app(
+                APP,
+                sock=socket.socket(fileno=int(listen_fd)),
+                shutdown_timeout=CONFIG.DRAIN_TIMEOUT,
+            )
+        else:
+            web.run_app(APP, host=f"{os.environ['ServiceURL']}", port=CONFIG.PORT)
     except Exception as error:
         properties = {'custom_dimensions': {'app': 'Fly Me Now', 'error': f'{error}'}}
         # Use properties in logging statements
@@ -0,0 +1,199 @@
+"""Caches of the validation of the requests received from the channels.
+
+Each request carries a JWT in its Authorization header. The SDK checks its
+signature at every request, parsing again the signing key, and reads the
+OpenID metadata with the requests library, blocking the event loop. The
+same token is sent for about an hour, so the identities validated are kept
+until the token expires, and the signing keys are parsed once per refresh
+of the metadata, done in a thread.
+"""
+
+import asyncio
+import copy
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import requests
+from botframework.connector.auth import ClaimsIdentity, JwtTokenExtractor
+from jwt.algorithms import RSAAlgorithm
+
+
+class ValidatedTokenCache:
+    """Identities of the Authorization headers validated, until they expire.
+
+    An identity is keyed by the header and what its validation depends on
+    (the channel and the service_url of the activity), hashed so the tokens
+    are not kept in memory.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_ttl: float = 3600.0):
+        """Init the class.
+
+        Args:
+            max_entries (int, optional): identities kept, the least recently
+                used are forgotten first. Defaults to 10000.
+            max_ttl (float, optional): seconds an identity is kept at most,
+                even when its token expires later. Defaults to 3600.0.
+        """
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._identities: "OrderedDict[str, Tuple[ClaimsIdentity, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(auth_header: str, channel_id: Optional[str], service_url: Optional[str]) -> str:
+        """Return the key of a header received on a channel."""
+        text = f"{auth_header}\n{channel_id or ''}\n{service_url or ''}"
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[ClaimsIdentity]:
+        """Return a copy of the identity of a key, None when unknown or expired."""
+        identity_and_expiry = self._identities.get(key)
+        if identity_and_expiry is None or identity_and_expiry[1] <= time.time():
+            if identity_and_expiry is not None:
+                del self._identities[key]
+            self.misses += 1
+            return None
+        self._identities.move_to_end(key)
+        self.hits += 1
+        return copy.deepcopy(identity_and_expiry[0])
+
+    def put(self, key: str, identity: ClaimsIdentity) -> None:
+        """Keep an identity until the expiry of its token."""
+        if not identity.is_authenticated:
+            return
+        now = time.time()
+        try:
+            expiry = min(float(identity.claims["exp"]), now + self.max_ttl)
+        except (KeyError, TypeError, ValueError):
+            return
+        if expiry <= now:
+            return
+        self._identities[key] = (copy.deepcopy(identity), expiry)
+        self._identities.move_to_end(key)
+        while len(self._identities) > self.max_entries:
+            self._identities.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the counters of the cache.
+
+        Returns:
+            Dict[str, int]: identities kept, hits and misses.
+        """
+        return {"identities": len(self._identities), "hits": self.hits, "misses": self.misses}
+
+
+class _Signing_key:
+    """A signing key of the metadata, parsed."""
+
+    __slots__ = ("public_key", "endorsements")
+
+    def __init__(self, public_key, endorsements):
+        self.public_key = public_key
+        self.endorsements = endorsements
+
+
+class CachingOpenIdMetadata:
+    """OpenID metadata of an issuer, with its keys parsed once per refresh.
+
+    Same interface as the metadata of JwtTokenExtractor: get(key_id).
+    """
+
+    # Counters of all the metadata.
+    hits = 0
+    refreshes = 0
+
+    def __init__(self, url: str, ttl: float = 86400.0, missing_key_refresh: float = 3600.0):
+        """Init the class.
+
+        Args:
+            url (str): the OpenID configuration.
+            ttl (float, optional): seconds the keys are used before a
+                refresh. Defaults to 86400.0.
+            missing_key_refresh (float, optional): seconds between two
+                refreshes asked by an unknown key. Defaults to 3600.0.
+        """
+        self.url = url
+        self.ttl = ttl
+        self.missing_key_refresh = missing_key_refresh
+        self.keys: Dict[str, _Signing_key] = {}
+        self.last_updated = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _fetch(self) -> Dict[str, _Signing_key]:
+        """Read the keys of the metadata (in a thread)."""
+        response = requests.get(self.url, timeout=30)
+        response.raise_for_status()
+        response_keys = requests.get(response.json()["jwks_uri"], timeout=30)
+        response_keys.raise_for_status()
+        return {
+            key["kid"]: _Signing_key(
+                RSAAlgorithm.from_jwk(json.dumps(key)), key.get("endorsements", [])
+            )
+            for key in response_keys.json()["keys"]
+        }
+
+    async def _refresh(self, older_than: float) -> None:
+        """Read the keys again, unless done since older_than seconds."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if time.time() - self.last_updated < older_than:
+                return
+            self.keys = await asyncio.get_running_loop().run_in_executor(None, self._fetch)
+            self.last_updated = time.time()
+            CachingOpenIdMetadata.refreshes += 1
+
+    async def get(self, key_id: str) -> Optional[_Signing_key]:
+        """Return the signing key of an id, None when unknown."""
+        if time.time() - self.last_updated > self.ttl:
+            await self._refresh(self.ttl)
+        key = self.keys.get(key_id)
+        if key is None:
+            await self._refresh(self.missing_key_refresh)
+            key = self.keys.get(key_id)
+        else:
+            CachingOpenIdMetadata.hits += 1
+        return key
+
+
+class _Caching_metadata_map(dict):
+    """Metadata of JwtTokenExtractor per URL, creating CachingOpenIdMetadata."""
+
+    def __init__(self, ttl: float):
+        super(_Caching_metadata_map, self).__init__()
+        self.ttl = ttl
+
+    def get(self, url, default=None):
+        metadata = super(_Caching_metadata_map, self).get(url)
+        if metadata is None:
+            metadata = self[url] = CachingOpenIdMetadata(url, self.ttl)
+        return metadata
+
+
+def install_openid_metadata_cache(ttl: float = 86400.0) -> None:
+    """Make the JwtTokenExtractor of the SDK use CachingOpenIdMetadata.
+
+    Args:
+        ttl (float, optional): seconds the keys are used before a refresh.
+            Defaults to 86400.0.
+    """
+    if not isinstance(JwtTokenExtractor.metadataCache, _Caching_metadata_map):
+        JwtTokenExtractor.metadataCache = _Caching_metadata_map(ttl)
+
+
+def openid_metadata_stats() -> Dict[str, int]:
+    """Return the counters of the OpenID metadata.
+
+    Returns:
+        Dict[str, int]: issuers, keys found in the cache and refreshes.
+    """
+    return {
+        "issuers": len(JwtTokenExtractor.metadataCache),
+        "hits": CachingOpenIdMetadata.hits,
+        "refreshes": CachingOpenIdMetadata.refreshes,
+    }
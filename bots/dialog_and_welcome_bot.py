@@ -1,8 +1,6 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
 """Main dialog to welcome users."""
-import json
-from os import replace
 import os.path
 
 from typing import List
@@ -16,8 +14,18 @@ from botbuilder.core import (
 )
 from botbuilder.schema import Activity, Attachment, ChannelAccount
 from helpers.activity_helper import create_activity_reply
+from helpers.card_templates import CardTemplateEngine
 from .dialog_bot import DialogBot
 
+# The cards of the bot, compiled when the module is loaded.
+RESOURCES_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), "resources")
+CARDS = CardTemplateEngine()
+CARDS.register(
+    "welcome",
+    os.path.join(RESOURCES_PATH, "welcomeCard.json"),
+    os.path.join(RESOURCES_PATH, "welcomeCard.data.json"),
+)
+
 
 class DialogAndWelcomeBot(DialogBot):
     """Main dialog to welcome users."""
@@ -52,32 +60,7 @@ class DialogAndWelcomeBot(DialogBot):
         response.attachments = [attachment]
         return response
 
-    # Load attachment from file.
-    def create_adaptive_card_attachment(self):
+    # Rendered once, served from the cache of the card engine.
+    def create_adaptive_card_attachment(self) -> Attachment:
         """Create an adaptive card."""
-        relative_path = os.path.abspath(os.path.dirname(__file__))
-        path = os.path.join(relative_path, "resources/welcomeCard.json")
-        with open(path) as card_file:
-            card_template = json.load(card_file)
-        path = os.path.join(relative_path, "resources/welcomeCard.data.json")
-        with open(path) as card_file:
-            card_data = json.load(card_file)
-
-        def replace(template: dict, data:dict):
-            import re
-            str_temp = json.dumps(template)
-            for key in data:
-                if type(data[key]) == dict:
-                    for sub_key in data[key]:
-                        pattern = "\${"+key+"."+sub_key+"}"
-                        str_temp = re.sub(pattern, data[key][sub_key], str_temp)
-                else:
-                    pattern = "\${"+key+"}"
-                    str_temp = re.sub(pattern, str(data[key]), str_temp)
-            return json.loads(str_temp)
-
-        card = replace(template= card_template, data= card_data)
-        return Attachment(
-            content_type="application/vnd.microsoft.card.adaptive",
-            content= card
-        )
+        return CARDS.attachment("welcome")
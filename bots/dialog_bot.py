@@ -12,6 +12,7 @@ from botbuilder.core import (
 )
 from botbuilder.dialogs import Dialog, DialogExtensions
 from helpers.dialog_helper import DialogHelper
+from helpers.tracing import span
 
 
 class DialogBot(ActivityHandler):
@@ -39,6 +40,8 @@ class DialogBot(ActivityHandler):
         self.telemetry_client = telemetry_client
 
     async def on_message_activity(self, turn_context: TurnContext):
+        with span("state_load"):
+            await self.conversation_state.load(turn_context)
         await DialogExtensions.run_dialog(
             self.dialog,
             turn_context,
@@ -46,8 +49,9 @@ class DialogBot(ActivityHandler):
         )
 
         # Save any state changes that might have occured during the turn.
-        await self.conversation_state.save_changes(turn_context, False)
-        await self.user_state.save_changes(turn_context, False)
+        with span("state_save"):
+            await self.conversation_state.save_changes(turn_context, False)
+            await self.user_state.save_changes(turn_context, False)
 
     @property
     def telemetry_client(self) -> BotTelemetryClient:
@@ -0,0 +1,253 @@
+"""Decode the answers to the prompts locally first, with LUIS as a fallback.
+
+Most answers to the prompts of Specifying_dialog are a single city, date or
+amount. The local tier finds them with the gazetteer and the grammars of
+local_journey_recognizer and gives a confidence. LUIS is only asked when the
+confidence is below the threshold of the prompt.
+"""
+from typing import Dict, List, Optional, Set, Tuple
+
+from botbuilder.core import IntentScore, Recognizer, RecognizerResult, TurnContext
+
+from config import DefaultConfig
+from helpers.recognition_cache import EXPECTED_PROMPT_KEY, TurnRecognitionCache
+from local_journey_recognizer import (
+    Local_journey_model,
+    extract_dates,
+    extract_money,
+    tokenize,
+)
+from shared_code.constants.luis_app import LUIS_APPS
+
+
+# Words that do not change the meaning of a short answer.
+FILLER_WORDS: Set[str] = {
+    "a", "about", "am", "and", "around", "at", "be", "budget", "by", "city",
+    "fly", "for", "from", "go", "going", "i", "i'd", "i'll", "i'm", "in", "is",
+    "it", "leave", "leaving", "like", "max", "maximum", "my", "of", "on",
+    "please", "the", "to", "top", "travel", "travelling", "up", "want",
+    "will", "would",
+}
+PLACE_PROMPTS: Dict[str, str] = {"destination": "To place", "origin": "From place"}
+DATE_PROMPTS: Dict[str, str] = {"departure_date": "From date", "return_date": "To date"}
+BUDGET_PROMPT = "budget"
+LOCAL_TIER = "local"
+LUIS_TIER = "luis"
+
+
+def parse_thresholds(value: str) -> Dict[str, float]:
+    """Parse the thresholds of the configuration.
+
+    Args:
+        value (str): e.g. "destination:0.5,budget:0.6".
+
+    Returns:
+        Dict[str, float]: the threshold of each prompt.
+    """
+    thresholds = {}
+    for item in (value or "").split(","):
+        if ":" in item:
+            prompt, threshold = item.split(":", 1)
+            thresholds[prompt.strip()] = float(threshold)
+    return thresholds
+
+
+class Cascading_recognizer(Recognizer):
+    """Try the local extractors, then LUIS.
+
+    Args:
+        Recognizer (botbuilder.core.Recognizer): Recognizer
+    """
+
+    # The local tier depends on the prompt: only LUIS is cached per turn.
+    caches_turn_recognition = True
+
+    def __init__(
+        self,
+        configuration: DefaultConfig,
+        fallback: Recognizer,
+        model: Local_journey_model = None,
+    ):
+        """Init the class.
+
+        Args:
+            configuration (DefaultConfig): configuration of the bot.
+            fallback (Recognizer): the recognizer asked when the local tier is
+                not confident enough, i.e. Journey_specifier_recognizer.
+            model (Local_journey_model, optional): gives the gazetteer of the
+                cities. Defaults to None.
+        """
+        self._fallback = fallback
+        self._thresholds = parse_thresholds(configuration.CASCADE_THRESHOLDS)
+        self._unknown_city_confidence = configuration.CASCADE_UNKNOWN_CITY_CONFIDENCE
+        self._max_learned_cities = configuration.CASCADE_MAX_LEARNED_CITIES
+        self._cities: Set[str] = set(model.cities) if model is not None else set()
+        self._learned_cities: Set[str] = set()
+        self._longest_city = max((len(city.split()) for city in self._cities), default=3)
+        self._answers: Dict[str, Dict[str, int]] = {LOCAL_TIER: {}, LUIS_TIER: {}}
+
+    @property
+    def is_configured(self) -> bool:
+        """Test if the fallback recognizer is ready.
+
+        Returns:
+            bool: true if the fallback is configured.
+        """
+        return self._fallback.is_configured
+
+    @property
+    def fallback(self) -> Recognizer:
+        """Return the recognizer used when the local tier is not confident."""
+        return self._fallback
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Return how many answers each tier gave, per prompt.
+
+        Returns:
+            Dict[str, Dict[str, int]]: number of answers per tier and prompt.
+        """
+        return {tier: dict(counts) for tier, counts in self._answers.items()}
+
+    def _count(self, tier: str, prompt: str) -> None:
+        """Count an answer of a tier."""
+        prompt = prompt or "none"
+        self._answers[tier][prompt] = self._answers[tier].get(prompt, 0) + 1
+
+    def _coverage(self, tokens: List[str], entity_tokens: List[str]) -> float:
+        """Return the share of the answer explained by the entity.
+
+        Args:
+            tokens (List[str]): the words of the answer.
+            entity_tokens (List[str]): the words of the entity.
+
+        Returns:
+            float: between 0 and 1.
+        """
+        if not tokens:
+            return 0.0
+        remaining = list(tokens)
+        for token in entity_tokens:
+            if token in remaining:
+                remaining.remove(token)
+        explained = len(tokens) - len([token for token in remaining if token not in FILLER_WORDS])
+        return explained / len(tokens)
+
+    def _find_cities(self, text: str) -> List[str]:
+        """Find the known cities of a text, the longest names first.
+
+        Args:
+            text (str): the text of the message.
+
+        Returns:
+            List[str]: the cities as written in the text.
+        """
+        words = text.replace(",", " ").replace(".", " ").split()
+        lowered = [word.lower() for word in words]
+        found = []
+        position = 0
+        while position < len(words):
+            for length in range(min(self._longest_city, len(words) - position), 0, -1):
+                name = " ".join(lowered[position:position + length])
+                if name in self._cities or name in self._learned_cities:
+                    found.append(" ".join(words[position:position + length]))
+                    position += length
+                    break
+            else:
+                position += 1
+        return found
+
+    def _recognize_place(self, text: str, prompt: str) -> Tuple[float, dict]:
+        """Find the city answering a prompt on a place."""
+        tokens = tokenize(text)
+        cities = self._find_cities(text)
+        if len(cities) == 1:
+            confidence = self._coverage(tokens, tokenize(cities[0]))
+            city = cities[0]
+        elif not cities and len(tokens) == 1 and tokens[0].isalpha() and len(tokens[0]) > 2:
+            # A single unknown word given to "Which city...?" is most likely a city.
+            confidence = self._unknown_city_confidence
+            city = text.strip(" .!,")
+        else:
+            return 0.0, {}
+        entity = LUIS_APPS.ENTITIES[f"{PLACE_PROMPTS[prompt]} name"].replace(" ", "_")
+        return confidence, {"geographyV2_city": [city], entity: [city]}
+
+    def _recognize_date(self, text: str, prompt: str) -> Tuple[float, dict]:
+        """Find the date answering a prompt on a date."""
+        dates = extract_dates(text)
+        if len(dates) != 1:
+            return 0.0, {}
+        _, _, date_text, timex = dates[0]
+        confidence = self._coverage(tokenize(text), tokenize(date_text))
+        entity = LUIS_APPS.ENTITIES[f"{DATE_PROMPTS[prompt]} name"].replace(" ", "_")
+        return confidence, {
+            "datetime": [{"type": "date", "timex": [timex]}],
+            entity: [date_text],
+        }
+
+    def _recognize_budget(self, text: str) -> Tuple[float, dict]:
+        """Find the amount answering the prompt on the budget."""
+        amounts = extract_money(text, whole_text_is_amount=True)
+        if len(amounts) != 1:
+            return 0.0, {}
+        _, _, amount_text, value = amounts[0]
+        confidence = self._coverage(tokenize(text), tokenize(amount_text))
+        entity = LUIS_APPS.ENTITIES["Max budget"].replace(" ", "_")
+        return confidence, {"money": [value], entity: [amount_text]}
+
+    def recognize_locally(self, text: str, prompt: Optional[str]) -> Tuple[float, dict]:
+        """Run the local tier.
+
+        Args:
+            text (str): the text of the message.
+            prompt (Optional[str]): the prompt the message answers.
+
+        Returns:
+            Tuple[float, dict]: the confidence and the entities found.
+        """
+        text = text or ""
+        if prompt in PLACE_PROMPTS:
+            return self._recognize_place(text, prompt)
+        if prompt in DATE_PROMPTS:
+            return self._recognize_date(text, prompt)
+        if prompt == BUDGET_PROMPT:
+            return self._recognize_budget(text)
+        return 0.0, {}
+
+    def _learn_cities(self, recognizer_result: RecognizerResult) -> None:
+        """Add the cities found by LUIS to the gazetteer."""
+        if len(self._learned_cities) >= self._max_learned_cities:
+            return
+        for city in (recognizer_result.entities or {}).get("geographyV2_city", []) or []:
+            if isinstance(city, str) and len(city.strip()) > 2:
+                self._learned_cities.add(city.lower().strip())
+
+    async def recognize(self, turn_context: TurnContext) -> RecognizerResult:
+        """Handle the response from user.
+
+        Args:
+            turn_context (TurnContext): context of the turn.
+
+        Returns:
+            RecognizerResult: intents and entities of the message.
+        """
+        prompt = turn_context.turn_state.get(EXPECTED_PROMPT_KEY)
+        threshold = self._thresholds.get(prompt)
+        if threshold is not None:
+            text = turn_context.activity.text
+            confidence, entities = self.recognize_locally(text, prompt)
+            if entities and confidence >= threshold:
+                self._count(LOCAL_TIER, prompt)
+                journey_intent = LUIS_APPS.INTENTS[LUIS_APPS.INTENT_SPECIFY_JOURNEY_NAME]
+                return RecognizerResult(
+                    text=text,
+                    altered_text=None,
+                    intents={journey_intent: IntentScore(confidence)},
+                    entities=entities,
+                )
+
+        self._count(LUIS_TIER, prompt)
+        # The prompt only chooses the local tier: LUIS is asked once per turn.
+        recognizer_result = await TurnRecognitionCache.recognize(self._fallback, turn_context)
+        self._learn_cities(recognizer_result)
+        return recognizer_result
@@ -26,12 +26,143 @@ class DefaultConfig:
     LUIS_API_KEY = os.getenv("LuisAPIKey", "")
     # LUIS endpoint host name, ie "westus.api.cognitive.microsoft.com"
     LUIS_API_HOST_NAME = os.getenv("LuisAPIHostName", "")
+    # Cache of the LUIS results shared by the conversations. 0 to disable it.
+    LUIS_CACHE_SIZE = int(os.getenv("LuisCacheSize", 1000))
+    # Seconds a LUIS result stays in the cache.
+    LUIS_CACHE_TTL = float(os.getenv("LuisCacheTTL", 3600))
+    # Send the requests to LUIS through a pool of kept-alive connections.
+    LUIS_POOLED_TRANSPORT = os.getenv("LuisPooledTransport", "true").lower() == "true"
+    # Seconds allowed to one request to LUIS, and to a call with its retries.
+    LUIS_TIMEOUT = float(os.getenv("LuisTimeout", 2.0))
+    LUIS_DEADLINE = float(os.getenv("LuisDeadline", 4.0))
+    LUIS_MAX_RETRIES = int(os.getenv("LuisMaxRetries", 2))
+    LUIS_POOL_SIZE = int(os.getenv("LuisPoolSize", 20))
+    # Consecutive failures opening the circuit, and seconds before a new try.
+    LUIS_BREAKER_FAILURES = int(os.getenv("LuisBreakerFailures", 5))
+    LUIS_BREAKER_RESET = float(os.getenv("LuisBreakerReset", 30))
+    # Hedge the slow LUIS calls: a second request is sent when the first one
+    # is slower than the percentile of the recent latencies.
+    LUIS_HEDGE = os.getenv("LuisHedge", "false").lower() == "true"
+    LUIS_HEDGE_PERCENTILE = float(os.getenv("LuisHedgePercentile", 95))
+    # Maximum share of the LUIS calls that can be hedged.
+    LUIS_HEDGE_BUDGET = float(os.getenv("LuisHedgeBudget", 0.05))
+    # Optional endpoint of another region receiving the hedges.
+    LUIS_SECONDARY_API_HOST_NAME = os.getenv("LuisSecondaryAPIHostName", "")
+    LUIS_SECONDARY_API_KEY = os.getenv("LuisSecondaryAPIKey", "")
+    # Record the answers of LUIS in this file (JSON lines), to replay them
+    # with shared_code/load_testing/luis_replay_server.py. Empty: no record.
+    LUIS_RECORD_PATH = os.getenv("LuisRecordPath", "")
+    # Dialog specifying the journey: "waterfall" (Specifying_dialog) or
+    # "slot_filling" (Slot_filling_dialog, asks only for the missing slots).
+    DIALOG_MODE = os.getenv("DialogMode", "waterfall")
+    # States of the conversations and users kept in memory, 0 for no limit.
+    STATE_MAX_ENTRIES = int(os.getenv("StateMaxEntries", 10000))
+    # Seconds a state is kept without being used, 0 for no limit.
+    STATE_IDLE_TTL = float(os.getenv("StateIdleTTL", 3600))
+    # Storage of the states: "memory", or "sqlite" to share the
+    # conversations between the worker processes of the machine.
+    STATE_STORAGE = os.getenv("StateStorage", "memory")
+    STATE_SQLITE_PATH = os.getenv("StateSqlitePath", "bot_state.sqlite3")
+    # Seconds a write waits for the ones of other turns, to commit them together.
+    STATE_WRITE_BATCH_DELAY = float(os.getenv("StateWriteBatchDelay", 0))
+    # With StateStorage=sqlite, a turn holds its conversation in the SQLite
+    # file: seconds a lease lasts when its worker died, and seconds a turn
+    # waits for the lease before being refused with a 503.
+    CONVERSATION_LEASE_TTL = float(os.getenv("ConversationLeaseTTL", 30))
+    CONVERSATION_LEASE_WAIT = float(os.getenv("ConversationLeaseWait", 5))
+    # Last messages of a conversation kept in its state, for the logs.
+    UTTERANCE_LOG_SIZE = int(os.getenv("UtteranceLogSize", 20))
+    # Worker processes started by prefork.py, 0 for one per core.
+    WORKERS = int(os.getenv("BotWorkers", 0))
+    # Seconds a worker has to finish its turns when it is stopped.
+    DRAIN_TIMEOUT = float(os.getenv("BotDrainTimeout", 30))
+    # Turns running at once in a worker, the others wait their turn.
+    MAX_IN_FLIGHT_TURNS = int(os.getenv("MaxInFlightTurns", 64))
+    # Turns waiting, in all the conversations and in one, beyond which the
+    # new messages are refused with a 503 and a Retry-After of RetryAfter s.
+    MAX_QUEUED_TURNS = int(os.getenv("MaxQueuedTurns", 500))
+    MAX_QUEUED_TURNS_PER_CONVERSATION = int(os.getenv("MaxQueuedTurnsPerConversation", 10))
+    RETRY_AFTER = int(os.getenv("RetryAfter", 1))
+    # Seconds an activity id is remembered to ignore the retries of the
+    # channel, and number of ids remembered (in the SQLite file as well
+    # when StateStorage=sqlite, so the workers share them).
+    ACTIVITY_DEDUP_WINDOW = float(os.getenv("ActivityDedupWindow", 300))
+    ACTIVITY_DEDUP_MAX_ENTRIES = int(os.getenv("ActivityDedupMaxEntries", 10000))
+    # Model of the local recognizer, used when LUIS is not available.
+    LOCAL_MODEL_PATH = os.getenv(
+        "LocalModelPath", os.path.join("cognitiveModels", "local_model.npz")
+    )
+    # Confidence the local extractors need, per prompt, to answer without LUIS.
+    CASCADE_THRESHOLDS = os.getenv(
+        "CascadeThresholds",
+        "destination:0.5,origin:0.5,departure_date:0.8,return_date:0.8,budget:0.6",
+    )
+    # Confidence of a single unknown word given as a city.
+    CASCADE_UNKNOWN_CITY_CONFIDENCE = float(os.getenv("CascadeUnknownCityConfidence", 0.5))
+    # Maximum number of cities learnt from the answers of LUIS.
+    CASCADE_MAX_LEARNED_CITIES = int(os.getenv("CascadeMaxLearnedCities", 5000))
     APPINSIGHTS_INSTRUMENTATION_KEY = os.getenv(
         "AppInsightsInstrumentationKey", ""
     )
     APPINSIGHTS_INGESTION_END_POINT = os.getenv(
         "AppInsightsIngestionEndpoint", ""
     )
+    # Logs waiting to be written, beyond which the new ones are dropped.
+    LOG_QUEUE_CAPACITY = int(os.getenv("LogQueueCapacity", 10000))
+    # Logs written (and exported to Application Insights) per batch, and
+    # seconds a log waits for its batch.
+    LOG_BATCH_SIZE = int(os.getenv("LogBatchSize", 100))
+    LOG_FLUSH_INTERVAL = float(os.getenv("LogFlushInterval", 1.0))
+    LOG_EXPORT_INTERVAL = float(os.getenv("LogExportInterval", 15.0))
+    # File receiving the logs, empty for stdout.
+    LOG_FILE = os.getenv("LogFile", "")
+    # Where the traces of the turns go: "azure" (Application Insights, the
+    # default when its key is set), "none" (the default otherwise) or "file"
+    # (TraceFile, JSON lines, one file per worker, rotated beyond
+    # TraceFileMaxBytes keeping TraceFileBackups old files).
+    TRACE_EXPORTER = os.getenv(
+        "TraceExporter", "azure" if APPINSIGHTS_INSTRUMENTATION_KEY else "none"
+    )
+    TRACE_FILE = os.getenv("TraceFile", "traces.jsonl")
+    TRACE_FILE_MAX_BYTES = int(os.getenv("TraceFileMaxBytes", 10 * 1024 * 1024))
+    TRACE_FILE_BACKUPS = int(os.getenv("TraceFileBackups", 3))
+    # Traces kept per second; the failed turns and the turns slower than
+    # TraceSlowTurn seconds are always kept.
+    TRACE_SAMPLES_PER_SECOND = float(os.getenv("TraceSamplesPerSecond", 1.0))
+    TRACE_SLOW_TURN = float(os.getenv("TraceSlowTurn", 1.0))
+    # Profile the steps of the waterfalls (report on /api/stats/steps).
+    # Opt-in: measure how much each step grows the state of its dialog, by
+    # pickling the state before and after each step.
+    PROFILE_STEPS = os.getenv("ProfileSteps", "true").lower() == "true"
+    PROFILE_STEPS_STATE_SIZE = os.getenv("ProfileStepsStateSize", "false").lower() == "true"
+    # Write a capture (activity, dialog stack, spans, stacks sampled every
+    # SlowTurnSampleInterval s) of the turns slower than SlowTurnThreshold s
+    # in SlowTurnDirectory, at most SlowTurnCapturesPerMinute, keeping the
+    # SlowTurnMaxFiles most recent.
+    SLOW_TURN_CAPTURE = os.getenv("SlowTurnCapture", "false").lower() == "true"
+    SLOW_TURN_THRESHOLD = float(os.getenv("SlowTurnThreshold", 2.0))
+    SLOW_TURN_DIRECTORY = os.getenv("SlowTurnDirectory", "slow_turns")
+    SLOW_TURN_CAPTURES_PER_MINUTE = float(os.getenv("SlowTurnCapturesPerMinute", 2.0))
+    SLOW_TURN_MAX_FILES = int(os.getenv("SlowTurnMaxFiles", 50))
+    SLOW_TURN_SAMPLE_INTERVAL = float(os.getenv("SlowTurnSampleInterval", 0.01))
+    # Per channel, "merge" to hold the messages of a turn and send them merged
+    # at its end (one call to the connector instead of one per message), or
+    # "off". "*" is for the channels not listed, e.g. "webchat:merge". Off
+    # by default: enable it for a channel once its rendering of the merged
+    # messages is checked.
+    OUTBOUND_BATCHING = os.getenv("OutboundBatching", "")
+    # Connections kept alive per connector (service_url), and seconds an
+    # idle one is kept; seconds allowed to a request to a connector.
+    CONNECTOR_POOL_SIZE = int(os.getenv("ConnectorPoolSize", 100))
+    CONNECTOR_KEEPALIVE = float(os.getenv("ConnectorKeepalive", 30.0))
+    CONNECTOR_TIMEOUT = float(os.getenv("ConnectorTimeout", 30.0))
+    # The token of the bot is fetched again this many seconds before it expires.
+    APP_TOKEN_REFRESH_MARGIN = float(os.getenv("AppTokenRefreshMargin", 300.0))
+    # Authorization headers whose validation is kept until their token
+    # expires, 0 to validate each request; seconds the signing keys of the
+    # channels are used before being read again.
+    AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AuthTokenCacheSize", 10000))
+    OPENID_METADATA_TTL = float(os.getenv("OpenIdMetadataTTL", 86400.0))
     
 
     logger.info(f"Vu APP_ID= {APP_ID} et APPINSIGHTS...KEY= {APPINSIGHTS_INSTRUMENTATION_KEY}")
@@ -0,0 +1,251 @@
+"""Connector clients sharing kept-alive connections, and the app tokens they send.
+
+The ConnectorClient of the SDK sends its requests with the requests library,
+in the threads of the executor, and asks MSAL for the token of the bot at
+each request (MSAL may call AAD from the event loop). Here the clients of a
+service_url share one aiohttp session, so its connections are kept alive
+and bounded, and the token is cached until shortly before it expires, then
+fetched again in a thread.
+"""
+
+import asyncio
+import time
+from typing import Dict, Optional, Tuple
+
+import aiohttp
+import jwt
+from botbuilder.core.bot_framework_adapter import USER_AGENT
+from botframework.connector.aio import ConnectorClient
+from botframework.connector.auth import AppCredentials
+from botframework.connector.bot_framework_sdk_client_async import (
+    BotFrameworkConnectorConfiguration,
+)
+from msrest.pipeline import AsyncHTTPSender, AsyncPipeline, Request, Response
+from msrest.pipeline.universal import RawDeserializer
+from msrest.universal_http.aiohttp import AioHttpClientResponse
+
+
+class AppTokenCache:
+    """The tokens of the bot, per app id and scope, until they expire.
+
+    A token is reused until refresh_margin seconds before its expiry, read
+    from its exp claim. A new one is fetched in a thread, once for all the
+    requests waiting for it.
+    """
+
+    def __init__(self, refresh_margin: float = 300.0, default_lifetime: float = 3600.0):
+        """Init the class.
+
+        Args:
+            refresh_margin (float, optional): seconds before the expiry at
+                which a token is fetched again. Defaults to 300.0.
+            default_lifetime (float, optional): lifetime of a token without
+                exp claim. Defaults to 3600.0.
+        """
+        self.refresh_margin = refresh_margin
+        self.default_lifetime = default_lifetime
+        self._tokens: Dict[Tuple[str, str], Tuple[str, float]] = {}
+        self._locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _expiry(self, token: str) -> float:
+        """Return the expiry of a token, from its exp claim."""
+        try:
+            claims = jwt.decode(token, options={"verify_signature": False})
+            return float(claims["exp"])
+        except (jwt.InvalidTokenError, KeyError, TypeError, ValueError):
+            return time.time() + self.default_lifetime
+
+    def _cached(self, key: Tuple[str, str]) -> Optional[str]:
+        token_and_expiry = self._tokens.get(key)
+        if token_and_expiry and token_and_expiry[1] - self.refresh_margin > time.time():
+            return token_and_expiry[0]
+        return None
+
+    async def get(self, credentials: AppCredentials) -> Optional[str]:
+        """Return the token of credentials, None when it sends none.
+
+        Args:
+            credentials (AppCredentials): the credentials of the bot.
+
+        Returns:
+            Optional[str]: the access token.
+        """
+        if not credentials._should_authorize(None):  # pylint: disable=protected-access
+            return None
+        key = (credentials.microsoft_app_id, credentials.oauth_scope or "")
+        token = self._cached(key)
+        if token is not None:
+            self.hits += 1
+            return token
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            token = self._cached(key)
+            if token is not None:
+                self.hits += 1
+                return token
+            self.misses += 1
+            token = await asyncio.get_running_loop().run_in_executor(
+                None, credentials.get_access_token
+            )
+            self._tokens[key] = (token, self._expiry(token))
+            return token
+
+    def stats(self) -> Dict[str, int]:
+        """Return the counters of the cache.
+
+        Returns:
+            Dict[str, int]: tokens cached, hits and misses.
+        """
+        return {"tokens": len(self._tokens), "hits": self.hits, "misses": self.misses}
+
+
+class _Service_pool:
+    """The session of a service_url and its counters."""
+
+    __slots__ = ("session", "requests", "in_flight", "max_in_flight")
+
+    def __init__(self, session: aiohttp.ClientSession):
+        self.session = session
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+
+class _Pooled_sender(AsyncHTTPSender):
+    """Last element of the pipeline of a client: signs and sends the request."""
+
+    def __init__(self, pool: "ConnectorClientPool", service_url: str, credentials: AppCredentials):
+        self._pool = pool
+        self._service_url = service_url
+        self._credentials = credentials
+
+    async def __aexit__(self, *exc_details):
+        # The session belongs to the pool.
+        return None
+
+    async def send(self, request: Request, **config) -> Response:
+        http_request = request.http_request
+        headers = dict(http_request.headers)
+        token = await self._pool.tokens.get(self._credentials)
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        service = self._pool.service(self._service_url)
+        service.requests += 1
+        service.in_flight += 1
+        service.max_in_flight = max(service.max_in_flight, service.in_flight)
+        try:
+            aiohttp_response = await service.session.request(
+                http_request.method, http_request.url, headers=headers, data=http_request.data
+            )
+            response = AioHttpClientResponse(http_request, aiohttp_response)
+            await response.load_body()
+        finally:
+            service.in_flight -= 1
+        return Response(request, response)
+
+
+class ConnectorClientPool:
+    """ConnectorClients per service_url, sharing its kept-alive connections."""
+
+    def __init__(
+        self,
+        tokens: AppTokenCache,
+        connections_per_service: int = 100,
+        keepalive: float = 30.0,
+        timeout: float = 30.0,
+    ):
+        """Init the class.
+
+        Args:
+            tokens (AppTokenCache): the tokens of the bot.
+            connections_per_service (int, optional): connections open at most
+                to a service_url. Defaults to 100.
+            keepalive (float, optional): seconds an idle connection is kept.
+                Defaults to 30.0.
+            timeout (float, optional): seconds allowed to a request to the
+                connector. Defaults to 30.0.
+        """
+        self.tokens = tokens
+        self.connections_per_service = connections_per_service
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self._services: Dict[str, _Service_pool] = {}
+        self._clients: Dict[Tuple[str, str, str], ConnectorClient] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def service(self, service_url: str) -> _Service_pool:
+        """Return the session of a service_url, opened on first use."""
+        service = self._services.get(service_url)
+        if service is None or service.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.connections_per_service, keepalive_timeout=self.keepalive
+            )
+            session = aiohttp.ClientSession(
+                connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            service = self._services[service_url] = _Service_pool(session)
+        return service
+
+    def client(self, service_url: str, credentials: AppCredentials) -> ConnectorClient:
+        """Return the client of a service_url and credentials, created on first use.
+
+        Args:
+            service_url (str): the connector of the channel.
+            credentials (AppCredentials): the credentials of the bot.
+
+        Returns:
+            ConnectorClient: sending through the session of the service_url.
+        """
+        key = (service_url, credentials.microsoft_app_id or "", credentials.oauth_scope or "")
+        client = self._clients.get(key)
+        if client is not None:
+            self.hits += 1
+            return client
+        self.misses += 1
+
+        def pipeline(config: BotFrameworkConnectorConfiguration) -> AsyncPipeline:
+            return AsyncPipeline(
+                [config.user_agent_policy, RawDeserializer(), config.http_logger_policy],
+                _Pooled_sender(self, service_url, credentials),
+            )
+
+        config = BotFrameworkConnectorConfiguration(
+            credentials, service_url, pipeline_type=pipeline
+        )
+        client = ConnectorClient(credentials, custom_configuration=config)
+        client.config.add_user_agent(USER_AGENT)
+        self._clients[key] = client
+        return client
+
+    async def close(self) -> None:
+        """Close the sessions."""
+        for service in self._services.values():
+            await service.session.close()
+        self._services.clear()
+
+    def stats(self) -> Dict[str, object]:
+        """Return the counters of the pool.
+
+        Returns:
+            Dict[str, object]: clients, client cache hits and misses, the
+                app tokens, and per service_url the requests sent, running
+                and most running at once.
+        """
+        return {
+            "clients": len(self._clients),
+            "hits": self.hits,
+            "misses": self.misses,
+            "tokens": self.tokens.stats(),
+            "services": {
+                service_url: {
+                    "requests": service.requests,
+                    "in_flight": service.in_flight,
+                    "max_in_flight": service.max_in_flight,
+                    "limit": self.connections_per_service,
+                }
+                for service_url, service in self._services.items()
+            },
+        }
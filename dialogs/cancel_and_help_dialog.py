@@ -16,16 +16,7 @@ import os
 load_dotenv(dotenv_path= 'C:\\Users\\serge\\OneDrive\\Data Sciences\\Data Sciences - Ingenieur IA\\10e projet\\Deliverables')
 
 import logging
-from opencensus.ext.azure.log_exporter import AzureLogHandler
 logger = logging.getLogger(__name__)
-logger.addHandler(
-                    AzureLogHandler(
-                                    connection_string= "InstrumentationKey=" \
-                    + f"{os.getenv('AppInsightsInstrumentationKey', '')};"   \
-                    +                               "IngestionEndpoint="     \
-                    + f"{os.getenv('AppInsightsIngestionEndpoint', '')}"
-                    )
-)
 
 
 logger.setLevel(level= logging.INFO)
@@ -66,9 +57,9 @@ class CancelAndHelpDialog(ComponentDialog):
 
             if text in ("help", "?", "sos"):
                 # Log the request
-                dialogs = inner_dc.stack[-1].state['options'].log_utterances.utterance_list
-                dialogs.append(text)
-                properties["custom_dimensions"]['messages'] = "\t".join(dialogs)
+                log_utterances = inner_dc.stack[-1].state['options'].log_utterances
+                log_utterances.append(text)
+                properties["custom_dimensions"]['messages'] = log_utterances.text()
                 logger.info("Help", extra= properties)
                 await inner_dc.context.send_activity("I will ask you the questions, just answer or say 'Bye'")
                 return DialogTurnResult(DialogTurnStatus.Waiting)
@@ -13,6 +13,7 @@ from botbuilder.dialogs.prompts import (
     DateTimeResolution,
 )
 from .cancel_and_help_dialog import CancelAndHelpDialog
+from .traced_waterfall_dialog import TracedWaterfallDialog
 
 
 class DateResolverDialog(CancelAndHelpDialog):
@@ -33,7 +34,7 @@ class DateResolverDialog(CancelAndHelpDialog):
         )
         date_time_prompt.telemetry_client = telemetry_client
 
-        waterfall_dialog = WaterfallDialog(
+        waterfall_dialog = TracedWaterfallDialog(
             WaterfallDialog.__name__ + "2", [self.initial_step, self.starting_date_step, self.return_date_step, self.final_step]
         )
         waterfall_dialog.telemetry_client = telemetry_client
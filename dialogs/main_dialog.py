@@ -8,27 +8,13 @@ from dotenv import load_dotenv
 load_dotenv(dotenv_path= 'C:\\Users\\serge\\OneDrive\\Data Sciences\\Data Sciences - Ingenieur IA\\10e projet\\Deliverables')
 
 import logging
-from opencensus.ext.azure.log_exporter import AzureLogHandler
 logger = logging.getLogger(__name__)
-logger.addHandler(
-                    # AzureLogHandler(
-                    #                 connection_string= "InstrumentationKey=" \
-                    #     + f"{os.getenv('AppInsightsInstrumentationKey')}"
-                    # )
-                    AzureLogHandler(
-                                    connection_string= "InstrumentationKey=" \
-                        + f"{os.getenv('AppInsightsInstrumentationKey')};"  \
-                        +                               "IngestionEndpoint=" \
-                        + f"{os.getenv('AppInsightsIngestionEndpoint')}"
-                    )
-)
 logger.setLevel(level= logging.INFO)
 properties = {'custom_dimensions': {'module': 'main_dialog'}}
 
 
 from botbuilder.dialogs import (
     ComponentDialog,
-    WaterfallDialog,
     WaterfallStepContext,
     DialogTurnResult,
 )
@@ -45,7 +31,8 @@ from journey_details import Journey_details
 from journey_specifier_recognizer import Journey_specifier_recognizer
 from helpers.luis_helper import LuisHelper
 
-from .specifying_dialog import Specifying_dialog
+from .specifying_dialog import Journey_dialog
+from .traced_waterfall_dialog import TracedWaterfallDialog
 
 from shared_code.constants.luis_app import LUIS_APPS
 
@@ -54,7 +41,7 @@ class MainDialog(ComponentDialog):
     def __init__(
         self,
         luis_recognizer: Journey_specifier_recognizer,
-        specifying_dialog: Specifying_dialog,
+        specifying_dialog: Journey_dialog,
         telemetry_client: BotTelemetryClient = None,
     ):
         super(MainDialog, self).__init__(MainDialog.__name__)
@@ -66,7 +53,7 @@ class MainDialog(ComponentDialog):
         specifying_dialog.luis_recognizer = luis_recognizer
         specifying_dialog.telemetry_client = self.telemetry_client
 
-        wf_dialog = WaterfallDialog(
+        wf_dialog = TracedWaterfallDialog(
             "WFDialog", [self.intro_step, self.act_step, self.final_step]
         )
         wf_dialog.telemetry_client = self.telemetry_client
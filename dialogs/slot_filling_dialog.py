@@ -0,0 +1,288 @@
+"""Journey specification by slot filling.
+
+Specifying_dialog walks the steps in order and restarts from the first one
+each time an answer is not understood. Here a table of slots drives the
+dialog: each message may fill any slot, and only the first slot still
+missing (or ambiguous) is asked for.
+"""
+
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from datatypes_date_time.timex import Timex
+from recognizers_date_time import recognize_datetime
+
+from botbuilder.core import BotTelemetryClient, MessageFactory, NullTelemetryClient
+from botbuilder.dialogs import (
+    Dialog,
+    DialogContext,
+    DialogTurnResult,
+    WaterfallDialog,
+    WaterfallStepContext,
+)
+from botbuilder.schema import ActivityTypes, InputHints
+
+from dialogs.specifying_dialog import Journey_dialog, logger, properties
+from dialogs.traced_waterfall_dialog import TracedWaterfallDialog
+from helpers.luis_helper import LuisHelper
+from helpers.metrics_registry import STEP_OUTCOMES
+from journey_details import Journey_details
+
+
+@dataclass(frozen=True)
+class Slot:
+    """A piece of the journey to fill."""
+
+    name: str
+    prompt: str
+    question: str
+    retry: str
+    is_date: bool = False
+    is_place: bool = False
+
+
+# The slots in the order they are asked for.
+SLOTS: Tuple[Slot, ...] = (
+    Slot(
+        "destination",
+        "destination",
+        "To which city would you like to travel?",
+        "I do need to know where you want to go.",
+        is_place=True,
+    ),
+    Slot(
+        "origin",
+        "origin",
+        "From which city will you be travelling?",
+        "I need to know from which city you leave.",
+        is_place=True,
+    ),
+    Slot(
+        "departure_date",
+        "departure_date",
+        "When do you want to leave?",
+        "Please be more precise.",
+        is_date=True,
+    ),
+    Slot(
+        "return_date",
+        "return_date",
+        "When do you want to come back?",
+        "I need you to be more precise.",
+        is_date=True,
+    ),
+    Slot(
+        "max_budget",
+        "budget",
+        "Up to how much are you ready to spend?",
+        "I need an amount, e.g. 500 euros.",
+    ),
+)
+
+
+def missing_date_parts(timex: str) -> Optional[str]:
+    """Tell what a date lacks to be a definite day.
+
+    Args:
+        timex (str): the date as a TIMEX, e.g. "XXXX-06-05".
+
+    Returns:
+        Optional[str]: e.g. "the year", None when the date is a definite day.
+    """
+    if timex.startswith("("):
+        # A range, e.g. "(2023-06-01,2023-06-05,P4D)": one day is needed.
+        return "the day"
+    timex_property = Timex(timex.split("T")[0])
+    if "definite" in timex_property.types and "daterange" not in timex_property.types:
+        return None
+    parts = []
+    if timex_property.day_of_month is None:
+        parts.append("the day")
+    if timex_property.month is None:
+        parts.append("the month")
+    if timex_property.year is None:
+        parts.append("the year")
+    if len(parts) > 1:
+        return ", ".join(parts[:-1]) + " and " + parts[-1]
+    return parts[0] if parts else "the date"
+
+
+class Slot_filling_engine(Dialog):
+    """Fill the slots of a Journey_details, one message at a time.
+
+    The state of the dialog keeps the journey under "options", like a
+    waterfall, and the name of the slot asked for under "slot".
+    """
+
+    def __init__(self, dialog_id: str = None):
+        """Init the class.
+
+        Args:
+            dialog_id (str, optional): Defaults to Slot_filling_engine.
+        """
+        super(Slot_filling_engine, self).__init__(dialog_id or Slot_filling_engine.__name__)
+        self.luis_recognizer = None
+
+    @staticmethod
+    def is_missing(slot: Slot, journey_details: Journey_details) -> bool:
+        """Test if a slot still has to be asked for."""
+        value = getattr(journey_details, slot.name)
+        if value is None:
+            return True
+        return slot.is_date and missing_date_parts(value) is not None
+
+    async def begin_dialog(
+        self, dialog_context: DialogContext, options: object = None
+    ) -> DialogTurnResult:
+        """Ask for the first missing slot of the journey."""
+        journey_details = options if isinstance(options, Journey_details) else Journey_details()
+        # Handle the case of a single name for the city.
+        if journey_details.origin == journey_details.destination:
+            journey_details.origin = None
+        state = dialog_context.active_dialog.state
+        state["options"] = journey_details
+        state["slot"] = None
+        return await self.__ask_next(dialog_context)
+
+    async def continue_dialog(self, dialog_context: DialogContext) -> DialogTurnResult:
+        """Fill the slots with the answer and ask for the next missing one."""
+        if dialog_context.context.activity.type != ActivityTypes.message:
+            return Dialog.end_of_turn
+
+        state = dialog_context.active_dialog.state
+        journey_details: Journey_details = state["options"]
+        journey_details.log_utterances.append(dialog_context.context.activity.text)
+        journey_details.log_utterances.turn_number += 1
+
+        slot = next((slot for slot in SLOTS if slot.name == state["slot"]), None)
+        await self.__fill(dialog_context, journey_details, slot)
+        if slot is not None and self.is_missing(slot, journey_details):
+            STEP_OUTCOMES.inc(step=slot.prompt, outcome="not_understood")
+            await self.__retry(dialog_context, journey_details, slot)
+            return Dialog.end_of_turn
+        if slot is not None:
+            STEP_OUTCOMES.inc(step=slot.prompt, outcome="understood")
+        return await self.__ask_next(dialog_context)
+
+    async def reprompt_dialog(self, context, instance) -> None:
+        """Ask again for the current slot."""
+        slot = next((slot for slot in SLOTS if slot.name == instance.state["slot"]), None)
+        if slot is not None:
+            await context.send_activity(
+                MessageFactory.text(slot.question, slot.question, InputHints.expecting_input)
+            )
+
+    async def __fill(
+        self, dialog_context: DialogContext, journey_details: Journey_details, slot: Optional[Slot]
+    ) -> None:
+        """Take every slot the message gives, the one asked for first."""
+        intent, luis_result = await LuisHelper.execute_luis_query(
+            self.luis_recognizer,
+            dialog_context.context,
+            prompt=slot.prompt if slot is not None else None,
+        )
+        if isinstance(luis_result, Journey_details):
+            if slot is not None and slot.is_place and luis_result.origin == luis_result.destination:
+                # A single city answers the question asked.
+                other = "origin" if slot.name == "destination" else "destination"
+                setattr(luis_result, other, None)
+            for candidate in SLOTS:
+                value = getattr(luis_result, candidate.name)
+                if value is not None and (
+                    candidate is slot or self.is_missing(candidate, journey_details)
+                ):
+                    setattr(journey_details, candidate.name, value)
+
+        if slot is not None and slot.is_date and self.is_missing(slot, journey_details):
+            # Same local recognition as DateTimePrompt, no LUIS needed.
+            text = dialog_context.context.activity.text or ""
+            results = recognize_datetime(text, dialog_context.context.activity.locale or "English")
+            # A range or a week is not a day: the slot is asked again.
+            if results and results[0].type_name in ("datetimeV2.date", "datetimeV2.datetime"):
+                timex = results[0].resolution["values"][0].get("timex")
+                if timex:
+                    setattr(journey_details, slot.name, timex.split("T")[0])
+
+    async def __retry(
+        self, dialog_context: DialogContext, journey_details: Journey_details, slot: Slot
+    ) -> None:
+        """Ask again for a slot that was not understood."""
+        # Log issue
+        properties_not_understood = properties.copy()
+        properties_not_understood["custom_dimensions"]['prompt'] = slot.prompt
+        properties_not_understood["custom_dimensions"]['messages'] = journey_details.log_utterances.text()
+        logger.warning("Do Not understand", extra= properties_not_understood)
+
+        message = slot.retry
+        value = getattr(journey_details, slot.name)
+        if slot.is_date and value is not None:
+            message = f"Please be more precise. I miss {missing_date_parts(value)}. " \
+                + "You can use the format YYYY-MM-DD"
+        await dialog_context.context.send_activity(
+            MessageFactory.text(message, message, InputHints.expecting_input)
+        )
+
+    async def __ask_next(self, dialog_context: DialogContext) -> DialogTurnResult:
+        """Ask for the first missing slot, or end with the journey."""
+        state = dialog_context.active_dialog.state
+        journey_details: Journey_details = state["options"]
+        slot = next((slot for slot in SLOTS if self.is_missing(slot, journey_details)), None)
+        if slot is None:
+            return await dialog_context.end_dialog(journey_details)
+
+        state["slot"] = slot.name
+        await dialog_context.context.send_activity(
+            MessageFactory.text(slot.question, slot.question, InputHints.expecting_input)
+        )
+        return Dialog.end_of_turn
+
+
+class Slot_filling_dialog(Journey_dialog):
+    """Specify the journey by slot filling, then confirm it."""
+
+    def __init__(
+        self,
+        dialog_id: str = None,
+        telemetry_client: BotTelemetryClient = NullTelemetryClient()
+    ):
+        """Init the class.
+
+        Args:
+            dialog_id (str, optional): Defaults to None.
+            telemetry_client (BotTelemetryClient, optional): Insight. Defaults to NullTelemetryClient().
+        """
+        super(Slot_filling_dialog, self).__init__(
+            dialog_id or Slot_filling_dialog.__name__, telemetry_client
+        )
+        self._engine = Slot_filling_engine()
+
+        waterfall_dialog = TracedWaterfallDialog(
+            WaterfallDialog.__name__,
+            [self.fill_step, self.confirm_step, self.final_step],
+        )
+        waterfall_dialog.telemetry_client = telemetry_client
+
+        self.add_dialog(self._engine)
+        self.add_dialog(waterfall_dialog)
+
+        self.initial_dialog_id = WaterfallDialog.__name__
+
+    @property
+    def luis_recognizer(self):
+        """Return the recognizer used to decode the answers."""
+        return self._engine.luis_recognizer
+
+    @luis_recognizer.setter
+    def luis_recognizer(self, value) -> None:
+        """Set the recognizer, given by MainDialog."""
+        self._engine.luis_recognizer = value
+
+    async def fill_step(self, step_context: WaterfallStepContext) -> DialogTurnResult:
+        """Fill the missing slots."""
+        return await step_context.begin_dialog(self._engine.id, step_context.options)
+
+    async def confirm_step(self, step_context: WaterfallStepContext) -> DialogTurnResult:
+        """Confirm the journey filled by the engine."""
+        if isinstance(step_context.result, Journey_details):
+            step_context.options.merge(step_context.result, replace_when_exist= True)
+        return await super(Slot_filling_dialog, self).confirm_step(step_context)
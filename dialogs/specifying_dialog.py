@@ -14,16 +14,17 @@ from botbuilder.dialogs.prompts import (
                                         PromptValidatorContext,
 )
 from botbuilder.core import MessageFactory, BotTelemetryClient, NullTelemetryClient
-from opencensus import metrics
 from journey_details import Journey_details
 
 from shared_code.constants.luis_app import LUIS_APPS
 from dialogs.cancel_and_help_dialog import CancelAndHelpDialog
+from dialogs.traced_waterfall_dialog import TracedWaterfallDialog
 # from .date_resolver_dialog import DateResolverDialog
 from journey_specifier_recognizer import Journey_specifier_recognizer
 
 
 from helpers.luis_helper import LuisHelper
+from helpers.metrics_registry import STEP_OUTCOMES
 
 import os
 from dotenv import load_dotenv
@@ -31,105 +32,115 @@ from dotenv import load_dotenv
 # to the ".env"
 load_dotenv(dotenv_path= 'C:\\Users\\serge\\OneDrive\\Data Sciences\\Data Sciences - Ingenieur IA\\10e projet\\Deliverables')
 
-# Add metric https://docs.microsoft.com/en-us/azure/azure-monitor/app/opencensus-python
-from opencensus.ext.azure import metrics_exporter
-from opencensus.stats import aggregation as aggregation_module
-from opencensus.stats import measure as measure_module
-from opencensus.stats import stats as stats_module
-from opencensus.stats import view as view_module
-from opencensus.tags import tag_key as tag_key_module
-from opencensus.tags import tag_map as tag_map_module
-from opencensus.tags import tag_value as tag_value_module
-
-# Create the measures
-measure_not_validated = measure_module.MeasureInt(
-                                            name= "result_not_validated",
-                                            description= "Distribution des projets non validés.",
-                                            unit= "By"
-)
-measure_validated = measure_module.MeasureInt(
-                                        name= "result_validated",
-                                        description= "Distribution des projets validés.",
-                                        unit= "By"
-)
-measure_repeat_question = measure_module.MeasureInt(
-                                            name= "question_ask_twice",
-                                            description= "Distribution des questions répétées.",
-                                            unit= "By"
-)
-stats_recorder = stats_module.stats.stats_recorder
-
-# Create the tag key
-key_method = tag_key_module.TagKey(name= "method")
-# Create the status key
-key_status = tag_key_module.TagKey(name= "status") 
-# Create the error key
-key_error = tag_key_module.TagKey(name= "error")
-
-not_validated_view =  view_module.View(
-                                        name= "Not validated",
-                                        description= "Nombre de spécifications non validées",
-                                        columns= [key_method, key_status, key_error],
-                                        measure= measure_not_validated,
-                                        aggregation= aggregation_module.CountAggregation(count= 0)
-)
-validated_view =  view_module.View(
-                                    name= "Validated",
-                                    description= "Nombre de spécifications validées",
-                                    columns= [key_method, key_status, key_error],
-                                    measure= measure_validated,
-                                    aggregation= aggregation_module.CountAggregation(count= 0)
-)
-repeat_question_view =  view_module.View(
-                                        name= "Repeated questions",
-                                        description= "Nombre de questions répétées",
-                                        columns= [key_method, key_status, key_error],
-                                        measure= measure_repeat_question,
-                                        aggregation= aggregation_module.CountAggregation(count= 0)
-)
-
-stats = stats_module.stats
-view_manager = stats.view_manager
-view_manager.register_view(view= not_validated_view)
-view_manager.register_view(view= validated_view)
-view_manager.register_view(view= repeat_question_view)
-
-mmap = stats.stats_recorder.new_measurement_map()
-tmap = tag_map_module.TagMap()
-
-
-exporter = metrics_exporter.new_metrics_exporter(
-                                    connection_string= "InstrumentationKey=" \
-                        + f"{os.getenv('AppInsightsInstrumentationKey')};"  \
-                        +                               "IngestionEndpoint=" \
-                        + f"{os.getenv('AppInsightsIngestionEndpoint')}"
-)
-view_manager.register_exporter(exporter= exporter)
-# Register the view
 
 
 
 
 import logging
-from opencensus.ext.azure.log_exporter import AzureLogHandler
 logger = logging.getLogger(__name__)
-logger.addHandler(
-                    # AzureLogHandler(
-                    #                 connection_string= "InstrumentationKey=" \
-                    #     + f"{os.getenv('AppInsightsInstrumentationKey')}"
-                    # )
-                    AzureLogHandler(
-                                    connection_string= "InstrumentationKey=" \
-                        + f"{os.getenv('AppInsightsInstrumentationKey')};"  \
-                        +                               "IngestionEndpoint=" \
-                        + f"{os.getenv('AppInsightsIngestionEndpoint')}"
-                    )
-)
 logger.setLevel(level= logging.INFO)
 properties = {'custom_dimensions': {'module': 'specifying_dialog'}}
 
 
-class Specifying_dialog(CancelAndHelpDialog):
+class Journey_dialog(CancelAndHelpDialog):
+    """Base of the dialogs specifying the journey: its confirmation.
+
+    The subclasses add the dialogs filling the journey and a waterfall
+    ending with confirm_step and final_step.
+    """
+
+    def __init__(
+        self,
+        dialog_id: str,
+        telemetry_client: BotTelemetryClient = NullTelemetryClient()
+    ):
+        """Init the class.
+
+        Args:
+            dialog_id (str): id of the dialog.
+            telemetry_client (BotTelemetryClient, optional): Insight. Defaults to NullTelemetryClient().
+        """
+        super(Journey_dialog, self).__init__(dialog_id, telemetry_client)
+        self.telemetry_client = telemetry_client
+
+        self.add_dialog(ConfirmPrompt(ConfirmPrompt.__name__))
+
+    async def confirm_step(
+        self, step_context: WaterfallStepContext
+    ) -> DialogTurnResult:
+        """Confirm the information the user has provided."""
+        journey_details = step_context.options
+
+        # Decode the answer. A plain amount is decoded locally.
+        if journey_details.max_budget is None:
+            intent, luis_result = await LuisHelper.execute_luis_query(
+                self.luis_recognizer, step_context.context, prompt= "budget"
+            )
+            if not isinstance(luis_result, Journey_details):
+                luis_result = Journey_details()
+            result = luis_result.max_budget
+            if result is None:
+                journey_details.save_next_utterance = True
+                # Log issue
+                properties_not_understood = properties.copy()
+                properties_not_understood["custom_dimensions"]['prompt'] = "budget"
+                STEP_OUTCOMES.inc(step="budget", outcome="not_understood")
+                properties_not_understood["custom_dimensions"]['messages'] = journey_details.log_utterances.text()
+                logger.warning("Do Not understand", extra= properties_not_understood)
+                return await step_context.replace_dialog(
+                                        dialog_id= self.id,
+                                        options= journey_details
+                )
+            # If we are here, we consider that the origin point is legit
+            STEP_OUTCOMES.inc(step="budget", outcome="understood")
+            journey_details.max_budget = result
+
+        await step_context.context.send_activity(activity_or_text= "Please confirm the following:")
+        await step_context.context.send_activity(
+                                activity_or_text= f"You want to travel "
+                                        + f"to {journey_details.destination} "
+                                        + f"from {journey_details.origin}"
+        )
+        await step_context.context.send_activity(
+                                activity_or_text= f"You would leave on "
+                                        + f"{journey_details.departure_date}"
+                                        + f" and be back "
+                                        + f"for {journey_details.return_date}."
+        )
+        if 'units' in journey_details.max_budget:
+            msg = f"Your budget is {journey_details.max_budget['number']} "       \
+                                + f"{journey_details.max_budget['units']} top."
+        else:
+            msg = f"Your budget is {journey_details.max_budget['number']} euro."
+
+
+        # Offer a YES/NO prompt.
+        return await step_context.prompt(
+            ConfirmPrompt.__name__, PromptOptions(prompt=MessageFactory.text(msg))
+        )
+
+    async def final_step(self, step_context: WaterfallStepContext) -> DialogTurnResult:
+        """Complete the interaction and end the dialog."""
+        journey_details = step_context.options
+        if step_context.result:
+            STEP_OUTCOMES.inc(step="confirm", outcome="validated")
+            return await step_context.end_dialog(journey_details)
+
+        await step_context.context.send_activity(activity_or_text= "My appologies. I am still a trainee.")
+        properties_success = properties.copy()
+        properties_success['custom_dimensions']['success'] = False
+        logger.info("Success", extra= properties_success)
+        properties_not_validated = properties.copy()
+        properties_not_validated["custom_dimensions"]['messages'] = journey_details.log_utterances.text()
+        logger.warning("End specification with error", extra= properties_not_validated)
+
+        # Record the stats
+        STEP_OUTCOMES.inc(step="confirm", outcome="not_validated")
+
+        return await step_context.end_dialog()
+
+
+class Specifying_dialog(Journey_dialog):
     """Journey specification implementation."""
 
     def __init__(
@@ -146,7 +157,6 @@ class Specifying_dialog(CancelAndHelpDialog):
         super(Specifying_dialog, self).__init__(
             dialog_id or Specifying_dialog.__name__, telemetry_client
         )
-        self.telemetry_client = telemetry_client
 
         text_prompt = TextPrompt(TextPrompt.__name__)
         text_prompt.telemetry_client = telemetry_client
@@ -156,7 +166,7 @@ class Specifying_dialog(CancelAndHelpDialog):
         )
         date_time_prompt.telemetry_client = telemetry_client
 
-        waterfall_dialog = WaterfallDialog(
+        waterfall_dialog = TracedWaterfallDialog(
             WaterfallDialog.__name__,
             [
                 self.init_step,
@@ -173,7 +183,6 @@ class Specifying_dialog(CancelAndHelpDialog):
 
         self.add_dialog(text_prompt)
         self.add_dialog(date_time_prompt)
-        self.add_dialog(ConfirmPrompt(ConfirmPrompt.__name__))
         # self.add_dialog(
         #     DateResolverDialog(DateResolverDialog.__name__, self.telemetry_client)
         # )
@@ -187,7 +196,7 @@ class Specifying_dialog(CancelAndHelpDialog):
         journey_details = step_context.options
         if journey_details.save_next_utterance:
             utterance = step_context.context.activity.text
-            journey_details.log_utterances.utterance_list.append(utterance)
+            journey_details.log_utterances.append(utterance)
             journey_details.log_utterances.turn_number += 1
             journey_details.save_next_utterance = False
 
@@ -218,15 +227,17 @@ class Specifying_dialog(CancelAndHelpDialog):
         journey_details = step_context.options
         if journey_details.save_next_utterance:
             utterance = step_context.context.activity.text
-            journey_details.log_utterances.utterance_list.append(utterance)
+            journey_details.log_utterances.append(utterance)
             journey_details.log_utterances.turn_number += 1
             journey_details.save_next_utterance = False
 
         if journey_details.destination is None:
             # Ask Luis what it thinks about it.
             intent, luis_result = await LuisHelper.execute_luis_query(
-                self.luis_recognizer, step_context.context
+                self.luis_recognizer, step_context.context, prompt= "destination"
             )
+            if not isinstance(luis_result, Journey_details):
+                luis_result = Journey_details()
             if luis_result.origin == luis_result.destination:
                 luis_result.origin = None
             journey_details.merge(luis_result, replace_when_exist= False)
@@ -235,12 +246,14 @@ class Specifying_dialog(CancelAndHelpDialog):
                 # Log issue
                 properties_not_understood = properties.copy()
                 properties_not_understood["custom_dimensions"]['prompt'] = "destination"
-                properties_not_understood["custom_dimensions"]['messages'] = "\t".join(journey_details.log_utterances.utterance_list)
+                STEP_OUTCOMES.inc(step="destination", outcome="not_understood")
+                properties_not_understood["custom_dimensions"]['messages'] = journey_details.log_utterances.text()
                 logger.warning("Do Not understand", extra= properties_not_understood)
                 return await step_context.replace_dialog(
                                         dialog_id= Specifying_dialog.__name__,
                                         options= journey_details
                 )
+            STEP_OUTCOMES.inc(step="destination", outcome="understood")
 
         return await step_context.next(journey_details.destination)
 
@@ -249,40 +262,12 @@ class Specifying_dialog(CancelAndHelpDialog):
         journey_details = step_context.options
         if journey_details.save_next_utterance:
             utterance = step_context.context.activity.text
-            journey_details.log_utterances.utterance_list.append(utterance)
+            journey_details.log_utterances.append(utterance)
             journey_details.log_utterances.turn_number += 1
             journey_details.save_next_utterance = False
 
-        # Check the number of words to guess if it worth asking
-        # to decode the answer.
-        if len(step_context.result.split(" ")) > 1:
-        # Ask Luis what it thinks about it.
-            intent, luis_result = await LuisHelper.execute_luis_query(
-                self.luis_recognizer, step_context.context
-            )
-            if luis_result.origin == luis_result.destination:
-                luis_result.origin = None
-            journey_details.merge(luis_result, replace_when_exist= False)
-            result = luis_result.destination
-            if result is None:
-                journey_details.save_next_utterance = True
-                # Log issue
-                properties_not_understood = properties.copy()
-                properties_not_understood["custom_dimensions"]['prompt'] = "destination"
-                properties_not_understood["custom_dimensions"]['messages'] = "\t".join(journey_details.log_utterances.utterance_list)
-                logger.warning("Do Not understand", extra= properties_not_understood)
-                return await step_context.replace_dialog(
-                                        dialog_id= Specifying_dialog.__name__,
-                                        options= journey_details
-                )
-        else:
-            # define intent and luis_result without luis
-            intent = LUIS_APPS.INTENTS[LUIS_APPS.INTENT_SPECIFY_JOURNEY_NAME]
-            result = step_context.result
-
-        # Capture the response to the previous step's prompt
-        journey_details.destination = result
-        # Ask for the next
+        # The answer to the destination prompt was decoded by the previous
+        # step, which only goes on once the destination is known. Ask for the next.
         if journey_details.origin is None:
             journey_details.save_next_utterance = True
             return await step_context.prompt(
@@ -298,40 +283,41 @@ class Specifying_dialog(CancelAndHelpDialog):
         """Handle waterfall at origin is returned and departure date is checked."""
         # Handle the previous question...
         journey_details = step_context.options
+        # Only an answer to the origin prompt is decoded, not the message of
+        # a turn reaching this step through next() or replace_dialog().
+        origin_asked = journey_details.save_next_utterance and journey_details.origin is None
         if journey_details.save_next_utterance:
             utterance = step_context.context.activity.text
-            journey_details.log_utterances.utterance_list.append(utterance)
+            journey_details.log_utterances.append(utterance)
             journey_details.log_utterances.turn_number += 1
             journey_details.save_next_utterance = False
 
-        # Check the number of words to guess if it worth asking LUIS
-        # to decode the answer.
-        if len(step_context.result.split(" ")) > 1:
-        # Ask Luis what it thinks about it.
+        if origin_asked:
+            # Decode the answer. The recognizer answers the short ones locally
+            # and only asks LUIS when it is not confident enough.
             intent, luis_result = await LuisHelper.execute_luis_query(
-                self.luis_recognizer, step_context.context
+                self.luis_recognizer, step_context.context, prompt= "origin"
             )
+            if not isinstance(luis_result, Journey_details):
+                luis_result = Journey_details()
             if luis_result.destination == luis_result.origin:
                 luis_result.destination = None
-            journey_details.merge(luis_result, replace_when_exist= False)
-            result = luis_result.origin
-            if result is None:
+            if luis_result.origin is None:
                 journey_details.save_next_utterance = True
                 # Log issue
                 properties_not_understood = properties.copy()
                 properties_not_understood["custom_dimensions"]['prompt'] = "origin"
-                properties_not_understood["custom_dimensions"]['messages'] = "\t".join(journey_details.log_utterances.utterance_list)
+                STEP_OUTCOMES.inc(step="origin", outcome="not_understood")
+                properties_not_understood["custom_dimensions"]['messages'] = journey_details.log_utterances.text()
                 logger.warning("Do Not understand", extra= properties_not_understood)
                 return await step_context.replace_dialog(
                                         dialog_id= Specifying_dialog.__name__,
                                         options= journey_details
                 )
-        else:
-            # define intent and luis_result without luis
-            intent = LUIS_APPS.INTENTS[LUIS_APPS.INTENT_SPECIFY_JOURNEY_NAME]
-            result = step_context.result
-        # If we are here, we consider that the origin point is legit
-        journey_details.origin = result
+            # If we are here, we consider that the origin point is legit.
+            # Only the slots still missing are filled.
+            STEP_OUTCOMES.inc(step="origin", outcome="understood")
+            journey_details.merge(luis_result, replace_when_exist= False)
 
         # Check if we need to display the request for the date before going
         # down to the next step of the waterfall
@@ -356,7 +342,7 @@ class Specifying_dialog(CancelAndHelpDialog):
         journey_details = step_context.options
         if journey_details.save_next_utterance:
             utterance = step_context.context.activity.text
-            journey_details.log_utterances.utterance_list.append(utterance)
+            journey_details.log_utterances.append(utterance)
             journey_details.log_utterances.turn_number += 1
             journey_details.save_next_utterance = False
 
@@ -383,7 +369,7 @@ class Specifying_dialog(CancelAndHelpDialog):
         journey_details = step_context.options
         if journey_details.save_next_utterance:
             utterance = step_context.context.activity.text
-            journey_details.log_utterances.utterance_list.append(utterance)
+            journey_details.log_utterances.append(utterance)
             journey_details.log_utterances.turn_number += 1
             journey_details.save_next_utterance = False
 
@@ -401,101 +387,13 @@ class Specifying_dialog(CancelAndHelpDialog):
         return await step_context.next(journey_details.max_budget)
 
 
-    async def confirm_step(
-        self, step_context: WaterfallStepContext
-    ) -> DialogTurnResult:
-        """Confirm the information the user has provided."""
-        journey_details = step_context.options
-
-        # Check the number of words to guess if it worth asking LUIS
-        # to decode the answer.
-        if journey_details.max_budget is None:
-            if not step_context.result.replace('.', '').isdigit():
-                # Ask Luis what it thinks about it.
-                intent, luis_result = await LuisHelper.execute_luis_query(
-                    self.luis_recognizer, step_context.context
-                )
-                result = luis_result.max_budget
-                if result is None:
-                    journey_details.save_next_utterance = True
-                    # Log issue
-                    properties_not_understood = properties.copy()
-                    properties_not_understood["custom_dimensions"]['prompt'] = "budget"
-                    properties_not_understood["custom_dimensions"]['messages'] = "\t".join(journey_details.log_utterances.utterance_list)
-                    logger.warning("Do Not understand", extra= properties_not_understood)
-                    return await step_context.replace_dialog(
-                                            dialog_id= Specifying_dialog.__name__,
-                                            options= journey_details
-                    )
-            else:
-                # define intent and luis_result without luis
-                intent = LUIS_APPS.INTENTS[LUIS_APPS.INTENT_SPECIFY_JOURNEY_NAME]
-                result = step_context.result
-            # If we are here, we consider that the origin point is legit
-            journey_details.max_budget = result
-
-        await step_context.context.send_activity(activity_or_text= "Please confirm the following:")
-        await step_context.context.send_activity(
-                                activity_or_text= f"You want to travel "
-                                        + f"to {journey_details.destination} "
-                                        + f"from {journey_details.origin}"
-        )
-        await step_context.context.send_activity(
-                                activity_or_text= f"You would leave on "
-                                        + f"{journey_details.departure_date}"
-                                        + f" and be back "
-                                        + f"for {journey_details.return_date}."
-        )
-        if 'units' in journey_details.max_budget:
-            msg = f"Your budget is {journey_details.max_budget['number']} "       \
-                                + f"{journey_details.max_budget['units']} top."
-        else:
-            msg = f"Your budget is {journey_details.max_budget['number']} euro."
-
-
-        # Offer a YES/NO prompt.
-        return await step_context.prompt(
-            ConfirmPrompt.__name__, PromptOptions(prompt=MessageFactory.text(msg))
-        )
-
-    async def final_step(self, step_context: WaterfallStepContext) -> DialogTurnResult:
-        """Complete the interaction and end the dialog."""
-        journey_details = step_context.options
-        if step_context.result:
-            return await step_context.end_dialog(journey_details)
-
-        await step_context.context.send_activity(activity_or_text= "My appologies. I am still a trainee.")
-        properties_success = properties.copy()
-        properties_success['custom_dimensions']['success'] = False
-        logger.info("Success", extra= properties_success)
-        properties_not_validated = properties.copy()
-        properties_not_validated["custom_dimensions"]['messages'] = "\t".join(journey_details.log_utterances.utterance_list)
-        logger.warning("End specification with error", extra= properties_not_validated)
-
-        # Record the stats
-        mmap.measure_int_put(measure= measure_not_validated, value= 1)
-        tmap.insert(key= key_method, value= tag_value_module.TagValue("Success"))
-        tmap.insert(key= key_status, value= tag_value_module.TagValue("Ok"))
-        mmap.record(tmap)
-
-        # mmap.measure_int_put(
-        #                         measure= not_ok_measure,
-        #                         value= 1
-        # )
-        # mmap.record(tags= tmap)
-        # metrics = list(mmap.measure_to_view_map.get_metrics(datetime.utcnow()))
-        # print(metrics[0].time_series[0].points[0])
-
-        return await step_context.end_dialog()
-
-
-
     @staticmethod
     async def datetime_prompt_validator(prompt_context: PromptValidatorContext) -> bool:
         """Validate the date provided is in proper form."""
         if prompt_context.recognized.succeeded:
             timex = Timex(prompt_context.recognized.value[0].timex.split("T")[0])
             if "definite" in timex.types:
+                STEP_OUTCOMES.inc(step="date", outcome="understood")
                 return True
             msg = "Please be more precise. I miss "
             if timex.day_of_month is None:
@@ -513,6 +411,7 @@ class Specifying_dialog(CancelAndHelpDialog):
                 # Log issue
         properties_not_understood = properties.copy()
         properties_not_understood["custom_dimensions"]['prompt'] = "date"
+        STEP_OUTCOMES.inc(step="date", outcome="not_understood")
         properties_not_understood["custom_dimensions"]['messages'] = prompt_context.context.activity.text
         logger.warning("Do Not understand", extra= properties_not_understood)
 
@@ -0,0 +1,31 @@
+"""Waterfall dialog timing each of its steps."""
+
+from botbuilder.dialogs import DialogTurnResult, WaterfallDialog, WaterfallStepContext
+
+from helpers.step_profiler import PROFILER
+from helpers.tracing import span
+
+
+class TracedWaterfallDialog(WaterfallDialog):
+    """WaterfallDialog opening a span around each step of the turn traced.
+
+    Each step run is also recorded by the step profiler, with its LUIS calls
+    and the growth of the state of the dialog.
+    """
+
+    async def on_step(self, step_context: WaterfallStepContext) -> DialogTurnResult:
+        step = self._steps[step_context.index]
+        name = getattr(step, "__qualname__", str(step_context.index))
+        instance = step_context.active_dialog
+        started = PROFILER.start(instance.state)
+        completed = False
+        try:
+            with span("step", step=name):
+                result = await super(TracedWaterfallDialog, self).on_step(step_context)
+            # The last step ended (or replaced) the dialog: one more completion.
+            completed = step_context.index == len(self._steps) - 1 and all(
+                item is not instance for item in step_context.stack
+            )
+            return result
+        finally:
+            PROFILER.end(started, self.id, name, completed)
@@ -0,0 +1,192 @@
+"""Adaptive card templates, compiled once and rendered from a cache.
+
+A template is a card whose strings hold placeholders such as
+"${sentences.line_1}", filled from a data file. It is compiled into a
+substitution plan: where the placeholders are in the card and what fills
+them. The card rendered with its data file is kept with its Attachment,
+which is served as is until one of the files changes.
+"""
+
+import copy
+import json
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+from botbuilder.schema import Attachment
+
+ADAPTIVE_CARD_CONTENT_TYPE = "application/vnd.microsoft.card.adaptive"
+
+_PLACEHOLDER = re.compile(r"\$\{([^}]+)\}")
+
+# Location of a string in a card: the keys and indexes leading to it.
+Location = Tuple[Union[str, int], ...]
+# A string with placeholders: literal texts at the even indexes, data
+# paths at the odd ones.
+Segments = List[Union[str, Tuple[str, ...]]]
+
+
+def _compile(node: object, location: Location, plan: List[Tuple[Location, Segments]]) -> None:
+    """Add to plan the strings of node holding placeholders."""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            _compile(value, location + (key,), plan)
+    elif isinstance(node, list):
+        for index, value in enumerate(node):
+            _compile(value, location + (index,), plan)
+    elif isinstance(node, str) and "${" in node:
+        parts = _PLACEHOLDER.split(node)
+        if len(parts) > 1:
+            segments: Segments = [
+                tuple(part.split(".")) if index % 2 else part
+                for index, part in enumerate(parts)
+            ]
+            plan.append((location, segments))
+
+
+def _lookup(data: dict, path: Tuple[str, ...]) -> Optional[str]:
+    """Return the value of a dotted path in data, None when missing."""
+    value: object = data
+    for key in path:
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return str(value)
+
+
+class CardTemplate:
+    """A card template compiled into its substitution plan."""
+
+    def __init__(self, template: dict):
+        """Init the class.
+
+        Args:
+            template (dict): the card, with placeholders in its strings.
+        """
+        self.template = template
+        self.plan: List[Tuple[Location, Segments]] = []
+        _compile(template, (), self.plan)
+
+    def render(self, data: dict) -> dict:
+        """Return a new card, its placeholders filled from data.
+
+        The placeholders missing from data are left as they are.
+        """
+        card = copy.deepcopy(self.template)
+        for location, segments in self.plan:
+            text = "".join(
+                segment
+                if isinstance(segment, str)
+                else _lookup(data, segment) or "${%s}" % ".".join(segment)
+                for segment in segments
+            )
+            node = card
+            for key in location[:-1]:
+                node = node[key]
+            node[location[-1]] = text
+        return card
+
+
+class _Registered_card:
+    """A card of the engine: its files, template and rendered attachment."""
+
+    __slots__ = ("template_path", "data_path", "mtimes", "template", "attachment")
+
+    def __init__(self, template_path: str, data_path: Optional[str]):
+        self.template_path = template_path
+        self.data_path = data_path
+        self.mtimes: Tuple[float, ...] = ()
+        self.template: Optional[CardTemplate] = None
+        self.attachment: Optional[Attachment] = None
+
+
+class CardTemplateEngine:
+    """Cards compiled at registration and served from their cache.
+
+    The files of a card are checked at most every check_interval seconds;
+    when one changed, the card is compiled and rendered again.
+    """
+
+    def __init__(self, check_interval: float = 5.0):
+        """Init the class.
+
+        Args:
+            check_interval (float, optional): seconds between the checks of
+                the modification times of the files, 0 to check at each use.
+                Defaults to 5.0.
+        """
+        self.check_interval = check_interval
+        self._cards: Dict[str, _Registered_card] = {}
+        self._checked = 0.0
+        self.reloads = 0
+
+    def register(self, name: str, template_path: str, data_path: Optional[str] = None) -> None:
+        """Compile and render a card.
+
+        Args:
+            name (str): name of the card, e.g. "welcome".
+            template_path (str): the JSON file of the template.
+            data_path (Optional[str], optional): the JSON file of the data
+                filling the placeholders. Defaults to None.
+        """
+        card = _Registered_card(template_path, data_path)
+        self._load(card)
+        self._cards[name] = card
+
+    def _paths(self, card: _Registered_card) -> List[str]:
+        return [path for path in (card.template_path, card.data_path) if path]
+
+    def _load(self, card: _Registered_card) -> None:
+        """Read the files of a card, compile its template and render it.
+
+        The card is changed only once both files are read and parsed.
+        """
+        mtimes = tuple(os.stat(path).st_mtime for path in self._paths(card))
+        with open(card.template_path, encoding="utf-8") as card_file:
+            template = CardTemplate(json.load(card_file))
+        data = {}
+        if card.data_path:
+            with open(card.data_path, encoding="utf-8") as card_file:
+                data = json.load(card_file)
+        card.attachment = Attachment(
+            content_type=ADAPTIVE_CARD_CONTENT_TYPE, content=template.render(data)
+        )
+        card.template = template
+        card.mtimes = mtimes
+
+    def _reload_changed(self) -> None:
+        """Load again the cards whose files changed."""
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        for card in self._cards.values():
+            try:
+                mtimes = tuple(os.stat(path).st_mtime for path in self._paths(card))
+            except OSError:
+                # Being replaced: keep the card rendered until the next check.
+                continue
+            if mtimes != card.mtimes:
+                try:
+                    self._load(card)
+                except (OSError, ValueError):
+                    # Caught while being written: keep the card rendered
+                    # and load it at the next check.
+                    continue
+                self.reloads += 1
+
+    def attachment(self, name: str) -> Attachment:
+        """Return the attachment of a card, rendered with its data file.
+
+        The same Attachment is returned to every caller: it must not be
+        modified.
+
+        Args:
+            name (str): name given at registration.
+
+        Returns:
+            Attachment: the adaptive card.
+        """
+        self._reload_changed()
+        return self._cards[name].attachment
@@ -0,0 +1,289 @@
+"""One logging pipeline for the whole process.
+
+The loggers of the modules only hand their records to a bounded queue; a
+single thread writes them, in batches, to the local sink (stdout or a file)
+and to Application Insights through one AzureLogHandler. The turns never
+wait for a log to be written: when the queue is full, the record is dropped
+and counted.
+"""
+
+import atexit
+import copy
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler
+from typing import Dict, List, Optional
+
+# Loggers written to the local sink only, e.g. the texts of the users.
+LOCAL_ONLY_LOGGERS = ("messages",)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops the records when its queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        """Init the class.
+
+        Args:
+            log_queue (queue.Queue): the bounded queue read by the pipeline.
+        """
+        super(DroppingQueueHandler, self).__init__(log_queue)
+        self.dropped: Dict[str, int] = {}
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Freeze the message, keeping the exception for Application Insights."""
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """Queue the record, or drop it without waiting."""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped[record.levelname] = self.dropped.get(record.levelname, 0) + 1
+
+
+class BatchStreamHandler(logging.StreamHandler):
+    """StreamHandler writing its records once per batch."""
+
+    def __init__(self, stream=None):
+        """Init the class.
+
+        Args:
+            stream (optional): where to write. Defaults to sys.stderr.
+        """
+        super(BatchStreamHandler, self).__init__(stream)
+        self._lines: List[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self._lines.append(self.format(record) + self.terminator)
+        except Exception:  # pylint: disable=broad-except
+            self.handleError(record)
+
+    def flush(self) -> None:
+        """Write the batch."""
+        self.acquire()
+        try:
+            if self._lines and self.stream:
+                self.stream.write("".join(self._lines))
+                self._lines = []
+                super(BatchStreamHandler, self).flush()
+        finally:
+            self.release()
+
+
+class RotatingBatchFileHandler(BatchStreamHandler):
+    """BatchStreamHandler appending to a file, rotated beyond max_bytes.
+
+    The file is renamed path.1 (path.1 becomes path.2...), keeping at most
+    backup_count old files.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 3):
+        """Init the class.
+
+        Args:
+            path (str): the file written.
+            max_bytes (int, optional): size beyond which the file is rotated,
+                0 for no limit. Defaults to 10 MiB.
+            backup_count (int, optional): old files kept. Defaults to 3.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        super(RotatingBatchFileHandler, self).__init__(open(path, "a", encoding="utf-8"))
+
+    def _rotate(self) -> None:
+        """Start a new file, shifting the old ones."""
+        self.stream.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{index}"):
+                os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+            self.stream = open(self.path, "a", encoding="utf-8")
+        else:
+            self.stream = open(self.path, "w", encoding="utf-8")
+
+    def flush(self) -> None:
+        """Write the batch, in a new file when it would exceed max_bytes."""
+        self.acquire()
+        try:
+            if self._lines and self.stream and self.max_bytes > 0:
+                size = sum(len(line.encode("utf-8")) for line in self._lines)
+                if self.stream.tell() and self.stream.tell() + size > self.max_bytes:
+                    self._rotate()
+            super(RotatingBatchFileHandler, self).flush()
+        finally:
+            self.release()
+
+
+class LoggingPipeline:
+    """Bounded queue of records and the thread writing them.
+
+    The records are read by batches of batch_size, or what arrived within
+    flush_interval seconds, handed to the sinks and flushed once per batch.
+    """
+
+    def __init__(
+        self,
+        sinks: List[logging.Handler],
+        capacity: int = 10000,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+    ):
+        """Init the class.
+
+        Args:
+            sinks (List[logging.Handler]): handlers writing the records.
+            capacity (int, optional): records waiting, beyond which the new
+                ones are dropped. Defaults to 10000.
+            batch_size (int, optional): records written at once. Defaults to 100.
+            flush_interval (float, optional): seconds a record waits for a
+                batch to fill. Defaults to 1.0.
+        """
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: queue.Queue = queue.Queue(capacity)
+        self.handler = DroppingQueueHandler(self.queue)
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self.written = 0
+        self.batches = 0
+
+    def _next_batch(self) -> List[logging.LogRecord]:
+        """Wait for a record, then take the ones following it."""
+        try:
+            batch = [self.queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[logging.LogRecord]) -> None:
+        """Hand a batch to the sinks and write the local ones."""
+        for record in batch:
+            for sink in self.sinks:
+                if record.levelno >= sink.level:
+                    sink.handle(record)
+        for sink in self.sinks:
+            # AzureLogHandler batches on its own, its flush waits for the export.
+            if isinstance(sink, BatchStreamHandler):
+                sink.flush()
+        self.written += len(batch)
+        self.batches += 1
+
+    def _run(self) -> None:
+        """Write the batches until stopped, then what is left."""
+        while not self._stopping.is_set():
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._write(batch)
+
+    def start(self) -> "LoggingPipeline":
+        """Start the thread of the pipeline."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="logging_pipeline", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Write the records queued and stop the thread.
+
+        AzureLogHandler exports what it holds on exit by itself.
+        """
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, object]:
+        """Return the counters of the pipeline.
+
+        Returns:
+            Dict[str, object]: records queued, written and dropped (by
+                level), and batches written.
+        """
+        return {
+            "queued": self.queue.qsize(),
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": dict(self.handler.dropped),
+        }
+
+
+_PIPELINE: Optional[LoggingPipeline] = None
+
+
+def install_logging_pipeline(config) -> LoggingPipeline:
+    """Send the records of every logger of the process to one pipeline.
+
+    The handler is put on the root logger. Its level is left alone, so only
+    the loggers of the bot set to INFO, and the warnings of the others, are
+    written. Calling it again returns the pipeline already installed.
+
+    Args:
+        config (DefaultConfig): the configuration of the bot.
+
+    Returns:
+        LoggingPipeline: the pipeline, started.
+    """
+    global _PIPELINE
+    if _PIPELINE is not None:
+        return _PIPELINE
+
+    formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s")
+    if config.LOG_FILE:
+        local_sink = BatchStreamHandler(open(config.LOG_FILE, "a", encoding="utf-8"))
+    else:
+        local_sink = BatchStreamHandler(sys.stdout)
+    local_sink.setFormatter(formatter)
+    sinks: List[logging.Handler] = [local_sink]
+
+    if config.APPINSIGHTS_INSTRUMENTATION_KEY:
+        from opencensus.ext.azure.log_exporter import AzureLogHandler
+
+        azure_handler = AzureLogHandler(
+            connection_string="InstrumentationKey="
+            + f"{config.APPINSIGHTS_INSTRUMENTATION_KEY};"
+            + "IngestionEndpoint="
+            + f"{config.APPINSIGHTS_INGESTION_END_POINT}",
+            export_interval=config.LOG_EXPORT_INTERVAL,
+            max_batch_size=config.LOG_BATCH_SIZE,
+        )
+        azure_handler.addFilter(lambda record: record.name not in LOCAL_ONLY_LOGGERS)
+        sinks.append(azure_handler)
+
+    _PIPELINE = LoggingPipeline(
+        sinks,
+        capacity=config.LOG_QUEUE_CAPACITY,
+        batch_size=config.LOG_BATCH_SIZE,
+        flush_interval=config.LOG_FLUSH_INTERVAL,
+    ).start()
+    logging.getLogger().addHandler(_PIPELINE.handler)
+    logging.getLogger(LOCAL_ONLY_LOGGERS[0]).setLevel(logging.INFO)
+    atexit.register(_PIPELINE.stop)
+    return _PIPELINE
@@ -14,6 +14,8 @@ from botbuilder.ai.luis import LuisRecognizer
 from botbuilder.core import IntentScore, TopIntent, TurnContext
 
 from journey_details import Journey_details
+from helpers.metrics_registry import INTENTS
+from helpers.recognition_cache import EXPECTED_PROMPT_KEY, TurnRecognitionCache
 
 from shared_code.constants.luis_app import LUIS_APPS
 from datetime import datetime as dt
@@ -44,30 +46,44 @@ class LuisHelper:
 
     @staticmethod
     async def execute_luis_query(
-        luis_recognizer: LuisRecognizer, turn_context: TurnContext
+        luis_recognizer: LuisRecognizer, turn_context: TurnContext, prompt: str = None
     ) -> Tuple[LUIS_APPS, object]:
-        """Return an object with preformatted LUIS results for the bot's dialogs to consume."""
+        """Return an object with preformatted LUIS results for the bot's dialogs to consume.
+
+        Args:
+            luis_recognizer (LuisRecognizer): the recognizer to use.
+            turn_context (TurnContext): context of the turn.
+            prompt (str, optional): the prompt the message answers, e.g.
+                "destination" or "budget". Defaults to None.
+        """
         result = None
         intent = None
+        turn_context.turn_state[EXPECTED_PROMPT_KEY] = prompt
 
         try:
-            recognizer_result = await luis_recognizer.recognize(turn_context)
+            # The same message may be decoded by several steps in one turn.
+            recognizer_result = await TurnRecognitionCache.recognize(
+                luis_recognizer, turn_context
+            )
 
         except Exception as exception:
-            logger.info(f"Pb: {exception}")
-            print(exception)
+            logger.warning(f"Pb: {exception}")
+            # Nothing could be decoded: the dialogs ask the question again.
+            return None, None
 
 
         intent = (
                     sorted(
                             recognizer_result.intents,
-                            key=recognizer_result.intents.get,
+                            key=lambda name: recognizer_result.intents[name].score or 0,
                             reverse=True,
                     )[:1][0]
                     if recognizer_result.intents
                     else None
         )
 
+        INTENTS.inc(intent=intent or "None", prompt=prompt or "")
+
         # Check that Luis has found something with enough confidence.
         if recognizer_result.intents[intent].score < LUIS_APPS.THREESHOLD_FOR_VALID_INTENT:
             return None, recognizer_result.entities
@@ -0,0 +1,223 @@
+"""Metrics of the process, exposed in the Prometheus text format on /metrics.
+
+Recording a value is a dictionary lookup and an addition, cheap enough to
+stay on in production. The histograms of the durations are fed by the spans
+of helpers.tracing: the turn, the LUIS calls, the state load and save and
+the activities sent.
+"""
+
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+from helpers.tracing import observe_span
+
+# Upper bounds in seconds of the buckets of the durations.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: object) -> str:
+    """Escape a label value."""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    """Render the labels of a sample, e.g. {intent="Greetings"}."""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """A named metric, with a value per combination of its labels."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        """Init the class.
+
+        Args:
+            name (str): name of the metric, e.g. "bot_turns_total".
+            documentation (str): the HELP line.
+            labels (Tuple[str, ...], optional): names of the labels. Defaults to ().
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        """Return the values of the labels, in the order of their names."""
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def samples(self) -> List[str]:
+        """Return the lines of the samples."""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """Return the metric in the text format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """A value that only goes up."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        super(Counter, self).__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        """Add to the counter of the labels."""
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        """Return the counter of the labels."""
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_labels(self.label_names, key)} {value:g}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(Metric):
+    """A value read when the metrics are scraped."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], float]):
+        """Init the class.
+
+        Args:
+            name (str): name of the metric.
+            documentation (str): the HELP line.
+            function (Callable[[], float]): returns the current value.
+        """
+        super(Gauge, self).__init__(name, documentation)
+        self.function = function
+
+    def samples(self) -> List[str]:
+        return [f"{self.name} {self.function():g}"]
+
+
+class Histogram(Metric):
+    """Distribution of values, counted in cumulative buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DURATION_BUCKETS,
+    ):
+        """Init the class.
+
+        Args:
+            name (str): name of the metric, e.g. "bot_luis_seconds".
+            documentation (str): the HELP line.
+            labels (Tuple[str, ...], optional): names of the labels. Defaults to ().
+            buckets (Tuple[float, ...], optional): upper bounds of the
+                buckets. Defaults to DURATION_BUCKETS.
+        """
+        super(Histogram, self).__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per labels: count per bucket (the last one is +Inf), sum.
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        """Count a value."""
+        key = self._key(labels)
+        counts_and_sum = self._values.get(key)
+        if counts_and_sum is None:
+            counts_and_sum = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = counts_and_sum
+        counts[bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def count(self, **labels) -> int:
+        """Return the number of values counted for the labels."""
+        counts_and_sum = self._values.get(self._key(labels))
+        return sum(counts_and_sum[0]) if counts_and_sum else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulated = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulated += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                labels = _labels(self.label_names, key, 'le="%s"' % le)
+                lines.append(f"{self.name}_bucket{labels} {cumulated}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {total[0]:g}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {cumulated}")
+        return lines
+
+
+class MetricsRegistry:
+    """The metrics of the process."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """Add a metric, or return the one of the same name."""
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labels: Tuple[str, ...] = ()) -> Counter:
+        """Return the counter of this name, created on first use."""
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(
+        self, name: str, documentation: str, labels: Tuple[str, ...] = ()
+    ) -> Histogram:
+        """Return the histogram of this name, created on first use."""
+        return self.register(Histogram(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, function: Callable[[], float]) -> Gauge:
+        """Add a gauge read from function, replacing the one of the same name."""
+        gauge = Gauge(name, documentation, function)
+        self._metrics[name] = gauge
+        return gauge
+
+    def get(self, name: str) -> Optional[Metric]:
+        """Return a metric by its name."""
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Return all the metrics in the Prometheus text format."""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Durations, fed by the spans of the turns.
+TURN_SECONDS = REGISTRY.histogram("bot_turn_seconds", "Duration of the turns, end to end.")
+LUIS_SECONDS = REGISTRY.histogram("bot_luis_seconds", "Duration of the calls to LUIS.")
+STATE_SECONDS = REGISTRY.histogram(
+    "bot_state_seconds", "Duration of the load and save of the states.", ("operation",)
+)
+SEND_SECONDS = REGISTRY.histogram(
+    "bot_send_activity_seconds", "Duration of the sending of the activities."
+)
+observe_span("turn", TURN_SECONDS.observe)
+observe_span("luis", LUIS_SECONDS.observe)
+observe_span("state_load", lambda seconds: STATE_SECONDS.observe(seconds, operation="load"))
+observe_span("state_save", lambda seconds: STATE_SECONDS.observe(seconds, operation="save"))
+observe_span("send_activity", SEND_SECONDS.observe)
+
+# Outcomes.
+INTENTS = REGISTRY.counter(
+    "bot_intents_total", "Top intents of the messages decoded, per prompt.", ("intent", "prompt")
+)
+STEP_OUTCOMES = REGISTRY.counter(
+    "bot_step_outcomes_total",
+    "Answers understood or not per step of the specification, and its end.",
+    ("step", "outcome"),
+)
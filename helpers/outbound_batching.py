@@ -0,0 +1,102 @@
+"""Merge the messages a turn sends, to call the channel connector less.
+
+Each activity sent is one HTTP call to the connector of the channel. A step
+that sends three texts before its prompt costs four calls; merged, the
+texts and the prompt go in one message. Only the channels allowing it get
+merged messages.
+"""
+
+from typing import Dict, List
+
+from botbuilder.schema import Activity, ActivityTypes
+
+# Separator of the texts merged in one message (a new paragraph).
+TEXT_SEPARATOR = "\n\n"
+
+
+class OutboundBatchPolicy:
+    """Per channel, whether the messages of a turn are merged."""
+
+    def __init__(self, modes: Dict[str, str]):
+        """Init the class.
+
+        Args:
+            modes (Dict[str, str]): "merge" or "off" per channel id, "*" for
+                the channels not listed.
+        """
+        self.modes = modes
+
+    @classmethod
+    def from_setting(cls, setting: str) -> "OutboundBatchPolicy":
+        """Read a setting such as "*:merge,msteams:off".
+
+        Args:
+            setting (str): comma separated channel:mode, empty for off.
+
+        Returns:
+            OutboundBatchPolicy: the policy.
+        """
+        modes = {}
+        for item in setting.split(","):
+            channel, _, mode = item.strip().rpartition(":")
+            if mode:
+                modes[channel or "*"] = mode.strip().lower()
+        return cls(modes)
+
+    def merges(self, channel_id: str) -> bool:
+        """Tell if the messages sent on a channel are merged."""
+        return self.modes.get(channel_id, self.modes.get("*", "off")) == "merge"
+
+
+def _is_plain_text(activity: Activity) -> bool:
+    """Tell if an activity is a message with only a text."""
+    return (
+        activity.type == ActivityTypes.message
+        and bool(activity.text)
+        and not activity.attachments
+        and not activity.suggested_actions
+        and activity.value is None
+        and not activity.channel_data
+        and not activity.entities
+    )
+
+
+def _merge(texts: List[Activity], last: Activity) -> Activity:
+    """Put the texts in front of the last message, which keeps its hint."""
+    messages = texts + [last]
+    # The speech is built first, from the texts as they were sent.
+    if any(message.speak for message in messages):
+        last.speak = " ".join(message.speak or message.text or "" for message in messages)
+    last.text = TEXT_SEPARATOR.join(message.text for message in messages if message.text)
+    return last
+
+
+def merge_activities(activities: List[Activity]) -> List[Activity]:
+    """Merge the runs of plain texts with the message following them.
+
+    The order is kept: a run ends at the next message (e.g. a prompt with
+    its suggested actions), which receives the texts, or at any other
+    activity (typing, delay...), before which the run is sent as one text.
+
+    Args:
+        activities (List[Activity]): the activities of a turn, in order.
+
+    Returns:
+        List[Activity]: fewer activities, the merged ones modified.
+    """
+    merged: List[Activity] = []
+    texts: List[Activity] = []
+    for activity in activities:
+        if _is_plain_text(activity):
+            texts.append(activity)
+            continue
+        if texts and activity.type == ActivityTypes.message and activity.value is None:
+            merged.append(_merge(texts, activity))
+        else:
+            if texts:
+                merged.append(_merge(texts[:-1], texts[-1]))
+            merged.append(activity)
+        texts = []
+    if texts:
+        merged.append(_merge(texts[:-1], texts[-1]))
+    return merged
@@ -0,0 +1,264 @@
+"""Cache the recognition of the messages, per turn and between conversations."""
+
+import asyncio
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from botbuilder.core import Recognizer, RecognizerResult, TurnContext
+
+# Key of the turn state holding the prompt the message answers, if any.
+EXPECTED_PROMPT_KEY = "ExpectedPrompt"
+
+
+def normalize_utterance(text: str) -> str:
+    """Normalize an utterance so that trivial variations share a key.
+
+    Args:
+        text (str): the text of the message.
+
+    Returns:
+        str: the text lowered, stripped and with single spaces.
+    """
+    return " ".join((text or "").lower().split())
+
+
+class TurnRecognitionCache:
+    """Keep the recognizer results of the current turn in the turn state.
+
+    A message can go through several steps of the dialogs in the same turn
+    (e.g. act_step then origin_step). Each of them asks for the recognition
+    of the same text. Only the first one reaches the recognizer. The key
+    does not hold the prompt: the recognizers whose result depends on it set
+    caches_turn_recognition and cache their prompt-free tier themselves
+    (Cascading_recognizer caches its LUIS tier).
+    """
+
+    TURN_STATE_KEY = "TurnRecognitionCache"
+
+    hits: int = 0
+    misses: int = 0
+
+    @staticmethod
+    def key_for(turn_context: TurnContext) -> Tuple[str, str]:
+        """Build the key of the message of the turn.
+
+        Args:
+            turn_context (TurnContext): context of the turn.
+
+        Returns:
+            Tuple[str, str]: the activity id and the normalized text.
+        """
+        activity = turn_context.activity
+        return (activity.id or "", normalize_utterance(activity.text))
+
+    @classmethod
+    async def recognize(
+        cls, recognizer: Recognizer, turn_context: TurnContext
+    ) -> RecognizerResult:
+        """Return the result of the recognizer, asking it once per turn.
+
+        Args:
+            recognizer (Recognizer): recognizer to use on a miss.
+            turn_context (TurnContext): context of the turn.
+
+        Returns:
+            RecognizerResult: the result of the recognition.
+        """
+        if getattr(recognizer, "caches_turn_recognition", False):
+            return await recognizer.recognize(turn_context)
+
+        cache: Dict[Tuple[str, str], RecognizerResult] = turn_context.turn_state.get(
+            cls.TURN_STATE_KEY
+        )
+        if cache is None:
+            cache = {}
+            turn_context.turn_state[cls.TURN_STATE_KEY] = cache
+
+        key = cls.key_for(turn_context)
+        if key in cache:
+            cls.hits += 1
+            return cache[key]
+
+        cls.misses += 1
+        recognizer_result = await recognizer.recognize(turn_context)
+        cache[key] = recognizer_result
+        return recognizer_result
+
+    @classmethod
+    def stats(cls) -> Dict[str, int]:
+        """Return the counters of the cache.
+
+        Returns:
+            Dict[str, int]: hits and misses since the start.
+        """
+        return {"hits": cls.hits, "misses": cls.misses}
+
+
+class RecognitionLruCache:
+    """Share the recognizer results between conversations.
+
+    The entries are evicted when the cache is full (least recently used first)
+    or when they are older than the time to live. Utterances with a relative
+    date are not cached as their meaning depends on the day they are said.
+    """
+
+    RELATIVE_DATE_PATTERN = re.compile(
+        r"\b("
+        r"today|tonight|tomorrow|yesterday|now|weekend|"
+        r"next|last|this|coming|ago|"
+        r"monday|tuesday|wednesday|thursday|friday|saturday|sunday|"
+        r"in \d+ (?:day|week|month|year)s?"
+        r")\b"
+    )
+
+    def __init__(self, max_entries: int, time_to_live: float, fingerprint: str = ""):
+        """Init the class.
+
+        Args:
+            max_entries (int): maximum number of results kept.
+            time_to_live (float): seconds before a result is dropped.
+            fingerprint (str, optional): model identifier added to the keys,
+                so a new model never answers with the results of the old one.
+                Defaults to "".
+        """
+        self.max_entries = max_entries
+        self.time_to_live = time_to_live
+        self.fingerprint = fingerprint
+        self._entries: "OrderedDict[str, Tuple[float, RecognizerResult]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def is_cacheable(self, text: str) -> bool:
+        """Check that the meaning of the text does not depend on the date.
+
+        Args:
+            text (str): the text of the message.
+
+        Returns:
+            bool: True if the result can be shared.
+        """
+        return self.RELATIVE_DATE_PATTERN.search(normalize_utterance(text)) is None
+
+    def key_for(self, text: str) -> str:
+        """Build the key of a text.
+
+        Args:
+            text (str): the text of the message.
+
+        Returns:
+            str: the key in the cache.
+        """
+        return f"{self.fingerprint}|{normalize_utterance(text)}"
+
+    def get(self, text: str) -> Optional[RecognizerResult]:
+        """Return the result recorded for the text.
+
+        Args:
+            text (str): the text of the message.
+
+        Returns:
+            Optional[RecognizerResult]: the result, None if not in the cache.
+        """
+        key = self.key_for(text)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, recognizer_result = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return recognizer_result
+
+    def put(self, text: str, recognizer_result: RecognizerResult) -> None:
+        """Record the result for the text.
+
+        Args:
+            text (str): the text of the message.
+            recognizer_result (RecognizerResult): the result to share.
+        """
+        key = self.key_for(text)
+        self._entries[key] = (time.monotonic() + self.time_to_live, recognizer_result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Return the counters of the cache.
+
+        Returns:
+            Dict[str, int]: size, hits, misses, bypassed, evictions and expirations.
+        """
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class SingleFlight:
+    """Share one call between the concurrent requests for the same key.
+
+    When a message is already being recognized, the conversations sending the
+    same text wait for that call instead of starting their own.
+    """
+
+    def __init__(self):
+        """Init the class."""
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Run the call, unless one is already running for the key.
+
+        Args:
+            key (str): identifies the identical requests.
+            call (Callable[[], Awaitable[Any]]): starts the request.
+
+        Returns:
+            Any: the result of the call shared by every waiter.
+        """
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        self.calls += 1
+        future = asyncio.ensure_future(call())
+        self._in_flight[key] = future
+
+        def forget(done: asyncio.Future) -> None:
+            self._in_flight.pop(key, None)
+            if not done.cancelled():
+                # Mark the error as seen, the waiters get it anyway.
+                done.exception()
+
+        future.add_done_callback(forget)
+        # A waiter giving up must not cancel the call of the others.
+        return await asyncio.shield(future)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the counters of the coalescing.
+
+        Returns:
+            Dict[str, int]: calls made, calls coalesced and calls in flight.
+        """
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight),
+        }
@@ -0,0 +1,233 @@
+"""Capture the turns slower than their objective, to study them afterwards.
+
+While turns run, a thread samples the stack of the thread of the event loop
+every few milliseconds. When a turn ends beyond the threshold, a capture is
+written in a local directory, one JSON file per turn:
+- the activity received;
+- the dialog stack of the conversation at the end of the turn;
+- the spans of the turn so far (its async timeline);
+- the stacks sampled during the turn, folded as for a flame graph.
+
+The sampler sleeps when no turn runs, the captures are rate limited and the
+directory keeps only the most recent ones.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from botbuilder.core import BotState, TurnContext
+
+from helpers.tracing import RateLimitingSampler, current_trace
+
+logger = logging.getLogger(__name__)
+
+
+class StackSampler:
+    """Thread sampling the stack of another thread while it is busy."""
+
+    def __init__(self, interval: float = 0.01, max_samples: int = 10000, max_depth: int = 64):
+        """Init the class.
+
+        Args:
+            interval (float, optional): seconds between the samples.
+                Defaults to 0.01.
+            max_samples (int, optional): samples kept, the oldest are
+                forgotten first. Defaults to 10000.
+            max_depth (int, optional): frames kept per sample. Defaults to 64.
+        """
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples: Deque[Tuple[float, Tuple[str, ...]]] = deque(maxlen=max_samples)
+        self._target: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._busy = threading.Event()
+        self._active = 0
+
+    def _stack(self, frame) -> Tuple[str, ...]:
+        """Return the frames of a stack, the outermost first."""
+        frames = []
+        while frame is not None and len(frames) < self.max_depth:
+            code = frame.f_code
+            frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        return tuple(reversed(frames))
+
+    def _run(self) -> None:
+        """Sample the target while it is busy."""
+        while True:
+            self._busy.wait()
+            frame = sys._current_frames().get(self._target)  # pylint: disable=protected-access
+            if frame is not None:
+                self.samples.append((time.monotonic(), self._stack(frame)))
+            del frame
+            time.sleep(self.interval)
+
+    def enter(self) -> None:
+        """A turn starts in the calling thread: sample it."""
+        if self._thread is None:
+            self._target = threading.get_ident()
+            self._thread = threading.Thread(target=self._run, name="stack_sampler", daemon=True)
+            self._thread.start()
+        self._active += 1
+        self._busy.set()
+
+    def leave(self) -> None:
+        """A turn ended: stop sampling when none is left."""
+        self._active -= 1
+        if self._active == 0:
+            self._busy.clear()
+
+    def folded(self, start: float, end: float, top: int = 50) -> Dict[str, int]:
+        """Return the stacks sampled between start and end, folded.
+
+        Args:
+            start (float): time.monotonic() of the beginning.
+            end (float): time.monotonic() of the end.
+            top (int, optional): stacks returned, the most sampled. Defaults to 50.
+
+        Returns:
+            Dict[str, int]: samples per stack, its frames joined by ";".
+        """
+        stacks = Counter(
+            ";".join(stack) for sampled, stack in list(self.samples) if start <= sampled <= end
+        )
+        return dict(stacks.most_common(top))
+
+
+class SlowTurnCapture:
+    """Write a capture of the turns slower than threshold seconds."""
+
+    def __init__(
+        self,
+        conversation_state: BotState,
+        directory: str,
+        threshold: float = 2.0,
+        captures_per_minute: float = 2.0,
+        max_files: int = 50,
+        interval: float = 0.01,
+    ):
+        """Init the class.
+
+        Args:
+            conversation_state (BotState): holds the dialog stacks.
+            directory (str): where the captures are written.
+            threshold (float, optional): seconds beyond which a turn is
+                captured. Defaults to 2.0.
+            captures_per_minute (float, optional): captures written at most
+                per minute. Defaults to 2.0.
+            max_files (int, optional): captures kept in the directory, the
+                oldest are deleted. Defaults to 50.
+            interval (float, optional): seconds between the stack samples.
+                Defaults to 0.01.
+        """
+        self.conversation_state = conversation_state
+        self.directory = directory
+        self.threshold = threshold
+        self.max_files = max_files
+        self.sampler = StackSampler(interval)
+        self._limiter = RateLimitingSampler(captures_per_minute / 60)
+        self.slow_turns = 0
+        self.captured = 0
+        self.skipped = 0
+
+    def wrap(
+        self, on_turn: Callable[[TurnContext], Awaitable]
+    ) -> Callable[[TurnContext], Awaitable]:
+        """Return on_turn, capturing the slow turns.
+
+        Args:
+            on_turn (Callable[[TurnContext], Awaitable]): e.g. BOT.on_turn.
+
+        Returns:
+            Callable[[TurnContext], Awaitable]: to give to the adapter.
+        """
+
+        async def captured_on_turn(turn_context: TurnContext):
+            started = time.monotonic()
+            self.sampler.enter()
+            try:
+                return await on_turn(turn_context)
+            finally:
+                self.sampler.leave()
+                duration = time.monotonic() - started
+                if duration >= self.threshold:
+                    self._capture(turn_context, started, duration)
+
+        return captured_on_turn
+
+    def _dialog_stack(self, turn_context: TurnContext) -> List[Dict[str, object]]:
+        """Return the dialog stack of the conversation, the active dialog first."""
+        state = self.conversation_state.get(turn_context) or {}
+        dialog_state = state.get("DialogState")
+        stack = getattr(dialog_state, "dialog_stack", None) or []
+        return [
+            {
+                "id": instance.id,
+                "step": instance.state.get("stepIndex") if instance.state else None,
+                "state": repr(instance.state)[:2000],
+            }
+            for instance in stack
+        ]
+
+    def _capture(self, turn_context: TurnContext, started: float, duration: float) -> None:
+        """Gather the capture of a slow turn and write it in a thread."""
+        self.slow_turns += 1
+        if not self._limiter.should_sample():
+            self.skipped += 1
+            return
+        self.captured += 1
+        trace = current_trace()
+        try:
+            capture = {
+                "time": time.time(),
+                "duration_ms": round(1000 * duration, 3),
+                "pid": os.getpid(),
+                "activity": turn_context.activity.serialize(),
+                "dialog_stack": self._dialog_stack(turn_context),
+                "trace_id": trace.trace_id if trace else None,
+                "spans": [span.to_dict() for span in trace.spans] if trace else [],
+                "sample_interval_ms": 1000 * self.sampler.interval,
+                "stacks": self.sampler.folded(started, started + duration),
+            }
+        except Exception as error:  # pylint: disable=broad-except
+            logger.warning(f"Slow turn not captured: {error}")
+            return
+        asyncio.get_running_loop().run_in_executor(None, self._write, capture)
+
+    def _write(self, capture: Dict[str, object]) -> None:
+        """Write a capture and delete the oldest beyond max_files."""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            conversation = capture["activity"].get("conversation") or {}
+            name = "%s.%03d_%d_%s.json" % (
+                time.strftime("%Y%m%dT%H%M%S", time.gmtime(capture["time"])),
+                int(1000 * capture["time"]) % 1000,
+                capture["pid"],
+                re.sub(r"[^A-Za-z0-9_-]", "_", str(conversation.get("id", "")))[:40],
+            )
+            with open(os.path.join(self.directory, name), "w", encoding="utf-8") as file:
+                json.dump(capture, file, default=str)
+            files = sorted(
+                entry for entry in os.listdir(self.directory) if entry.endswith(".json")
+            )
+            for old in files[: max(0, len(files) - self.max_files)]:
+                os.remove(os.path.join(self.directory, old))
+        except OSError as error:
+            logger.warning(f"Slow turn not written: {error}")
+
+    def stats(self) -> Dict[str, int]:
+        """Return the counters of the captures.
+
+        Returns:
+            Dict[str, int]: slow turns, captures written and skipped by the
+                rate limit.
+        """
+        return {"slow_turns": self.slow_turns, "captured": self.captured, "skipped": self.skipped}
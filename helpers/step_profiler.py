@@ -0,0 +1,187 @@
+"""Profile of the steps of the waterfall dialogs.
+
+For each step, the profiler aggregates in memory the number of runs, their
+wall time, the LUIS calls they make and how much they grow the state of
+their dialog. With the number of times each dialog ends, it tells how many
+times a step runs per journey completed.
+
+A step often runs the next one (step_context.next, begin_dialog): the time
+and the state growth of the steps run within are taken out of its own.
+"""
+
+import pickle
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Deque, Dict, Optional
+
+from helpers.tracing import observe_span
+
+
+class _Step_run:
+    """Counters of a step running."""
+
+    __slots__ = ("state", "luis_calls", "inner_seconds", "inner_state_delta")
+
+    def __init__(self, state: object):
+        self.state = state
+        self.luis_calls = 0
+        # Time and state growth of the steps run within this one.
+        self.inner_seconds = 0.0
+        self.inner_state_delta = 0
+
+
+class _Step_profile:
+    """Aggregated runs of a step."""
+
+    __slots__ = ("runs", "seconds", "luis_calls", "state_delta", "durations")
+
+    def __init__(self, window: int):
+        self.runs = 0
+        self.seconds = 0.0
+        self.luis_calls = 0
+        self.state_delta = 0
+        self.durations: Deque[float] = deque(maxlen=window)
+
+
+# Step running in the current task.
+_RUN: ContextVar[Optional[_Step_run]] = ContextVar("step_run", default=None)
+
+
+def _state_size(state: object) -> int:
+    """Estimate the size of a state by the length of its pickle."""
+    try:
+        return len(pickle.dumps(state, pickle.HIGHEST_PROTOCOL))
+    except Exception:  # pylint: disable=broad-except
+        return 0
+
+
+class StepProfiler:
+    """Aggregate the runs of the steps, per dialog and step."""
+
+    def __init__(self, window: int = 1000, measure_state: bool = False):
+        """Init the class.
+
+        Args:
+            window (int, optional): durations kept per step for the
+                percentiles. Defaults to 1000.
+            measure_state (bool, optional): pickle the state of the dialog
+                before and after each step to measure its growth. Defaults
+                to False.
+        """
+        self.enabled = True
+        self.window = window
+        self.measure_state = measure_state
+        self._steps: Dict[str, Dict[str, _Step_profile]] = {}
+        self._completions: Dict[str, int] = {}
+
+    def _profile(self, dialog_id: str, step: str) -> _Step_profile:
+        """Return the profile of a step, created on first run."""
+        steps = self._steps.setdefault(dialog_id, {})
+        profile = steps.get(step)
+        if profile is None:
+            profile = steps[step] = _Step_profile(self.window)
+        return profile
+
+    def start(self, state: object) -> Optional[tuple]:
+        """Begin to profile a step.
+
+        Args:
+            state (object): the state of the dialog, mutated by the step.
+
+        Returns:
+            Optional[tuple]: what end needs, None when disabled.
+        """
+        if not self.enabled:
+            return None
+        run = _Step_run(state)
+        token = _RUN.set(run)
+        size = _state_size(state) if self.measure_state else 0
+        return run, token, size, time.perf_counter()
+
+    def end(self, started: Optional[tuple], dialog_id: str, step: str, completed: bool) -> None:
+        """Record a step run.
+
+        Args:
+            started (Optional[tuple]): what start returned.
+            dialog_id (str): the id of the dialog of the step.
+            step (str): the name of the step.
+            completed (bool): the step ended its dialog.
+        """
+        if started is None:
+            return
+        run, token, size, began = started
+        duration = time.perf_counter() - began
+        _RUN.reset(token)
+        state_delta = _state_size(run.state) - size if self.measure_state else 0
+        outer = _RUN.get()
+        if outer is not None:
+            outer.inner_seconds += duration
+            if outer.state is run.state:
+                outer.inner_state_delta += state_delta
+
+        profile = self._profile(dialog_id, step)
+        profile.runs += 1
+        profile.seconds += duration - run.inner_seconds
+        profile.durations.append(duration - run.inner_seconds)
+        profile.luis_calls += run.luis_calls
+        profile.state_delta += state_delta - run.inner_state_delta
+        if completed:
+            self._completions[dialog_id] = self._completions.get(dialog_id, 0) + 1
+
+    @staticmethod
+    def count_luis_call(_: float = 0.0) -> None:
+        """Count a LUIS call in the step running, if any."""
+        run = _RUN.get()
+        if run is not None:
+            run.luis_calls += 1
+
+    def report(self) -> Dict[str, object]:
+        """Return the profile of the steps, the slowest first per dialog.
+
+        Returns:
+            Dict[str, object]: per dialog, the times it completed and per
+                step its runs, runs per completion, total, mean and
+                percentile times in milliseconds (without the steps run
+                within), LUIS calls per run and mean growth of the state in
+                bytes (None unless measure_state).
+        """
+        dialogs = {}
+        for dialog_id, steps in self._steps.items():
+            completions = self._completions.get(dialog_id, 0)
+            rows = {}
+            for step, profile in sorted(
+                steps.items(), key=lambda item: item[1].seconds, reverse=True
+            ):
+                durations = sorted(profile.durations)
+
+                def percentile(value: float) -> float:
+                    index = min(len(durations) - 1, int(len(durations) * value / 100))
+                    return round(1000 * durations[index], 2)
+
+                rows[step] = {
+                    "runs": profile.runs,
+                    "runs_per_completion": (
+                        round(profile.runs / completions, 2) if completions else None
+                    ),
+                    "total_ms": round(1000 * profile.seconds, 2),
+                    "mean_ms": round(1000 * profile.seconds / profile.runs, 2),
+                    "p50_ms": percentile(50),
+                    "p95_ms": percentile(95),
+                    "max_ms": percentile(100),
+                    "luis_calls_per_run": round(profile.luis_calls / profile.runs, 2),
+                    "state_delta_bytes": (
+                        round(profile.state_delta / profile.runs, 1) if self.measure_state else None
+                    ),
+                }
+            dialogs[dialog_id] = {"completions": completions, "steps": rows}
+        return dialogs
+
+    def reset(self) -> None:
+        """Forget the runs recorded."""
+        self._steps.clear()
+        self._completions.clear()
+
+
+PROFILER = StepProfiler()
+observe_span("luis", StepProfiler.count_luis_call)
@@ -0,0 +1,358 @@
+"""Trace the turns: where does the time of a turn go?
+
+Each turn gets a root span and child spans for its parts (parsing, state,
+waterfall steps, LUIS calls, activities sent). The spans are kept in memory
+during the turn; at its end the trace is exported when it failed, when it
+was slow, or when the sampler keeps it. The sampler keeps a few traces per
+second, so the cost stays flat whatever the traffic.
+"""
+
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional
+
+from helpers.logging_pipeline import LoggingPipeline, RotatingBatchFileHandler
+
+
+class Span:
+    """A timed part of a turn."""
+
+    __slots__ = ("name", "span_id", "parent_id", "start", "duration", "attributes", "error")
+
+    def __init__(self, name: str, parent_id: Optional[str], attributes: Dict[str, object]):
+        """Init the class.
+
+        Args:
+            name (str): what is timed, e.g. "luis".
+            parent_id (Optional[str]): the span containing it.
+            attributes (Dict[str, object]): details of the span.
+        """
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start = time.time()
+        self.duration = 0.0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, object]:
+        """Return the span as JSON."""
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration_ms": round(1000 * self.duration, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class Trace:
+    """The spans of a turn."""
+
+    __slots__ = ("trace_id", "spans", "error")
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List[Span] = []
+        self.error = False
+
+
+# Trace of the current turn, and span of the code running.
+_TRACE: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+_SPAN: ContextVar[Optional[Span]] = ContextVar("span", default=None)
+
+# Functions receiving the duration of the spans, by name of span.
+_OBSERVERS: Dict[str, List[Callable[[float], None]]] = {}
+
+
+def observe_span(name: str, observer: Callable[[float], None]) -> None:
+    """Give the duration in seconds of every span of this name to observer.
+
+    Args:
+        name (str): name of the spans, e.g. "luis".
+        observer (Callable[[float], None]): e.g. the observe of a histogram.
+    """
+    _OBSERVERS.setdefault(name, []).append(observer)
+
+
+def current_trace() -> Optional[Trace]:
+    """Return the trace of the turn running, None outside of a turn."""
+    return _TRACE.get()
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """Time a part of the turn, as a child of the current span.
+
+    Outside of a traced turn, nothing is recorded.
+
+    Args:
+        name (str): what is timed.
+        attributes: details of the span, e.g. prompt="destination".
+
+    Yields:
+        Optional[Span]: the span, None outside of a turn.
+    """
+    trace = _TRACE.get()
+    if trace is None:
+        yield None
+        return
+    parent = _SPAN.get()
+    current = Span(name, parent.span_id if parent else None, attributes)
+    trace.spans.append(current)
+    token = _SPAN.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    except Exception as error:
+        # A cancelled task (e.g. the loser of a hedge) is not an error.
+        current.error = type(error).__name__
+        trace.error = True
+        raise
+    finally:
+        current.duration = time.perf_counter() - started
+        _SPAN.reset(token)
+        for observer in _OBSERVERS.get(name, ()):
+            observer(current.duration)
+
+
+class RateLimitingSampler:
+    """Keep at most traces_per_second traces per second.
+
+    When the traffic is low every trace is kept; when it grows the share
+    kept shrinks, as a token bucket refilled at traces_per_second.
+    """
+
+    def __init__(self, traces_per_second: float = 1.0):
+        """Init the class.
+
+        Args:
+            traces_per_second (float, optional): traces kept per second, 0
+                to keep only the errors and slow turns. Defaults to 1.0.
+        """
+        self.traces_per_second = traces_per_second
+        self._tokens = max(1.0, traces_per_second)
+        self._refilled = time.monotonic()
+
+    def should_sample(self) -> bool:
+        """Tell if the trace of a turn is kept."""
+        now = time.monotonic()
+        self._tokens = min(
+            max(1.0, self.traces_per_second),
+            self._tokens + (now - self._refilled) * self.traces_per_second,
+        )
+        self._refilled = now
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return True
+        return False
+
+
+class SpanExporter:
+    """Send the traces kept somewhere. This one drops them."""
+
+    def export(self, trace: Trace) -> None:
+        """Send a trace, without blocking the turn."""
+
+
+class FileSpanExporter(SpanExporter):
+    """Write the traces in a file, one JSON line per trace.
+
+    The lines go through a LoggingPipeline of their own, so the file is
+    written by batches from its thread.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        capacity: int = 1000,
+        flush_interval: float = 1.0,
+        max_bytes: int = 10 * 1024 * 1024,
+        backup_count: int = 3,
+    ):
+        """Init the class.
+
+        Args:
+            path (str): the file of the traces.
+            capacity (int, optional): traces waiting, beyond which the new
+                ones are dropped. Defaults to 1000.
+            flush_interval (float, optional): seconds between the writes.
+                Defaults to 1.0.
+            max_bytes (int, optional): size beyond which the file is
+                rotated. Defaults to 10 MiB.
+            backup_count (int, optional): rotated files kept. Defaults to 3.
+        """
+        sink = RotatingBatchFileHandler(path, max_bytes, backup_count)
+        sink.setFormatter(logging.Formatter("%(message)s"))
+        self._pipeline = LoggingPipeline(
+            [sink], capacity=capacity, flush_interval=flush_interval
+        ).start()
+
+    def export(self, trace: Trace) -> None:
+        line = json.dumps(
+            {"trace_id": trace.trace_id, "spans": [span.to_dict() for span in trace.spans]}
+        )
+        self._pipeline.handler.handle(
+            logging.makeLogRecord({"msg": line, "levelno": logging.INFO, "levelname": "INFO"})
+        )
+
+    def stop(self) -> None:
+        """Write the traces waiting."""
+        self._pipeline.stop()
+
+
+class AzureSpanExporter(SpanExporter):
+    """Send the traces to Application Insights, with the opencensus exporter."""
+
+    def __init__(self, connection_string: str):
+        """Init the class.
+
+        Args:
+            connection_string (str): of the Application Insights resource.
+        """
+        from opencensus.ext.azure.trace_exporter import AzureExporter
+
+        self._exporter = AzureExporter(connection_string=connection_string)
+
+    def export(self, trace: Trace) -> None:
+        from opencensus.trace.span_context import SpanContext
+        from opencensus.trace.span_data import SpanData
+        from opencensus.trace.status import Status
+
+        def timestamp(seconds: float) -> str:
+            fraction = ("%.6f" % (seconds % 1))[1:]
+            return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds)) + fraction + "Z"
+
+        context = SpanContext(trace_id=trace.trace_id)
+        self._exporter.export(
+            [
+                SpanData(
+                    name=span.name,
+                    context=context,
+                    span_id=span.span_id,
+                    parent_span_id=span.parent_id,
+                    attributes={key: str(value) for key, value in span.attributes.items()},
+                    start_time=timestamp(span.start),
+                    end_time=timestamp(span.start + span.duration),
+                    child_span_count=0,
+                    stack_trace=None,
+                    annotations=[],
+                    message_events=[],
+                    links=[],
+                    status=Status(2, span.error) if span.error else Status(0),
+                    same_process_as_parent_span=None,
+                    span_kind=1 if span.parent_id is None else 0,
+                )
+                for span in trace.spans
+            ]
+        )
+
+
+class TurnTracer:
+    """Trace the turns and export the ones worth it."""
+
+    def __init__(
+        self,
+        exporter: SpanExporter,
+        sampler: RateLimitingSampler,
+        slow_turn: float = 1.0,
+    ):
+        """Init the class.
+
+        Args:
+            exporter (SpanExporter): where the traces kept go.
+            sampler (RateLimitingSampler): keeps some of the other traces.
+            slow_turn (float, optional): seconds beyond which the trace of a
+                turn is always kept. Defaults to 1.0.
+        """
+        self.exporter = exporter
+        self.sampler = sampler
+        self.slow_turn = slow_turn
+        self.kept: Dict[str, int] = {"error": 0, "slow": 0, "sampled": 0}
+        self.dropped = 0
+
+    @contextmanager
+    def turn(self, name: str = "turn", **attributes) -> Iterator[Optional[Span]]:
+        """Trace a turn, with the spans opened within as its children.
+
+        Args:
+            name (str, optional): name of the root span. Defaults to "turn".
+            attributes: details of the root span.
+
+        Yields:
+            Optional[Span]: the root span.
+        """
+        trace = Trace()
+        token = _TRACE.set(trace)
+        try:
+            with span(name, **attributes) as root:
+                yield root
+        finally:
+            _TRACE.reset(token)
+            self._finish(trace)
+
+    def _finish(self, trace: Trace) -> None:
+        """Export the trace when it is worth it."""
+        if trace.error:
+            reason = "error"
+        elif trace.spans and trace.spans[0].duration >= self.slow_turn:
+            reason = "slow"
+        elif self.sampler.should_sample():
+            reason = "sampled"
+        else:
+            self.dropped += 1
+            return
+        self.kept[reason] += 1
+        trace.spans[0].attributes["kept"] = reason
+        self.exporter.export(trace)
+
+    def stats(self) -> Dict[str, object]:
+        """Return the counters of the tracer.
+
+        Returns:
+            Dict[str, object]: traces kept by reason and traces dropped.
+        """
+        return {"kept": dict(self.kept), "dropped": self.dropped}
+
+
+def create_turn_tracer(config) -> TurnTracer:
+    """Build the tracer set by the configuration.
+
+    Args:
+        config (DefaultConfig): the configuration of the bot.
+
+    Returns:
+        TurnTracer: with the exporter of TRACE_EXPORTER.
+    """
+    if config.TRACE_EXPORTER == "file":
+        path = config.TRACE_FILE
+        worker = os.getenv("BotWorkerIndex")
+        if worker is not None:
+            # One file per worker of prefork.py, each rotated on its own.
+            root, extension = os.path.splitext(path)
+            path = f"{root}.{worker}{extension}"
+        exporter: SpanExporter = FileSpanExporter(
+            path,
+            max_bytes=config.TRACE_FILE_MAX_BYTES,
+            backup_count=config.TRACE_FILE_BACKUPS,
+        )
+    elif config.TRACE_EXPORTER == "azure" and config.APPINSIGHTS_INSTRUMENTATION_KEY:
+        exporter = AzureSpanExporter(
+            "InstrumentationKey="
+            + f"{config.APPINSIGHTS_INSTRUMENTATION_KEY};"
+            + "IngestionEndpoint="
+            + f"{config.APPINSIGHTS_INGESTION_END_POINT}"
+        )
+    else:
+        exporter = SpanExporter()
+    return TurnTracer(
+        exporter,
+        RateLimitingSampler(config.TRACE_SAMPLES_PER_SECOND),
+        slow_turn=config.TRACE_SLOW_TURN,
+    )
@@ -1,15 +1,36 @@
-"""Handle the informations regarding the journey."""
-from botbuilder.core import ActivityHandler, TurnContext, StoreItem, MemoryStorage
+"""Handle the informations regarding the journey.
 
-class  UtteranceLog(StoreItem):
-    """Class for storing a log of utterances (text of messages) as a list."""
+Both classes are part of the dialog state, pickled by the storage at the end
+of every turn: their fields are slotted and they pickle as a versioned tuple,
+without the names of the fields. The states pickled with their former
+__dict__ are still read.
+"""
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+# Version of the tuples returned by __getstate__.
+STATE_VERSION = 1
+
+
+class  UtteranceLog:
+    """Class for storing a log of the last utterances (text of messages).
+
+    Only the last max_utterances are kept; the ones pushed out are counted
+    in overflow.
+    """
+
+    __slots__ = ("_utterances", "_turn_number", "overflow")
+
+    # Utterances kept per conversation, set from the configuration.
+    max_utterances = 20
+    # The log is never stored on its own, any version is overwritten.
+    e_tag = "*"
 
     def __init__(self):
         """Initialise the class."""
-        super(UtteranceLog, self).__init__()
-        self.utterance_list = []
+        self._utterances: Deque[str] = deque(maxlen=self.max_utterances)
         self._turn_number = 0
-        self.e_tag = "*"
+        self.overflow = 0
 
     @property
     def turn_number(self):
@@ -21,9 +42,53 @@ class  UtteranceLog(StoreItem):
         """Define the setter."""
         self._turn_number = value
 
+    @property
+    def utterance_list(self) -> List[str]:
+        """Return a copy of the utterances kept, the oldest first."""
+        return list(self._utterances)
+
+    def append(self, utterance: Optional[str]) -> None:
+        """Log an utterance, forgetting the oldest one when full."""
+        if len(self._utterances) == self._utterances.maxlen:
+            self.overflow += 1
+        self._utterances.append(utterance or "")
+
+    def text(self) -> str:
+        """Return the utterances kept joined by tabulations, for the logs.
+
+        When some were forgotten, their number comes first.
+        """
+        joined = "\t".join(self._utterances)
+        if self.overflow:
+            return f"[{self.overflow} earlier]\t{joined}"
+        return joined
+
+    def __getstate__(self) -> Tuple:
+        return (STATE_VERSION, self._turn_number, self.overflow, tuple(self._utterances))
+
+    def __setstate__(self, state) -> None:
+        if isinstance(state, dict):
+            # Pickled before the slots: {"utterance_list": [...], "_turn_number": n, ...}
+            state = (STATE_VERSION, state.get("_turn_number", 0), 0, state.get("utterance_list", ()))
+        _, self._turn_number, overflow, utterances = state
+        self._utterances = deque(maxlen=self.max_utterances)
+        self.overflow = overflow + max(0, len(utterances) - self.max_utterances)
+        self._utterances.extend(utterances)
+
 
 class Journey_details:
     """Handle the details for our journey."""
+
+    __slots__ = (
+        "destination",
+        "origin",
+        "departure_date",
+        "return_date",
+        "max_budget",
+        "log_utterances",
+        "save_next_utterance",
+    )
+
     def __init__(
         self,
         destination: str = None,
@@ -41,15 +106,59 @@ class Journey_details:
             departure_date (str, optional): date of departure. Defaults to None.
             return_date (str, optional): date to return home. Defaults to None.
             max_budget (float, optional): budget at max. Defaults to None.
+            log_utterances (UtteranceLog, optional): log of the messages.
+                Defaults to None, for an empty one.
         """
         self.destination = destination
         self.origin = origin
         self.departure_date = departure_date
         self.return_date = return_date
         self.max_budget = max_budget
-        self.log_utterances = UtteranceLog()
+        self.log_utterances = log_utterances if log_utterances is not None else UtteranceLog()
         self.save_next_utterance : bool = True
 
+    def __getstate__(self) -> Tuple:
+        # The log is inlined, so its class is not named in the pickle.
+        return (
+            STATE_VERSION,
+            self.destination,
+            self.origin,
+            self.departure_date,
+            self.return_date,
+            self.max_budget,
+            self.save_next_utterance,
+            self.log_utterances.__getstate__(),
+        )
+
+    def __setstate__(self, state) -> None:
+        if isinstance(state, dict):
+            # Pickled before the slots: the former __dict__.
+            state = (
+                STATE_VERSION,
+                state.get("destination"),
+                state.get("origin"),
+                state.get("departure_date"),
+                state.get("return_date"),
+                state.get("max_budget"),
+                state.get("save_next_utterance", True),
+                state.get("log_utterances") or UtteranceLog(),
+            )
+        (
+            _,
+            self.destination,
+            self.origin,
+            self.departure_date,
+            self.return_date,
+            self.max_budget,
+            self.save_next_utterance,
+            log_utterances,
+        ) = state
+        if not isinstance(log_utterances, UtteranceLog):
+            log_state = log_utterances
+            log_utterances = UtteranceLog.__new__(UtteranceLog)
+            log_utterances.__setstate__(log_state)
+        self.log_utterances = log_utterances
+
     def merge(self, value: object, replace_when_exist: bool = False) -> None:
         """Merge current value with another."""
         if (self.destination is None) or (replace_when_exist and value.destination is not None):
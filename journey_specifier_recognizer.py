@@ -2,7 +2,12 @@
 # Licensed under the MIT License.
 # Updated by Serge Neuman for P10 of OpenClassrooms
 
+import hashlib
+import logging
+
+from azure.cognitiveservices.language.luis.runtime.models import LuisResult
 from botbuilder.ai.luis import LuisApplication, LuisRecognizer, LuisPredictionOptions
+from botbuilder.ai.luis.luis_util import LuisUtil
 from botbuilder.core import (
                                 Recognizer,
                                 RecognizerResult,
@@ -12,6 +17,35 @@ from botbuilder.core import (
 )
 
 from config import DefaultConfig
+from helpers.recognition_cache import (
+    RecognitionLruCache,
+    SingleFlight,
+    normalize_utterance,
+)
+from helpers.tracing import span
+from luis_transport import (
+    CircuitBreaker,
+    LuisRecorder,
+    LuisTransport,
+    LuisUnavailableError,
+    RequestHedger,
+)
+from shared_code.constants.luis_app import LUIS_APPS
+
+logger = logging.getLogger(__name__)
+
+
+def luis_endpoint(host_name: str) -> str:
+    """Return the endpoint of LUIS from its host name.
+
+    Args:
+        host_name (str): e.g. "westus.api.cognitive.microsoft.com", or a full
+            URL such as "http://localhost:5050" for a local stand-in.
+
+    Returns:
+        str: the endpoint with its scheme.
+    """
+    return host_name if "://" in host_name else "https://" + host_name
 
 
 class Journey_specifier_recognizer(Recognizer):
@@ -22,15 +56,28 @@ class Journey_specifier_recognizer(Recognizer):
     """
     
     def __init__(
-        self, configuration: DefaultConfig, telemetry_client: BotTelemetryClient = None
+        self,
+        configuration: DefaultConfig,
+        telemetry_client: BotTelemetryClient = None,
+        fallback: Recognizer = None,
     ):
         """Init the class.
 
         Args:
             configuration (DefaultConfig): [description]
             telemetry_client (BotTelemetryClient, optional): [description]. Defaults to None.
+            fallback (Recognizer, optional): recognizer used when LUIS is not
+                available, e.g. the local one. Defaults to None.
         """
         self._recognizer = None
+        self._transport = None
+        self._hedge_transport = None
+        self._hedger = None
+        self._recorder = None
+        self._cache = None
+        self._single_flight = SingleFlight()
+        self._fallback = fallback
+        self.fallback_answers = 0
 
         luis_is_configured = (
             configuration.LUIS_APP_ID
@@ -43,7 +90,7 @@ class Journey_specifier_recognizer(Recognizer):
             luis_application = LuisApplication(
                 configuration.LUIS_APP_ID,
                 configuration.LUIS_API_KEY,
-                "https://" + configuration.LUIS_API_HOST_NAME,
+                luis_endpoint(configuration.LUIS_API_HOST_NAME),
             )
 
             options = LuisPredictionOptions()
@@ -53,6 +100,62 @@ class Journey_specifier_recognizer(Recognizer):
                 luis_application, prediction_options=options
             )
 
+            if configuration.LUIS_POOLED_TRANSPORT:
+                self._transport = LuisTransport(
+                    luis_application.endpoint,
+                    luis_application.application_id,
+                    luis_application.endpoint_key,
+                    timeout=configuration.LUIS_TIMEOUT,
+                    deadline=configuration.LUIS_DEADLINE,
+                    max_retries=configuration.LUIS_MAX_RETRIES,
+                    pool_size=configuration.LUIS_POOL_SIZE,
+                    breaker=CircuitBreaker(
+                        failure_threshold=configuration.LUIS_BREAKER_FAILURES,
+                        reset_timeout=configuration.LUIS_BREAKER_RESET,
+                    ),
+                    user_agent=LuisUtil.get_user_agent(),
+                )
+
+                if configuration.LUIS_RECORD_PATH:
+                    self._recorder = LuisRecorder(configuration.LUIS_RECORD_PATH)
+
+                if configuration.LUIS_HEDGE:
+                    self._hedger = RequestHedger(
+                        percentile=configuration.LUIS_HEDGE_PERCENTILE,
+                        budget=configuration.LUIS_HEDGE_BUDGET,
+                        default_delay=configuration.LUIS_TIMEOUT / 2,
+                        max_latency=configuration.LUIS_DEADLINE,
+                    )
+                    self._hedge_transport = self._transport
+                    if configuration.LUIS_SECONDARY_API_HOST_NAME:
+                        # Another region, with its own circuit breaker.
+                        self._hedge_transport = LuisTransport(
+                            luis_endpoint(configuration.LUIS_SECONDARY_API_HOST_NAME),
+                            luis_application.application_id,
+                            configuration.LUIS_SECONDARY_API_KEY
+                            or luis_application.endpoint_key,
+                            timeout=configuration.LUIS_TIMEOUT,
+                            deadline=configuration.LUIS_DEADLINE,
+                            max_retries=configuration.LUIS_MAX_RETRIES,
+                            pool_size=configuration.LUIS_POOL_SIZE,
+                            breaker=CircuitBreaker(
+                                failure_threshold=configuration.LUIS_BREAKER_FAILURES,
+                                reset_timeout=configuration.LUIS_BREAKER_RESET,
+                            ),
+                            user_agent=LuisUtil.get_user_agent(),
+                        )
+
+            if configuration.LUIS_CACHE_SIZE > 0:
+                # The results of an older model must never be served.
+                fingerprint = hashlib.sha1(
+                    f"{configuration.LUIS_APP_ID}:{LUIS_APPS.VERSION_ID}".encode()
+                ).hexdigest()[:12]
+                self._cache = RecognitionLruCache(
+                    max_entries=configuration.LUIS_CACHE_SIZE,
+                    time_to_live=configuration.LUIS_CACHE_TTL,
+                    fingerprint=fingerprint,
+                )
+
     @property
     def is_configured(self) -> bool:
         """Test if everything is ok.
@@ -62,6 +165,106 @@ class Journey_specifier_recognizer(Recognizer):
         """
         return self._recognizer is not None
 
+    @property
+    def cache_stats(self) -> dict:
+        """Return the statistics of the cache of the results.
+
+        Returns:
+            dict: the counters of the cache, empty when there is no cache.
+        """
+        return self._cache.stats() if self._cache is not None else {}
+
+    @property
+    def transport_stats(self) -> dict:
+        """Return the state of the connection to LUIS.
+
+        Returns:
+            dict: counters of the calls, circuit breaker state and answers of
+                the fallback. Empty without the pooled transport.
+        """
+        if self._transport is None:
+            return {}
+        return {**self._transport.stats(), "fallback_answers": self.fallback_answers}
+
+    @property
+    def hedge_stats(self) -> dict:
+        """Return the statistics of the hedged requests.
+
+        Returns:
+            dict: requests, hedges fired, won and denied, and the current
+                delay. Empty when the hedging is off.
+        """
+        return self._hedger.stats() if self._hedger is not None else {}
+
+    @property
+    def coalescing_stats(self) -> dict:
+        """Return the statistics of the coalescing of identical requests.
+
+        Returns:
+            dict: calls made to LUIS, calls coalesced and calls in flight.
+        """
+        return self._single_flight.stats()
+
+    async def close(self) -> None:
+        """Close the connections to LUIS."""
+        for transport in {self._transport, self._hedge_transport}:
+            if transport is not None:
+                await transport.close()
+
+    async def _recognize_once(self, turn_context: TurnContext) -> RecognizerResult:
+        """Ask LUIS, sharing the call with the identical requests in flight.
+
+        Args:
+            turn_context (TurnContext): context of the turn.
+
+        Returns:
+            RecognizerResult: the result of LUIS.
+        """
+        return await self._single_flight.do(
+            normalize_utterance(turn_context.activity.text),
+            lambda: self._call_luis(turn_context),
+        )
+
+    async def _call_luis(self, turn_context: TurnContext) -> RecognizerResult:
+        """Send the utterance to LUIS.
+
+        Args:
+            turn_context (TurnContext): context of the turn.
+
+        Returns:
+            RecognizerResult: the result of LUIS, as LuisRecognizer builds it.
+        """
+        utterance = turn_context.activity.text
+        if self._transport is None or not utterance or utterance.isspace():
+            with span("luis"):
+                return await self._recognizer.recognize(turn_context)
+
+        params = {"log": "true"}
+        with span("luis", hedged=self._hedger is not None):
+            if self._hedger is None:
+                luis_json = await self._transport.predict(utterance, params)
+            else:
+                luis_json = await self._hedger.run(
+                    lambda: self._transport.predict(utterance, params),
+                    # Only the first request is logged in the LUIS application.
+                    lambda: self._hedge_transport.predict(utterance, {"log": "false"}),
+                )
+        if self._recorder is not None:
+            self._recorder.record(utterance, luis_json)
+        luis_result = LuisResult.deserialize(luis_json)
+        recognizer_result = RecognizerResult(
+            text=utterance,
+            altered_text=luis_result.altered_query,
+            intents=LuisUtil.get_intents(luis_result),
+            entities=LuisUtil.extract_entities_and_metadata(
+                luis_result.entities, luis_result.composite_entities, True
+            ),
+        )
+        LuisUtil.add_properties(luis_result, recognizer_result)
+        # Log the telemetry as LuisRecognizer does.
+        self._recognizer.on_recognizer_result(recognizer_result, turn_context)
+        return recognizer_result
+
     async def recognize(self, turn_context: TurnContext) -> RecognizerResult:
         """Handle the response from user.
 
@@ -71,4 +274,23 @@ class Journey_specifier_recognizer(Recognizer):
         Returns:
             RecognizerResult: [description]
         """
-        return await self._recognizer.recognize(turn_context)
+        text = turn_context.activity.text
+        try:
+            if self._cache is None:
+                return await self._recognize_once(turn_context)
+            if not self._cache.is_cacheable(text):
+                self._cache.bypassed += 1
+                return await self._recognize_once(turn_context)
+
+            recognizer_result = self._cache.get(text)
+            if recognizer_result is None:
+                recognizer_result = await self._recognize_once(turn_context)
+                self._cache.put(text, recognizer_result)
+            return recognizer_result
+        except LuisUnavailableError as error:
+            if self._fallback is None:
+                raise
+            # Degraded path: answer without LUIS rather than fail the turn.
+            logger.warning(f"LUIS unavailable, using the fallback: {error}")
+            self.fallback_answers += 1
+            return await self._fallback.recognize(turn_context)
@@ -0,0 +1,422 @@
+"""Decode the messages locally, without LUIS.
+
+The model is trained from the Frames corpus by
+shared_code/local_model/local_model_trainer.py. It is made of:
+- a naive Bayes classifier of the intents on words and pairs of words,
+- a gazetteer of the cities found in Frames,
+- the lists of words that introduce an origin, a destination, a departure
+  and a return.
+The dates and the amounts are found with a small grammar. The results have
+the same shape as the ones of LUIS, so LuisHelper decodes both the same way.
+"""
+import os
+import re
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from botbuilder.core import IntentScore, Recognizer, RecognizerResult, TurnContext
+
+from config import DefaultConfig
+from shared_code.constants.luis_app import LUIS_APPS
+
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?|[$€£]")
+
+MONTHS: Dict[str, int] = {
+    "january": 1, "jan": 1, "february": 2, "feb": 2, "march": 3, "mar": 3,
+    "april": 4, "apr": 4, "may": 5, "june": 6, "jun": 6, "july": 7, "jul": 7,
+    "august": 8, "aug": 8, "september": 9, "sep": 9, "sept": 9,
+    "october": 10, "oct": 10, "november": 11, "nov": 11, "december": 12,
+    "dec": 12,
+}
+_MONTH = "(?P<month>" + "|".join(sorted(MONTHS, key=len, reverse=True)) + ")"
+_DAY = r"(?P<day>[0-3]?\d)(?:st|nd|rd|th)?"
+_YEAR = r"(?P<year>\d{4})"
+DATE_PATTERNS = [
+    re.compile(r"\b(?P<year>\d{4})-(?P<month>\d{1,2})-(?P<day>\d{1,2})\b"),
+    re.compile(r"\b(?P<month>\d{1,2})/(?P<day>\d{1,2})(?:/(?P<year>\d{4}))?\b"),
+    re.compile(r"\b" + _DAY + r"\s+(?:of\s+)?" + _MONTH + r"\b(?:,?\s+" + _YEAR + r")?"),
+    re.compile(r"\b" + _MONTH + r"\s+" + _DAY + r"\b(?:,?\s+" + _YEAR + r")?"),
+]
+RELATIVE_DAYS: Dict[str, int] = {"today": 0, "tonight": 0, "tomorrow": 1}
+
+MONEY_PATTERN = re.compile(
+    r"(?P<before>[$€£])?\s?"
+    r"(?P<number>\d+(?:,\d{3})*(?:\.\d+)?)\s?(?P<thousands>k\b)?\s?"
+    r"(?P<after>(?:usd|dollars?|bucks|euros?|eur|gbp|pounds?)\b|[$€£])?",
+    re.IGNORECASE,
+)
+MONEY_UNITS: Dict[str, str] = {
+    "$": "Dollar", "usd": "Dollar", "dollar": "Dollar", "dollars": "Dollar",
+    "bucks": "Dollar", "€": "Euro", "eur": "Euro", "euro": "Euro",
+    "euros": "Euro", "£": "British pound", "gbp": "British pound",
+    "pound": "British pound", "pounds": "British pound",
+}
+BUDGET_CUES = ["budget", "spend", "max", "maximum", "up to", "under", "less than", "no more than"]
+
+DEFAULT_CUES: Dict[str, List[str]] = {
+    "origin": ["from", "leaving", "departing", "out of"],
+    "destination": ["to", "for", "into", "visit", "going to", "destination"],
+    "start": ["from", "on", "leave", "leaving", "depart", "departing", "starting"],
+    "end": ["to", "until", "till", "return", "returning", "back", "coming back"],
+}
+
+# Score given to the journey intent when the message holds journey details.
+ENTITY_CONFIDENCE = 0.8
+
+
+def tokenize(text: str) -> List[str]:
+    """Split a text into lowered words.
+
+    Args:
+        text (str): the text to split.
+
+    Returns:
+        List[str]: the words.
+    """
+    return TOKEN_PATTERN.findall((text or "").lower())
+
+
+def features(tokens: List[str]) -> List[str]:
+    """Return the words and pairs of words used by the classifier.
+
+    Args:
+        tokens (List[str]): the words of the text.
+
+    Returns:
+        List[str]: the features of the text.
+    """
+    return tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+
+
+def _cue_pattern(cues: List[str]) -> re.Pattern:
+    """Compile a list of cues in a single pattern."""
+    alternatives = "|".join(re.escape(cue) for cue in sorted(cues, key=len, reverse=True))
+    return re.compile(r"\b(?:" + alternatives + r")\b")
+
+
+def _closest_cue(prefix: str, patterns: Dict[str, re.Pattern], window: int = 30) -> Optional[str]:
+    """Return the role whose cue is the closest before an entity.
+
+    Args:
+        prefix (str): the lowered text before the entity.
+        patterns (Dict[str, re.Pattern]): the pattern of the cues of each role.
+        window (int, optional): number of characters looked at. Defaults to 30.
+
+    Returns:
+        Optional[str]: the role, None if no cue is found.
+    """
+    prefix = prefix[-window:]
+    role, position = None, -1
+    for name, pattern in patterns.items():
+        for match in pattern.finditer(prefix):
+            if match.end() > position:
+                role, position = name, match.end()
+    return role
+
+
+BUDGET_CUES_PATTERN = _cue_pattern(BUDGET_CUES)
+
+
+def extract_dates(text: str, today: date = None) -> List[Tuple[int, int, str, str]]:
+    """Find the dates of a text.
+
+    The dates without a year are given as LUIS does, e.g. XXXX-06-05.
+
+    Args:
+        text (str): the text of the message.
+        today (date, optional): reference for "today" and "tomorrow". Defaults to None.
+
+    Returns:
+        List[Tuple[int, int, str, str]]: start, end, text and timex of each date.
+    """
+    lowered = (text or "").lower()
+    found = []
+    taken = set()
+    for pattern in DATE_PATTERNS:
+        for match in pattern.finditer(lowered):
+            if taken.intersection(range(match.start(), match.end())):
+                continue
+            month = match.group("month")
+            month = MONTHS[month] if month in MONTHS else int(month)
+            day = int(match.group("day"))
+            if not (1 <= month <= 12 and 1 <= day <= 31):
+                continue
+            year = match.group("year")
+            timex = f"{year or 'XXXX'}-{month:02d}-{day:02d}"
+            found.append((match.start(), match.end(), text[match.start():match.end()], timex))
+            taken.update(range(match.start(), match.end()))
+    for word, shift in RELATIVE_DAYS.items():
+        for match in re.finditer(r"\b" + word + r"\b", lowered):
+            when = (today or date.today()) + timedelta(days=shift)
+            found.append((match.start(), match.end(), text[match.start():match.end()], when.isoformat()))
+    return sorted(found)
+
+
+def extract_money(text: str, whole_text_is_amount: bool = False) -> List[Tuple[int, int, str, dict]]:
+    """Find the amounts of money of a text.
+
+    A number is an amount when it has a currency or follows a word about
+    the budget, or when the caller knows the text is an amount.
+
+    Args:
+        text (str): the text of the message.
+        whole_text_is_amount (bool, optional): accept a number alone. Defaults to False.
+
+    Returns:
+        List[Tuple[int, int, str, dict]]: start, end, text and value of each amount.
+    """
+    lowered = (text or "").lower()
+    found = []
+    for match in MONEY_PATTERN.finditer(lowered):
+        currency = match.group("before") or match.group("after")
+        number_end = match.end("thousands") if match.group("thousands") else match.end("number")
+        if lowered[number_end:number_end + 2] in ("st", "nd", "rd", "th"):
+            continue
+        if (
+            currency is None
+            and BUDGET_CUES_PATTERN.search(lowered[max(0, match.start() - 20):match.start()]) is None
+            and not (whole_text_is_amount and lowered.strip() == match.group(0).strip())
+        ):
+            continue
+        number = float(match.group("number").replace(",", ""))
+        if match.group("thousands"):
+            number *= 1000
+        value = {"number": number, "units": MONEY_UNITS.get(currency, "Euro")}
+        found.append((match.start(), match.end(), text[match.start():match.end()].strip(), value))
+    return found
+
+
+class Local_journey_model:
+    """The trained model: intent classifier, gazetteer and cue words."""
+
+    def __init__(
+        self,
+        intents: List[str],
+        vocabulary: List[str],
+        log_prior: np.ndarray,
+        log_likelihood: np.ndarray,
+        cities: List[str],
+        cues: Dict[str, List[str]] = None,
+    ):
+        """Init the class.
+
+        Args:
+            intents (List[str]): names of the intents.
+            vocabulary (List[str]): the features known by the classifier.
+            log_prior (np.ndarray): log of the probability of each intent.
+            log_likelihood (np.ndarray): log of the probability of each feature
+                for each intent, shape (intents, vocabulary).
+            cities (List[str]): the lowered names of the known cities.
+            cues (Dict[str, List[str]], optional): words introducing each role. Defaults to None.
+        """
+        self.intents = list(intents)
+        self.vocabulary = {feature: index for index, feature in enumerate(vocabulary)}
+        self.log_prior = log_prior
+        self.log_likelihood = log_likelihood
+        self.cities = set(cities)
+        self.longest_city = max((len(city.split()) for city in self.cities), default=1)
+        self.cues = {**DEFAULT_CUES, **(cues or {})}
+        self._place_patterns = {
+            "origin": _cue_pattern(self.cues["origin"]),
+            "destination": _cue_pattern(self.cues["destination"]),
+        }
+        self._date_patterns = {
+            "start": _cue_pattern(self.cues["start"]),
+            "end": _cue_pattern(self.cues["end"]),
+        }
+
+    def save(self, path: str) -> None:
+        """Save the model in a compressed numpy file.
+
+        Args:
+            path (str): where to save the model.
+        """
+        np.savez_compressed(
+            path,
+            intents=np.array(self.intents),
+            vocabulary=np.array(sorted(self.vocabulary, key=self.vocabulary.get)),
+            log_prior=self.log_prior.astype(np.float32),
+            log_likelihood=self.log_likelihood.astype(np.float32),
+            cities=np.array(sorted(self.cities)),
+            **{f"cues_{name}": np.array(values) for name, values in self.cues.items()},
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "Local_journey_model":
+        """Load a model saved by save.
+
+        Args:
+            path (str): the file of the model.
+
+        Returns:
+            Local_journey_model: the model.
+        """
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                intents=data["intents"].tolist(),
+                vocabulary=data["vocabulary"].tolist(),
+                log_prior=data["log_prior"],
+                log_likelihood=data["log_likelihood"],
+                cities=data["cities"].tolist(),
+                cues={
+                    key[len("cues_"):]: data[key].tolist()
+                    for key in data.files
+                    if key.startswith("cues_")
+                },
+            )
+
+    def predict_intents(self, tokens: List[str]) -> Dict[str, float]:
+        """Return the probability of each intent.
+
+        Args:
+            tokens (List[str]): the words of the text.
+
+        Returns:
+            Dict[str, float]: probability of each intent.
+        """
+        indexes = [
+            self.vocabulary[feature]
+            for feature in features(tokens)
+            if feature in self.vocabulary
+        ]
+        scores = self.log_prior + self.log_likelihood[:, indexes].sum(axis=1)
+        scores = np.exp(scores - scores.max())
+        scores /= scores.sum()
+        return dict(zip(self.intents, scores.tolist()))
+
+    def extract_cities(self, text: str) -> List[Tuple[int, int, str, Optional[str]]]:
+        """Find the known cities of a text, the longest names first.
+
+        Args:
+            text (str): the text of the message.
+
+        Returns:
+            List[Tuple[int, int, str, Optional[str]]]: start, end, text and
+                role ("origin", "destination" or None) of each city.
+        """
+        lowered = text.lower()
+        words = [(match.start(), match.end()) for match in re.finditer(r"[^\s,.!?;:]+", lowered)]
+        found = []
+        position = 0
+        while position < len(words):
+            for length in range(min(self.longest_city, len(words) - position), 0, -1):
+                start, end = words[position][0], words[position + length - 1][1]
+                if lowered[start:end] in self.cities:
+                    role = _closest_cue(lowered[:start], self._place_patterns)
+                    found.append((start, end, text[start:end], role))
+                    position += length
+                    break
+            else:
+                position += 1
+        return found
+
+    def date_role(self, text: str, start: int) -> Optional[str]:
+        """Return the role of a date ("start", "end" or None).
+
+        Args:
+            text (str): the text of the message.
+            start (int): where the date starts.
+
+        Returns:
+            Optional[str]: the role of the date.
+        """
+        return _closest_cue(text[:start].lower(), self._date_patterns)
+
+
+class Local_journey_recognizer(Recognizer):
+    """Decode the messages with the local model.
+
+    Args:
+        Recognizer (botbuilder.core.Recognizer): Recognizer
+    """
+
+    def __init__(self, configuration: DefaultConfig, model_path: str = None):
+        """Init the class.
+
+        Args:
+            configuration (DefaultConfig): configuration of the bot.
+            model_path (str, optional): file of the model. Defaults to configuration.LOCAL_MODEL_PATH.
+        """
+        self._model = None
+        path = model_path or configuration.LOCAL_MODEL_PATH
+        if path and os.path.isfile(path):
+            self._model = Local_journey_model.load(path)
+
+    @property
+    def is_configured(self) -> bool:
+        """Test if the model is loaded.
+
+        Returns:
+            bool: true if the model was found and loaded.
+        """
+        return self._model is not None
+
+    @property
+    def model(self) -> Local_journey_model:
+        """Return the model used."""
+        return self._model
+
+    def recognize_text(self, text: str) -> RecognizerResult:
+        """Decode a text.
+
+        Args:
+            text (str): the text of the message.
+
+        Returns:
+            RecognizerResult: intents and entities, named as LUIS does.
+        """
+        text = text or ""
+        entities: Dict[str, list] = {}
+
+        cities = self._model.extract_cities(text)
+        if cities:
+            entities["geographyV2_city"] = [city for _, _, city, _ in cities]
+        for role, entity in (("origin", "From place"), ("destination", "To place")):
+            values = [city for _, _, city, city_role in cities if city_role == role]
+            if values:
+                entities[LUIS_APPS.ENTITIES[f"{entity} name"].replace(" ", "_")] = values
+
+        dates = extract_dates(text)
+        if dates:
+            entities["datetime"] = [{"type": "date", "timex": [timex]} for _, _, _, timex in dates]
+        for role, entity in (("start", "From date"), ("end", "To date")):
+            values = [
+                date_text
+                for start, _, date_text, _ in dates
+                if self._model.date_role(text, start) == role
+            ]
+            if values:
+                entities[LUIS_APPS.ENTITIES[f"{entity} name"].replace(" ", "_")] = values
+
+        amounts = extract_money(text)
+        if amounts:
+            entities["money"] = [value for _, _, _, value in amounts]
+            entities[LUIS_APPS.ENTITIES["Max budget"].replace(" ", "_")] = [
+                amount_text for _, _, amount_text, _ in amounts
+            ]
+
+        scores = self._model.predict_intents(tokenize(text))
+        journey_intent = LUIS_APPS.INTENTS[LUIS_APPS.INTENT_SPECIFY_JOURNEY_NAME]
+        if entities and journey_intent in scores:
+            scores[journey_intent] = max(scores[journey_intent], ENTITY_CONFIDENCE)
+
+        return RecognizerResult(
+            text=text,
+            altered_text=None,
+            intents={name: IntentScore(score) for name, score in scores.items()},
+            entities=entities,
+        )
+
+    async def recognize(self, turn_context: TurnContext) -> RecognizerResult:
+        """Handle the response from user.
+
+        Args:
+            turn_context (TurnContext): context of the turn.
+
+        Returns:
+            RecognizerResult: intents and entities of the message.
+        """
+        return self.recognize_text(turn_context.activity.text)
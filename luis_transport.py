@@ -0,0 +1,492 @@
+"""Send the prediction requests to LUIS over a pool of kept-alive connections.
+
+The LuisRecognizer of the SDK creates a new HTTP client for every call and
+waits for it without any control on the time spent. The transport keeps one
+aiohttp session per process, gives each call a deadline, retries the
+transient errors with a jittered backoff and stops calling LUIS for a while
+when it keeps failing (circuit breaker). The slowest calls can be hedged: a
+second request is sent when the first one is late, and the first answer wins.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+import aiohttp
+
+from helpers.recognition_cache import normalize_utterance
+
+logger = logging.getLogger(__name__)
+
+
+class LuisUnavailableError(Exception):
+    """LUIS did not answer in time, failed, or the circuit is open."""
+
+
+class CircuitBreaker:
+    """Stop sending requests to a service that keeps failing.
+
+    closed    : the requests go through, the consecutive failures are counted.
+    open      : the requests fail fast until the reset timeout is over.
+    half_open : one request goes through to test the service.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """Init the class.
+
+        Args:
+            failure_threshold (int, optional): consecutive failures opening
+                the circuit. Defaults to 5.
+            reset_timeout (float, optional): seconds before testing the
+                service again. Defaults to 30.0.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """Tell if a request may be sent.
+
+        Returns:
+            bool: False when the request must fail fast.
+        """
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = self.HALF_OPEN
+            self._probing = False
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                self.rejected += 1
+                return False
+            self._probing = True
+        return True
+
+    def release(self) -> None:
+        """Let another request test the service, the last one was abandoned."""
+        self._probing = False
+
+    def record_success(self) -> None:
+        """Close the circuit after a successful request."""
+        if self.state != self.CLOSED:
+            logger.warning("LUIS circuit closed.")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        """Count a failure and open the circuit when needed."""
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+                logger.warning(
+                    f"LUIS circuit opened after {self.consecutive_failures} failures."
+                )
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+    def stats(self) -> Dict[str, object]:
+        """Return the state of the circuit.
+
+        Returns:
+            Dict[str, object]: state, consecutive failures, times opened and
+                requests rejected.
+        """
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+class LuisTransport:
+    """Call the prediction endpoint (v2) of a LUIS application."""
+
+    RETRIABLE_STATUS = (429, 500, 502, 503, 504)
+
+    def __init__(
+        self,
+        endpoint: str,
+        application_id: str,
+        endpoint_key: str,
+        timeout: float = 3.0,
+        deadline: float = 5.0,
+        max_retries: int = 2,
+        backoff: float = 0.1,
+        pool_size: int = 20,
+        breaker: CircuitBreaker = None,
+        user_agent: str = None,
+    ):
+        """Init the class.
+
+        Args:
+            endpoint (str): e.g. https://westus.api.cognitive.microsoft.com
+            application_id (str): id of the LUIS application.
+            endpoint_key (str): subscription key of the endpoint.
+            timeout (float, optional): seconds allowed to one attempt. Defaults to 3.0.
+            deadline (float, optional): seconds allowed to the call, retries
+                included. Defaults to 5.0.
+            max_retries (int, optional): retries after the first attempt. Defaults to 2.
+            backoff (float, optional): base of the exponential backoff in
+                seconds. Defaults to 0.1.
+            pool_size (int, optional): maximum number of connections. Defaults to 20.
+            breaker (CircuitBreaker, optional): Defaults to a new one.
+            user_agent (str, optional): value of the User-Agent header. Defaults to None.
+        """
+        self.url = f"{endpoint.rstrip('/')}/luis/v2.0/apps/{application_id}"
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.breaker = breaker or CircuitBreaker()
+        self._headers = {
+            "Ocp-Apim-Subscription-Key": endpoint_key,
+            "Accept": "application/json",
+            "Content-Type": "application/json; charset=utf-8",
+        }
+        if user_agent:
+            self._headers["User-Agent"] = user_agent
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_pid: Optional[int] = None
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.in_flight = 0
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Return the session of the process, created on first use."""
+        if self._session is None or self._session.closed or self._session_pid != os.getpid():
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size, keepalive_timeout=60, ttl_dns_cache=300
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector, headers=self._headers
+            )
+            self._session_pid = os.getpid()
+        return self._session
+
+    async def _attempt(self, query: str, params: Dict[str, str], timeout: float) -> dict:
+        """Send one request.
+
+        Returns:
+            dict: the JSON answered by LUIS.
+
+        Raises:
+            aiohttp.ClientResponseError: when LUIS answers with an error.
+        """
+        session = self._get_session()
+        async with session.post(
+            self.url,
+            params=params,
+            json=query,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as response:
+            if response.status != 200:
+                raise aiohttp.ClientResponseError(
+                    response.request_info,
+                    response.history,
+                    status=response.status,
+                    message=await response.text(),
+                )
+            return await response.json(content_type=None)
+
+    async def predict(self, query: str, params: Dict[str, str] = None) -> dict:
+        """Ask LUIS for the prediction of an utterance.
+
+        Args:
+            query (str): the utterance.
+            params (Dict[str, str], optional): query parameters of the
+                endpoint, e.g. {"log": "true"}. Defaults to None.
+
+        Raises:
+            LuisUnavailableError: when no answer was received in time.
+
+        Returns:
+            dict: the JSON answered by LUIS.
+        """
+        if not self.breaker.allow():
+            raise LuisUnavailableError("LUIS circuit is open.")
+
+        self.calls += 1
+        self.in_flight += 1
+        started = time.monotonic()
+        attempt = 0
+        recorded = False
+        try:
+            while True:
+                remaining = self.deadline - (time.monotonic() - started)
+                try:
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError()
+                    luis_json = await self._attempt(
+                        query, params or {}, min(self.timeout, remaining)
+                    )
+                    self.breaker.record_success()
+                    recorded = True
+                    return luis_json
+                except (asyncio.TimeoutError, aiohttp.ClientError) as error:
+                    if isinstance(error, asyncio.TimeoutError):
+                        self.timeouts += 1
+                    retriable = not isinstance(error, aiohttp.ClientResponseError) or (
+                        error.status in self.RETRIABLE_STATUS
+                    )
+                    # Full jitter: spread the retries of the conversations.
+                    pause = random.uniform(0, self.backoff * 2 ** attempt)
+                    remaining = self.deadline - (time.monotonic() - started)
+                    if not retriable or attempt >= self.max_retries or pause >= remaining:
+                        self.failures += 1
+                        self.breaker.record_failure()
+                        recorded = True
+                        # Never the repr of the request: it holds the key.
+                        reason = (
+                            f"status {error.status}"
+                            if isinstance(error, aiohttp.ClientResponseError)
+                            else type(error).__name__
+                        )
+                        raise LuisUnavailableError(f"LUIS failed: {reason}") from error
+                    attempt += 1
+                    self.retries += 1
+                    await asyncio.sleep(pause)
+        finally:
+            self.in_flight -= 1
+            if not recorded:
+                # Cancelled: the result of the test of the service is unknown.
+                self.breaker.release()
+
+    async def close(self) -> None:
+        """Close the connections of the pool."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    def stats(self) -> Dict[str, object]:
+        """Return the counters of the transport and the state of the circuit.
+
+        Returns:
+            Dict[str, object]: calls, failures, retries, timeouts, in flight,
+                pool size and circuit.
+        """
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "in_flight": self.in_flight,
+            "pool_size": self.pool_size,
+            "circuit": self.breaker.stats(),
+        }
+
+
+class LuisRecorder:
+    """Record the answers of LUIS, one JSON object per line.
+
+    Each line is {"query": <normalized utterance>, "response": <JSON of the
+    v2 endpoint>}. A query is recorded once, the first answer is kept.
+    """
+
+    def __init__(self, path: str):
+        """Init the class.
+
+        Args:
+            path (str): the file of the recordings, appended if it exists.
+        """
+        self.path = path
+        self._queries = set(load_recordings(path)) if os.path.exists(path) else set()
+        self.recorded = 0
+
+    def record(self, query: str, luis_json: dict) -> None:
+        """Record the answer to a query.
+
+        Args:
+            query (str): the utterance sent to LUIS.
+            luis_json (dict): the JSON answered by LUIS.
+        """
+        key = normalize_utterance(query)
+        if key in self._queries:
+            return
+        self._queries.add(key)
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(json.dumps({"query": key, "response": luis_json}) + "\n")
+        self.recorded += 1
+
+
+def load_recordings(path: str) -> Dict[str, dict]:
+    """Load the answers recorded by LuisRecorder.
+
+    Args:
+        path (str): the file of the recordings.
+
+    Returns:
+        Dict[str, dict]: the answer of LUIS for each normalized query.
+    """
+    recordings = {}
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                recording = json.loads(line)
+                recordings[recording["query"]] = recording["response"]
+    return recordings
+
+
+class RequestHedger:
+    """Send a second request when the first one is slower than usual.
+
+    The delay before the second request is a percentile of the latencies
+    recently observed, counting the requests abandoned or failed for the
+    time they ran. Every request earns a fraction of a token and every
+    hedge costs one: the traffic is never amplified by more than the budget.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        budget: float = 0.05,
+        default_delay: float = 1.0,
+        min_delay: float = 0.05,
+        window: int = 500,
+        min_samples: int = 20,
+        max_tokens: float = 10.0,
+        max_latency: float = None,
+    ):
+        """Init the class.
+
+        Args:
+            percentile (float, optional): percentile of the latencies used as
+                delay. Defaults to 95.0.
+            budget (float, optional): maximum share of the requests hedged.
+                Defaults to 0.05.
+            default_delay (float, optional): delay in seconds until enough
+                latencies are known. Defaults to 1.0.
+            min_delay (float, optional): the delay is never shorter. Defaults to 0.05.
+            window (int, optional): number of latencies kept. Defaults to 500.
+            min_samples (int, optional): latencies needed to use the
+                percentile. Defaults to 20.
+            max_tokens (float, optional): hedges that can be fired in a burst.
+                Defaults to 10.0.
+            max_latency (float, optional): the latencies recorded are never
+                longer, e.g. the deadline of the calls. Defaults to None.
+        """
+        self.percentile = percentile
+        self.budget = budget
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.max_tokens = max_tokens
+        self.max_latency = max_latency
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._tokens = 0.0
+        self.requests = 0
+        self.fired = 0
+        self.won = 0
+        self.denied = 0
+
+    def record(self, latency: float) -> None:
+        """Record the latency of a request."""
+        if self.max_latency is not None:
+            latency = min(latency, self.max_latency)
+        self._latencies.append(latency)
+
+    def delay(self) -> float:
+        """Return the seconds to wait before hedging.
+
+        Returns:
+            float: the percentile of the recent latencies.
+        """
+        if len(self._latencies) < self.min_samples:
+            return self.default_delay
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return max(self.min_delay, ordered[index])
+
+    async def _timed(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Run a call and record its latency.
+
+        A call cancelled, timed out or failed is recorded for the time it
+        ran: left out, the slow calls would lower the percentile exactly
+        when the service slows down.
+        """
+        started = time.monotonic()
+        try:
+            return await call()
+        finally:
+            self.record(time.monotonic() - started)
+
+    async def run(
+        self,
+        primary: Callable[[], Awaitable[Any]],
+        secondary: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """Run the primary call, hedged by the secondary one if it is late.
+
+        Args:
+            primary (Callable[[], Awaitable[Any]]): starts the first request.
+            secondary (Callable[[], Awaitable[Any]]): starts the hedge.
+
+        Returns:
+            Any: the first successful answer. The other request is cancelled.
+        """
+        self.requests += 1
+        self._tokens = min(self.max_tokens, self._tokens + self.budget)
+
+        first = asyncio.ensure_future(self._timed(primary))
+        pending = {first}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.delay())
+            if done:
+                return first.result()
+            if self._tokens < 1:
+                self.denied += 1
+                return await first
+
+            self._tokens -= 1
+            self.fired += 1
+            second = asyncio.ensure_future(self._timed(secondary))
+            pending.add(second)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.won += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict[str, object]:
+        """Return the counters of the hedging.
+
+        Returns:
+            Dict[str, object]: requests, hedges fired, won and denied by the
+                budget, and the current delay.
+        """
+        return {
+            "requests": self.requests,
+            "fired": self.fired,
+            "won": self.won,
+            "denied": self.denied,
+            "delay": round(self.delay(), 4),
+        }
@@ -0,0 +1,161 @@
+"""Serve the bot with several worker processes sharing one listening socket.
+
+    python prefork.py
+
+The supervisor binds the socket, then starts BotWorkers processes running
+app.py, each with its own adapter, bot and recognizers. The kernel spreads
+the connections between them. A worker that dies is started again, and on
+SIGTERM or SIGINT every worker stops accepting and finishes its turns.
+
+A conversation may reach any worker, so its state has to be shared: the
+SQLite storage is used (StateStorage=sqlite). A turn holds the lease of its
+conversation in the same file, so the turns of a conversation run one after
+the other even on two workers. Should a lease expire during a turn, the turn
+saving last is refused with a 503 and Retry-After, and its state is not
+cleared, so the channel retries it on the state of the other; the messages
+it already sent are then sent again.
+"""
+
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+from config import DefaultConfig
+
+logger = logging.getLogger(__name__)
+
+# Environment variables given to the workers.
+LISTEN_FD_VARIABLE = "BotListenFd"
+WORKER_INDEX_VARIABLE = "BotWorkerIndex"
+
+
+class Supervisor:
+    """Start the workers, restart the crashed ones and stop them all."""
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        workers: int,
+        command: List[str],
+        drain_timeout: float = 30.0,
+    ):
+        """Init the class.
+
+        Args:
+            host (str): address to listen on.
+            port (int): port to listen on.
+            workers (int): number of worker processes.
+            command (List[str]): command starting a worker.
+            drain_timeout (float, optional): seconds the workers have to
+                finish their turns on shutdown. Defaults to 30.0.
+        """
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.command = command
+        self.drain_timeout = drain_timeout
+        self._socket: Optional[socket.socket] = None
+        self._processes: Dict[int, subprocess.Popen] = {}
+        self._started_at: Dict[int, float] = {}
+        self._restart_delay: Dict[int, float] = {}
+        self._exited_at: Dict[int, float] = {}
+        self._stopping = False
+        self.restarts = 0
+
+    def _start(self, index: int) -> None:
+        """Start a worker on the shared socket."""
+        environment = dict(os.environ)
+        environment[LISTEN_FD_VARIABLE] = str(self._socket.fileno())
+        environment[WORKER_INDEX_VARIABLE] = str(index)
+        self._processes[index] = subprocess.Popen(
+            self.command, env=environment, pass_fds=(self._socket.fileno(),)
+        )
+        self._started_at[index] = time.monotonic()
+        logger.info(f"Worker {index} started, pid {self._processes[index].pid}.")
+
+    def _stop(self, signum, frame) -> None:
+        """Ask the supervisor to stop."""
+        self._stopping = True
+
+    def _watch(self) -> None:
+        """Restart the workers that exited, slower when they keep crashing."""
+        now = time.monotonic()
+        for index, process in list(self._processes.items()):
+            code = process.poll()
+            if code is None:
+                continue
+            if index not in self._exited_at:
+                self._exited_at[index] = now
+                logger.warning(f"Worker {index} exited with {code}.")
+                if now - self._started_at[index] > 60:
+                    self._restart_delay[index] = 0.5
+                else:
+                    # Crash loop: wait longer before each start.
+                    self._restart_delay[index] = min(
+                        2 * self._restart_delay.get(index, 0.25), 30.0
+                    )
+            if now - self._exited_at[index] >= self._restart_delay[index]:
+                del self._exited_at[index]
+                self.restarts += 1
+                self._start(index)
+
+    def _drain(self) -> None:
+        """Stop the workers, letting them finish their turns."""
+        for process in self._processes.values():
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+        deadline = time.monotonic() + self.drain_timeout
+        for index, process in self._processes.items():
+            try:
+                process.wait(timeout=max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                logger.warning(f"Worker {index} did not stop in time, killing it.")
+                process.kill()
+                process.wait()
+
+    def run(self) -> int:
+        """Serve until SIGTERM or SIGINT.
+
+        Returns:
+            int: the exit code of the supervisor.
+        """
+        self._socket = socket.create_server((self.host, self.port), backlog=1024)
+        self._socket.set_inheritable(True)
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        logger.info(f"Listening on {self.host}:{self.port} with {self.workers} workers.")
+
+        for index in range(self.workers):
+            self._start(index)
+        while not self._stopping:
+            time.sleep(0.5)
+            self._watch()
+
+        logger.info("Stopping the workers.")
+        self._drain()
+        self._socket.close()
+        return 0
+
+
+# Start the supervisor
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    CONFIG = DefaultConfig()
+    if CONFIG.STATE_STORAGE != "sqlite":
+        logger.warning("The workers share the conversations through SQLite (StateStorage=sqlite).")
+        os.environ["StateStorage"] = "sqlite"
+    sys.exit(
+        Supervisor(
+            host=CONFIG.SERVICE_URL or "0.0.0.0",
+            port=int(CONFIG.PORT),
+            workers=CONFIG.WORKERS or os.cpu_count() or 1,
+            command=[sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")],
+            drain_timeout=CONFIG.DRAIN_TIMEOUT,
+        ).run()
+    )
@@ -39,6 +39,10 @@ class FILES:  # pylint: disable=C0103
     UTTERANCES_GREETINGS = os.path.join(PATH_TO_DATA, "utterances Greetings.json")
     UTTERANCES_HELP = os.path.join(PATH_TO_DATA, "utterances Help.json")
 
+    LOCAL_MODEL = os.path.join("cognitiveModels", "local_model.npz")
+
+    LUIS_RECORDINGS = os.path.join("cognitiveModels", "luis_recordings.jsonl")
+
     TRAIN_JSON = os.path.join(PATH_TO_DATA, "json_train.json")
 
     TEST_JSON = os.path.join(PATH_TO_DATA, "json_test.json")
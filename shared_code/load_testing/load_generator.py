@@ -0,0 +1,345 @@
+"""Load the bot with concurrent conversations and report how it holds up.
+
+The conversations are the user turns of the Frames dialogs (or of a JSON
+file holding a list of conversations, each a list of texts). They are
+started at a target rate and POSTed as Bot Framework activities to
+/api/messages. The replies of the bot are received by a stand-in of the Bot
+Connector service started by the generator, so the bot must run with no
+MicrosoftAppId (authentication disabled), e.g.:
+
+    python shared_code/load_testing/luis_replay_server.py --port 5050
+    set LuisAPIHostName=http://localhost:5050
+    python app.py
+    python shared_code/load_testing/load_generator.py --rate 5 \
+        --duration 60 --bot-pid <pid of app.py> --output report.json
+"""
+
+# Load the libraries
+from typing import Dict, List, Optional
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+import aiohttp
+from aiohttp import web
+
+sys.path.append(os.getcwd())
+
+# Reply sent by AdapterWithErrorHandler when a turn fails.
+BOT_ERROR_TEXT = "The bot encountered an error or bug."
+PERCENTILES = (50, 90, 95, 99)
+
+
+def load_conversations(path: Optional[str], max_turns: int) -> List[List[str]]:
+    """Load the user turns of the conversations.
+
+    Args:
+        path (Optional[str]): JSON file with a list of conversations. None
+            to use the Frames dialogs.
+        max_turns (int): turns kept per conversation.
+
+    Returns:
+        List[List[str]]: the texts of the user, per conversation.
+    """
+    if path:
+        with open(path, encoding="utf-8") as file:
+            conversations = json.load(file)
+    else:
+        from shared_code.frames.frames import Frames
+
+        df_utterances = Frames().df_utterances
+        conversations = [
+            list(turns) for _, turns in df_utterances.groupby("id", sort=False)["text"]
+        ]
+    return [turns[:max_turns] for turns in conversations if turns]
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """Summarize the latencies in milliseconds.
+
+    Args:
+        values (List[float]): the latencies in seconds.
+
+    Returns:
+        Dict[str, float]: the percentiles, the mean and the maximum.
+    """
+    if not values:
+        return {}
+    ordered = sorted(values)
+    summary = {
+        f"p{percentile}": round(
+            1000 * ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))], 2
+        )
+        for percentile in PERCENTILES
+    }
+    summary["mean"] = round(1000 * sum(ordered) / len(ordered), 2)
+    summary["max"] = round(1000 * ordered[-1], 2)
+    return summary
+
+
+def read_rss(pid: Optional[int]) -> Optional[int]:
+    """Return the resident memory of a process in bytes, from /proc.
+
+    Args:
+        pid (Optional[int]): the process, None for no measure.
+
+    Returns:
+        Optional[int]: the resident set size, None if unknown.
+    """
+    if pid is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+class Connector_stand_in:
+    """Receive the activities the bot sends to the Bot Connector service."""
+
+    def __init__(self) -> None:
+        """Init the class."""
+        self.replies: Dict[str, List[dict]] = {}
+        self.received = 0
+
+    async def receive(self, request: web.Request) -> web.Response:
+        """Record an activity sent or replied to a conversation."""
+        activity = await request.json()
+        conversation_id = request.match_info["conversation_id"]
+        self.replies.setdefault(conversation_id, []).append(activity)
+        self.received += 1
+        return web.json_response({"id": str(uuid.uuid4())})
+
+    def take(self, conversation_id: str) -> List[dict]:
+        """Return and forget the activities received for a conversation."""
+        return self.replies.pop(conversation_id, [])
+
+    def application(self) -> web.Application:
+        """Build the aiohttp application."""
+        app = web.Application()
+        app.router.add_post("/v3/conversations/{conversation_id}/activities", self.receive)
+        app.router.add_post(
+            "/v3/conversations/{conversation_id}/activities/{activity_id}", self.receive
+        )
+        return app
+
+
+class Load_generator:
+    """Run the conversations against the bot and measure the turns."""
+
+    def __init__(
+        self,
+        bot_url: str,
+        service_url: str,
+        connector: Connector_stand_in,
+        conversations: List[List[str]],
+        think_time: float = 1.0,
+        timeout: float = 30.0,
+    ) -> None:
+        """Init the class.
+
+        Args:
+            bot_url (str): URL of /api/messages.
+            service_url (str): URL of the connector stand-in.
+            connector (Connector_stand_in): receives the replies.
+            conversations (List[List[str]]): the texts of the user.
+            think_time (float, optional): mean seconds between two turns of a
+                conversation. Defaults to 1.0.
+            timeout (float, optional): seconds before a turn is a timeout.
+                Defaults to 30.0.
+        """
+        self.__bot_url = bot_url
+        self.__service_url = service_url
+        self.__connector = connector
+        self.__conversations = conversations
+        self.__think_time = think_time
+        self.__timeout = timeout
+        self.latencies: List[float] = []
+        self.errors: Dict[str, int] = {}
+        self.turns = 0
+        self.replies = 0
+        self.conversations_done = 0
+        self.active = 0
+        self.peak_active = 0
+
+    def __activity(self, conversation_id: str, user_id: str, text: str = None) -> dict:
+        """Build the JSON of an activity of the user."""
+        activity = {
+            "id": str(uuid.uuid4()),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "serviceUrl": self.__service_url,
+            "channelId": "loadtest",
+            "from": {"id": user_id, "name": "user"},
+            "conversation": {"id": conversation_id},
+            "recipient": {"id": "bot", "name": "bot"},
+            "locale": "en-US",
+            "channelData": {"clientActivityID": str(uuid.uuid4())},
+        }
+        if text is None:
+            activity["type"] = "conversationUpdate"
+            activity["membersAdded"] = [{"id": user_id}, {"id": "bot"}]
+        else:
+            activity["type"] = "message"
+            activity["text"] = text
+        return activity
+
+    def __count_error(self, kind: str) -> None:
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    async def __turn(self, session: aiohttp.ClientSession, activity: dict) -> None:
+        """Send one activity and measure the turn."""
+        started = time.monotonic()
+        try:
+            async with session.post(
+                self.__bot_url,
+                json=activity,
+                timeout=aiohttp.ClientTimeout(total=self.__timeout),
+            ) as response:
+                await response.read()
+                status = response.status
+        except asyncio.TimeoutError:
+            self.__count_error("timeout")
+            return
+        except aiohttp.ClientError as error:
+            self.__count_error(type(error).__name__)
+            return
+        finally:
+            self.turns += 1
+
+        self.latencies.append(time.monotonic() - started)
+        if status >= 400:
+            self.__count_error(f"http_{status}")
+        replies = self.__connector.take(activity["conversation"]["id"])
+        self.replies += len(replies)
+        if any(reply.get("text") == BOT_ERROR_TEXT for reply in replies):
+            self.__count_error("bot_error")
+        elif activity["type"] == "message" and not replies:
+            self.__count_error("no_reply")
+
+    async def conversation(self, session: aiohttp.ClientSession, turns: List[str]) -> None:
+        """Run one conversation, welcome included."""
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+        conversation_id = str(uuid.uuid4())
+        user_id = f"user-{conversation_id[:8]}"
+        try:
+            await self.__turn(session, self.__activity(conversation_id, user_id))
+            for text in turns:
+                await asyncio.sleep(random.expovariate(1 / self.__think_time))
+                await self.__turn(session, self.__activity(conversation_id, user_id, text))
+        finally:
+            self.active -= 1
+            self.conversations_done += 1
+
+    async def run(self, rate: float, duration: float) -> float:
+        """Start conversations at the rate during the duration.
+
+        Args:
+            rate (float): conversations started per second (Poisson arrivals).
+            duration (float): seconds during which conversations are started.
+
+        Returns:
+            float: seconds until the last conversation ended.
+        """
+        started = time.monotonic()
+        tasks = []
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            while time.monotonic() - started < duration:
+                turns = random.choice(self.__conversations)
+                tasks.append(asyncio.ensure_future(self.conversation(session, turns)))
+                await asyncio.sleep(random.expovariate(rate))
+            await asyncio.gather(*tasks)
+        return time.monotonic() - started
+
+
+async def main(arguments: argparse.Namespace) -> dict:
+    """Run the load test and build the report."""
+    connector = Connector_stand_in()
+    runner = web.AppRunner(connector.application())
+    await runner.setup()
+    await web.TCPSite(runner, arguments.connector_host, arguments.connector_port).start()
+
+    generator = Load_generator(
+        bot_url=arguments.bot_url,
+        service_url=f"http://{arguments.connector_host}:{arguments.connector_port}",
+        connector=connector,
+        conversations=load_conversations(arguments.conversations, arguments.max_turns),
+        think_time=arguments.think_time,
+        timeout=arguments.timeout,
+    )
+    rss_start = read_rss(arguments.bot_pid)
+    rss_peak = rss_start
+    run = asyncio.ensure_future(generator.run(arguments.rate, arguments.duration))
+    while not run.done():
+        await asyncio.wait({run}, timeout=1.0)
+        rss = read_rss(arguments.bot_pid)
+        if rss is not None:
+            rss_peak = max(rss_peak or 0, rss)
+    elapsed = run.result()
+    rss_end = read_rss(arguments.bot_pid)
+    await runner.cleanup()
+
+    failed = sum(generator.errors.values())
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "parameters": {
+            "rate": arguments.rate,
+            "duration": arguments.duration,
+            "think_time": arguments.think_time,
+            "max_turns": arguments.max_turns,
+        },
+        "elapsed": round(elapsed, 3),
+        "conversations": generator.conversations_done,
+        "peak_concurrent_conversations": generator.peak_active,
+        "turns": generator.turns,
+        "replies": generator.replies,
+        "throughput_turns_per_second": round(generator.turns / elapsed, 2) if elapsed else 0,
+        "latency_ms": percentiles(generator.latencies),
+        "errors": generator.errors,
+        "error_rate": round(failed / generator.turns, 4) if generator.turns else 0,
+        "memory": {
+            "rss_start": rss_start,
+            "rss_peak": rss_peak,
+            "rss_end": rss_end,
+            "rss_growth": rss_end - rss_start if rss_start and rss_end else None,
+        },
+    }
+
+
+# Run the load test
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bot-url", default="http://localhost:3978/api/messages")
+    parser.add_argument("--connector-host", default="localhost")
+    parser.add_argument("--connector-port", type=int, default=3979)
+    parser.add_argument("--conversations", default=None,
+                        help="JSON list of conversations, default the Frames dialogs")
+    parser.add_argument("--rate", type=float, default=1.0,
+                        help="conversations started per second")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--think-time", type=float, default=1.0)
+    parser.add_argument("--max-turns", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--bot-pid", type=int, default=None,
+                        help="process of the bot, to measure its memory")
+    parser.add_argument("--output", default=None, help="file of the JSON report")
+    arguments = parser.parse_args()
+
+    report = asyncio.run(main(arguments))
+    text = json.dumps(report, indent=2)
+    if arguments.output:
+        with open(arguments.output, "w", encoding="utf-8") as file:
+            file.write(text)
+    print(text)
@@ -0,0 +1,145 @@
+"""Stand-in for the LUIS prediction endpoint, replaying recorded answers.
+
+Record the answers with LuisRecordPath set in the configuration of the bot,
+then start the server and point LuisAPIHostName at it, e.g.:
+
+    python shared_code/load_testing/luis_replay_server.py --port 5050 \
+        --latency lognormal:40,0.6 --error-rate 0.01
+    set LuisAPIHostName=http://localhost:5050
+"""
+
+# Load the libraries
+from typing import Callable, Dict
+
+import argparse
+import asyncio
+import math
+import os
+import random
+import sys
+
+from aiohttp import web
+
+sys.path.append(os.getcwd())
+from helpers.recognition_cache import normalize_utterance
+from luis_transport import load_recordings
+from shared_code.constants.files import FILES
+
+
+def parse_latency(value: str) -> Callable[[], float]:
+    """Build the latency distribution from its description.
+
+    Args:
+        value (str): in milliseconds, one of "fixed:<ms>",
+            "uniform:<min>,<max>" or "lognormal:<median>,<sigma>".
+
+    Raises:
+        ValueError: when the distribution is unknown.
+
+    Returns:
+        Callable[[], float]: draws a latency in seconds.
+    """
+    name, _, parameters = value.partition(":")
+    numbers = [float(number) for number in parameters.split(",") if number]
+    if name == "fixed":
+        return lambda: numbers[0] / 1000
+    if name == "uniform":
+        return lambda: random.uniform(numbers[0], numbers[1]) / 1000
+    if name == "lognormal":
+        return lambda: random.lognormvariate(math.log(numbers[0]), numbers[1]) / 1000
+    raise ValueError(f"Unknown latency distribution: {value}")
+
+
+class Luis_replay_server:
+    """Answer the prediction requests with the recorded answers."""
+
+    def __init__(
+        self,
+        recordings: Dict[str, dict],
+        latency: Callable[[], float],
+        error_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+    ) -> None:
+        """Init the class.
+
+        Args:
+            recordings (Dict[str, dict]): the answer of LUIS per query.
+            latency (Callable[[], float]): draws the latency of an answer.
+            error_rate (float, optional): share of the requests answered by
+                a 503. Defaults to 0.0.
+            timeout_rate (float, optional): share of the requests never
+                answered in time (60 s). Defaults to 0.0.
+        """
+        self.__recordings = recordings
+        self.__latency = latency
+        self.__error_rate = error_rate
+        self.__timeout_rate = timeout_rate
+        self.__counters = {"requests": 0, "replayed": 0, "unknown": 0, "errors": 0, "timeouts": 0}
+
+    def __unknown_answer(self, query: str) -> dict:
+        """Answer the None intent to a query never recorded."""
+        return {
+            "query": query,
+            "topScoringIntent": {"intent": "None", "score": 1.0},
+            "intents": [{"intent": "None", "score": 1.0}],
+            "entities": [],
+        }
+
+    async def predict(self, request: web.Request) -> web.Response:
+        """Answer a request to the v2 prediction endpoint."""
+        self.__counters["requests"] += 1
+        query = await request.json()
+        draw = random.random()
+        if draw < self.__timeout_rate:
+            self.__counters["timeouts"] += 1
+            await asyncio.sleep(60)
+        await asyncio.sleep(self.__latency())
+        if draw < self.__timeout_rate + self.__error_rate:
+            self.__counters["errors"] += 1
+            return web.Response(status=503)
+
+        answer = self.__recordings.get(normalize_utterance(query))
+        if answer is None:
+            self.__counters["unknown"] += 1
+            answer = self.__unknown_answer(query)
+        else:
+            self.__counters["replayed"] += 1
+            answer = {**answer, "query": query}
+        return web.json_response(answer)
+
+    async def stats(self, request: web.Request) -> web.Response:
+        """Return the counters of the server."""
+        return web.json_response(self.__counters)
+
+    def application(self) -> web.Application:
+        """Build the aiohttp application."""
+        app = web.Application()
+        app.router.add_post("/luis/v2.0/apps/{app_id}", self.predict)
+        app.router.add_get("/stats", self.stats)
+        return app
+
+
+# Start the server
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recordings", default=FILES.LUIS_RECORDINGS)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=5050)
+    parser.add_argument("--latency", default="lognormal:40,0.5")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    arguments = parser.parse_args()
+
+    recordings = (
+        load_recordings(arguments.recordings)
+        if os.path.exists(arguments.recordings)
+        else {}
+    )
+    print(f"{len(recordings)} recorded answers loaded from {arguments.recordings}")
+    server = Luis_replay_server(
+        recordings,
+        parse_latency(arguments.latency),
+        error_rate=arguments.error_rate,
+        timeout_rate=arguments.timeout_rate,
+    )
+    web.run_app(server.application(), host=arguments.host, port=arguments.port)
@@ -0,0 +1,14 @@
+"""Init the module that trains the local model."""
+
+# Load the librairies
+import os
+import sys
+
+
+# Add the module
+path_libraries = os.path.join(os.getcwd(), "shared_code")
+if path_libraries not in sys.path:
+    sys.path.append(path_libraries)
+path_libraries = os.path.join(os.getcwd(), "shared_code", "local_model")
+if path_libraries not in sys.path:
+    sys.path.append(path_libraries)
@@ -0,0 +1,175 @@
+"""Class to train the local model of the bot from the Frames corpus."""
+
+# Load the libriries
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+import os
+import sys
+import json
+import numpy as np
+import pandas as pd
+
+from shared_code.frames.frames import Frames
+from shared_code.constants.files import FILES
+from shared_code.constants.luis_app import LUIS_APPS
+from shared_code.constants.utterances import UTTERANCES
+from local_journey_recognizer import Local_journey_model
+from local_journey_recognizer import features
+from local_journey_recognizer import tokenize
+
+
+class Local_model_trainer:
+    """Train the intent classifier and build the gazetteer."""
+
+    NONE_INTENT_NAME = "None"
+
+    def __init__(self, alpha: float = 0.5, min_count: int = 1) -> None:
+        """Init the class.
+
+        Args:
+            alpha (float, optional): additive smoothing of the classifier. Defaults to 0.5.
+            min_count (int, optional): a feature must be seen at least this
+                number of times to be kept. Defaults to 1.
+        """
+        self.__alpha = alpha
+        self.__min_count = min_count
+        self.__df_utterances: pd.DataFrame = Frames().df_utterances
+
+    #
+    # Private
+    #
+    def __load_intent_utterances(self, path: str) -> List[Tuple[str, str]]:
+        """Load a file of utterances made for LUIS.
+
+        Args:
+            path (str): the file of utterances.
+
+        Returns:
+            List[Tuple[str, str]]: text and intent of each utterance.
+        """
+        with open(file=path, mode="r", encoding="utf-8") as file_handler:
+            json_data = json.load(file_handler)
+        return [(entry["text"], entry["intent"]) for entry in json_data["data"]]
+
+    def __load_cues(self, path: str) -> List[str]:
+        """Load a list of words introducing an entity.
+
+        Args:
+            path (str): the file of the words.
+
+        Returns:
+            List[str]: the lowered words.
+        """
+        with open(file=path, mode="r", encoding="utf-8") as file_handler:
+            json_data = json.load(file_handler)
+        return [word.lower().strip() for word in json_data["list"] if word.strip()]
+
+    def __get_samples(self) -> List[Tuple[str, str]]:
+        """Label the utterances of Frames and add the Greetings and Help ones.
+
+        Returns:
+            List[Tuple[str, str]]: text and intent of each sample.
+        """
+        entity_columns = [
+            UTTERANCES.ENTITY_FROM_PLACE,
+            UTTERANCES.ENTITY_TO_PLACE,
+            UTTERANCES.ENTITY_FROM_DATE,
+            UTTERANCES.ENTITY_TO_DATE,
+            UTTERANCES.ENTITY_MAX_BUDGET,
+        ]
+        has_entity = self.__df_utterances[entity_columns].notnull().any(axis=1)
+        journey_intent = LUIS_APPS.INTENTS[LUIS_APPS.INTENT_SPECIFY_JOURNEY_NAME]
+        samples = [
+            (text, journey_intent if with_entity else self.NONE_INTENT_NAME)
+            for text, with_entity in zip(self.__df_utterances["text"], has_entity)
+        ]
+        samples += self.__load_intent_utterances(FILES.UTTERANCES_GREETINGS)
+        samples += self.__load_intent_utterances(FILES.UTTERANCES_HELP)
+        return samples
+
+    def __get_cities(self) -> List[str]:
+        """Collect the cities of Frames.
+
+        Returns:
+            List[str]: the lowered names of the cities.
+        """
+        cities = pd.concat(
+            [
+                self.__df_utterances[UTTERANCES.ENTITY_FROM_PLACE],
+                self.__df_utterances[UTTERANCES.ENTITY_TO_PLACE],
+            ]
+        ).dropna()
+        return sorted({city.lower().strip() for city in cities if len(city.strip()) > 2})
+
+    #
+    # Public
+    #
+    def train(self) -> Local_journey_model:
+        """Train the model.
+
+        Returns:
+            Local_journey_model: the trained model.
+        """
+        samples = self.__get_samples()
+        intents = sorted({intent for _, intent in samples})
+        intent_indexes = {intent: index for index, intent in enumerate(intents)}
+
+        counts: Dict[str, int] = {}
+        tokenized = []
+        for text, intent in samples:
+            sample_features = features(tokenize(text))
+            tokenized.append((sample_features, intent_indexes[intent]))
+            for feature in sample_features:
+                counts[feature] = counts.get(feature, 0) + 1
+        vocabulary = sorted(
+            feature for feature, count in counts.items() if count >= self.__min_count
+        )
+        feature_indexes = {feature: index for index, feature in enumerate(vocabulary)}
+
+        feature_counts = np.zeros((len(intents), len(vocabulary)), dtype=np.float64)
+        intent_counts = np.zeros(len(intents), dtype=np.float64)
+        for sample_features, intent_index in tokenized:
+            intent_counts[intent_index] += 1
+            for feature in sample_features:
+                if feature in feature_indexes:
+                    feature_counts[intent_index, feature_indexes[feature]] += 1
+
+        feature_counts += self.__alpha
+        log_likelihood = np.log(feature_counts) - np.log(
+            feature_counts.sum(axis=1, keepdims=True)
+        )
+        log_prior = np.log(intent_counts / intent_counts.sum())
+
+        cues = {
+            "origin": self.__load_cues(
+                os.path.join(FILES.PATH_TO_DATA, FILES.WORDS_MAKING_ORIGIN)
+            ),
+            "destination": self.__load_cues(
+                os.path.join(FILES.PATH_TO_DATA, FILES.WORDS_MAKING_DESTINATION)
+            ),
+            "start": self.__load_cues(
+                os.path.join(FILES.PATH_TO_DATA, FILES.WORDS_MAKING_START)
+            ),
+            "end": self.__load_cues(
+                os.path.join(FILES.PATH_TO_DATA, FILES.WORDS_MAKING_END)
+            ),
+        }
+        return Local_journey_model(
+            intents=intents,
+            vocabulary=vocabulary,
+            log_prior=log_prior,
+            log_likelihood=log_likelihood,
+            cities=self.__get_cities(),
+            cues=cues,
+        )
+
+
+# Train and save the model
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else FILES.LOCAL_MODEL
+    model = Local_model_trainer().train()
+    model.save(path)
+    print(f"{len(model.intents)} intents, {len(model.vocabulary)} features, "
+          f"{len(model.cities)} cities saved in {path}")
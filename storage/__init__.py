@@ -0,0 +1,20 @@
+"""storage module."""
+
+from .activity_deduplicator import ActivityDeduplicator, SqliteActivityDeduplicator
+from .bounded_memory_storage import BoundedMemoryStorage
+from .conversation_lease import ConversationLeases, SqliteConversationLeases
+from .delta_state import DeltaConversationState, DeltaStateMixin, DeltaUserState
+from .sqlite_storage import SqliteStorage, StateConflict
+
+__all__ = [
+    "ActivityDeduplicator",
+    "BoundedMemoryStorage",
+    "ConversationLeases",
+    "DeltaConversationState",
+    "DeltaStateMixin",
+    "DeltaUserState",
+    "SqliteActivityDeduplicator",
+    "SqliteConversationLeases",
+    "SqliteStorage",
+    "StateConflict",
+]
@@ -0,0 +1,173 @@
+"""Recent activity ids, to answer the retries of the channel only once."""
+
+import asyncio
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+
+class ActivityDeduplicator:
+    """Bounded set of the activities received in the last window seconds.
+
+    When the bot is slow, the channel posts the same activity again. The
+    second one is recognized by its conversation and activity ids and
+    acknowledged without running the turn.
+    """
+
+    def __init__(self, window: float = 300.0, max_entries: int = 10000):
+        """Init the class.
+
+        Args:
+            window (float, optional): seconds an activity id is remembered.
+                Defaults to 300.0.
+            max_entries (int, optional): activity ids remembered, the oldest
+                are forgotten first. Defaults to 10000.
+        """
+        self.window = window
+        self.max_entries = max_entries
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self.activities = 0
+        self.duplicates = 0
+
+    @staticmethod
+    def key(conversation_id: Optional[str], activity_id: Optional[str]) -> Optional[str]:
+        """Return the key of an activity, None when it has no id."""
+        if not activity_id:
+            return None
+        return f"{conversation_id or ''}/{activity_id}"
+
+    def _expire(self, now: float) -> None:
+        """Forget the ids out of the window, and the oldest beyond the limit."""
+        while self._seen:
+            key, seen = next(iter(self._seen.items()))
+            if now - seen <= self.window and len(self._seen) < self.max_entries:
+                break
+            del self._seen[key]
+
+    def _remember(self, key: str, now: float) -> bool:
+        """Record an id in memory, return False when already there."""
+        self._expire(now)
+        if key in self._seen:
+            return False
+        self._seen[key] = now
+        return True
+
+    async def _remember_shared(self, key: str, now: float) -> bool:
+        """Record an id seen by no other process, return False otherwise."""
+        return True
+
+    async def is_duplicate(self, key: Optional[str]) -> bool:
+        """Record an activity and tell if it was already received.
+
+        Args:
+            key (Optional[str]): the key of the activity, None to let it in.
+
+        Returns:
+            bool: True when the activity was received in the window.
+        """
+        if key is None:
+            return False
+        self.activities += 1
+        now = time.time()
+        if not self._remember(key, now) or not await self._remember_shared(key, now):
+            self.duplicates += 1
+            return True
+        return False
+
+    async def forget(self, key: Optional[str]) -> None:
+        """Forget an activity whose turn failed, so its retry is run."""
+        if key is not None:
+            self._seen.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the counters of the deduplicator.
+
+        Returns:
+            Dict[str, int]: activities checked, duplicates suppressed and
+                ids remembered.
+        """
+        return {
+            "activities": self.activities,
+            "duplicates": self.duplicates,
+            "remembered": len(self._seen),
+        }
+
+
+class SqliteActivityDeduplicator(ActivityDeduplicator):
+    """ActivityDeduplicator shared by the worker processes through SQLite.
+
+    A retry may reach another worker than the first post. The ids are also
+    inserted in a table of the database of the states: the insertion of an
+    id already there tells it is a duplicate.
+    """
+
+    def __init__(self, path: str, window: float = 300.0, max_entries: int = 10000):
+        """Init the class.
+
+        Args:
+            path (str): the file of the database.
+            window (float, optional): seconds an activity id is remembered.
+                Defaults to 300.0.
+            max_entries (int, optional): activity ids remembered in memory.
+                Defaults to 10000.
+        """
+        super(SqliteActivityDeduplicator, self).__init__(window, max_entries)
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._last_purge = time.time()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Return the thread of the database of this process."""
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite_dedup")
+            self._connection = None
+            self._pid = os.getpid()
+        return self._executor
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Open the database on first use."""
+        if self._connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS activity (key TEXT PRIMARY KEY, seen REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS activity_seen ON activity(seen)")
+            self._connection = connection
+        return self._connection
+
+    def _insert(self, key: str, now: float) -> bool:
+        """Insert an id, return False when it is there and in the window."""
+        connection = self._get_connection()
+        if now - self._last_purge > 60:
+            connection.execute("DELETE FROM activity WHERE seen < ?", (now - self.window,))
+            self._last_purge = now
+        cursor = connection.execute(
+            "INSERT INTO activity(key, seen) VALUES(?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET seen=excluded.seen WHERE seen < ?",
+            (key, now, now - self.window),
+        )
+        return cursor.rowcount > 0
+
+    def _delete(self, key: str) -> None:
+        """Delete an id."""
+        self._get_connection().execute("DELETE FROM activity WHERE key=?", (key,))
+
+    async def _remember_shared(self, key: str, now: float) -> bool:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._get_executor(), self._insert, key, now
+        )
+
+    async def forget(self, key: Optional[str]) -> None:
+        if key is None:
+            return
+        await super(SqliteActivityDeduplicator, self).forget(key)
+        await asyncio.get_running_loop().run_in_executor(self._get_executor(), self._delete, key)
@@ -0,0 +1,127 @@
+"""Compare the latency of the storages of the states.
+
+Each turn reads the state of a conversation, changes it and writes it back,
+as ConversationState does. The turns are run one at a time (latency) and
+then many at once (throughput), e.g.:
+
+    python storage/benchmark_storage.py --conversations 1000 --concurrency 50
+"""
+
+# Load the libraries
+from typing import Callable, Dict, List
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.getcwd())
+from botbuilder.core import MemoryStorage, Storage
+from storage import BoundedMemoryStorage, SqliteStorage
+
+
+def make_state(conversation: int, turn: int) -> dict:
+    """Build a state the size of the one of a dialog in progress."""
+    return {
+        "DialogState": {
+            "dialog_stack": [
+                {"id": "MainDialog", "state": {"stepIndex": 1, "values": {}}},
+                {
+                    "id": "Specifying_dialog",
+                    "state": {
+                        "options": {
+                            "destination": "paris",
+                            "origin": "london",
+                            "departure_date": "2023-06-01",
+                            "return_date": None,
+                            "max_budget": None,
+                            "utterances": [f"message {n} of {conversation}" for n in range(turn + 5)],
+                        },
+                        "stepIndex": turn,
+                    },
+                },
+            ]
+        }
+    }
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """Summarize the latencies in microseconds."""
+    ordered = sorted(values)
+    return {
+        f"p{percentile}": round(
+            1e6 * ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))], 1
+        )
+        for percentile in (50, 90, 99)
+    }
+
+
+async def turn(storage: Storage, conversation: int, index: int) -> None:
+    """Read, change and write the state of a conversation."""
+    key = f"loadtest/conversations/{conversation}"
+    items = await storage.read([key])
+    state = items.get(key) or {}
+    state.update(make_state(conversation, index))
+    await storage.write({key: state})
+
+
+async def measure(storage: Storage, conversations: int, turns: int, concurrency: int) -> dict:
+    """Measure the latencies and the throughput of a storage."""
+    read_latencies, write_latencies = [], []
+    for index in range(turns):
+        for conversation in range(conversations):
+            key = f"loadtest/conversations/{conversation}"
+            started = time.perf_counter()
+            items = await storage.read([key])
+            read_latencies.append(time.perf_counter() - started)
+            state = items.get(key) or {}
+            state.update(make_state(conversation, index))
+            started = time.perf_counter()
+            await storage.write({key: state})
+            write_latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    done = 0
+    for index in range(turns):
+        for first in range(0, conversations, concurrency):
+            batch = range(first, min(conversations, first + concurrency))
+            await asyncio.gather(*[turn(storage, conversation, index) for conversation in batch])
+            done += len(batch)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "read_us": percentiles(read_latencies),
+        "write_us": percentiles(write_latencies),
+        "concurrent_turns_per_second": round(done / elapsed, 1),
+    }
+
+
+async def main(arguments: argparse.Namespace) -> Dict[str, dict]:
+    """Run the benchmark on every storage."""
+    folder = tempfile.mkdtemp()
+    factories: Dict[str, Callable[[], Storage]] = {
+        "MemoryStorage": MemoryStorage,
+        "BoundedMemoryStorage": lambda: BoundedMemoryStorage(arguments.conversations * 2),
+        "SqliteStorage": lambda: SqliteStorage(os.path.join(folder, "state.sqlite3")),
+        "SqliteStorage (no read cache)": lambda: SqliteStorage(
+            os.path.join(folder, "state_nocache.sqlite3"), cache_size=0
+        ),
+    }
+    return {
+        name: await measure(
+            factory(), arguments.conversations, arguments.turns, arguments.concurrency
+        )
+        for name, factory in factories.items()
+    }
+
+
+# Run the benchmark
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--conversations", type=int, default=500)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=50)
+    print(json.dumps(asyncio.run(main(parser.parse_args())), indent=2))
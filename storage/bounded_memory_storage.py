@@ -0,0 +1,200 @@
+"""Memory storage bounded in size, forgetting the idle conversations."""
+
+import pickle
+import time
+from collections import OrderedDict
+from copy import deepcopy
+from typing import Dict, List
+
+from botbuilder.core import MemoryStorage, StoreItem
+
+
+class BoundedMemoryStorage(MemoryStorage):
+    """MemoryStorage keeping at most max_entries states, none idle too long.
+
+    The least recently used states are evicted first. The size of each state
+    is estimated by the length of its pickle, which is also how it is copied
+    (MemoryStorage deep-copies it twice).
+    """
+
+    def __init__(self, max_entries: int = 10000, idle_ttl: float = 3600.0):
+        """Init the class.
+
+        Args:
+            max_entries (int, optional): maximum number of states kept, 0 for
+                no limit. Defaults to 10000.
+            idle_ttl (float, optional): seconds a state is kept without being
+                read or written, 0 for no limit. Defaults to 3600.0.
+        """
+        super(BoundedMemoryStorage, self).__init__(OrderedDict())
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self._last_used: Dict[str, float] = {}
+        self._sizes: Dict[str, int] = {}
+        # Sizes of the properties written by write_properties(), per state.
+        self._property_sizes: Dict[str, Dict[str, int]] = {}
+        self.bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _forget(self, key: str) -> None:
+        """Remove a state and its bookkeeping."""
+        self.memory.pop(key, None)
+        self._last_used.pop(key, None)
+        self.bytes -= self._sizes.pop(key, 0)
+        self._property_sizes.pop(key, None)
+
+    def _touch(self, key: str, now: float) -> None:
+        """Mark a state as the most recently used."""
+        self.memory.move_to_end(key)
+        self._last_used[key] = now
+
+    def _expire(self, now: float) -> None:
+        """Forget the states idle for too long, the oldest are first."""
+        if self.idle_ttl <= 0:
+            return
+        while self.memory:
+            key = next(iter(self.memory))
+            if now - self._last_used.get(key, now) < self.idle_ttl:
+                break
+            self._forget(key)
+            self.expirations += 1
+
+    def _evict(self) -> None:
+        """Forget the least recently used states beyond the maximum."""
+        while 0 < self.max_entries < len(self.memory):
+            self._forget(next(iter(self.memory)))
+            self.evictions += 1
+
+    async def delete(self, keys: List[str]):
+        for key in keys:
+            self._forget(key)
+
+    async def read(self, keys: List[str]):
+        now = time.monotonic()
+        self._expire(now)
+        data = await super(BoundedMemoryStorage, self).read(keys)
+        for key in data:
+            self._touch(key, now)
+        return data
+
+    async def write(self, changes: Dict[str, StoreItem]):
+        if changes is None:
+            raise Exception("Changes are required when writing")
+        now = time.monotonic()
+        for (key, change) in changes.items():
+            old_state_etag = None
+            if key in self.memory:
+                old_state = self.memory[key]
+                if isinstance(old_state, dict):
+                    old_state_etag = old_state.get("e_tag", None)
+                elif hasattr(old_state, "e_tag"):
+                    old_state_etag = old_state.e_tag
+
+            new_value_etag = None
+            if isinstance(change, dict):
+                new_value_etag = change.get("e_tag", None)
+            elif hasattr(change, "e_tag"):
+                new_value_etag = change.e_tag
+            if new_value_etag == "":
+                raise Exception("memory_storage.write(): etag missing")
+            if (
+                old_state_etag is not None
+                and new_value_etag is not None
+                and new_value_etag != "*"
+                and new_value_etag != old_state_etag
+            ):
+                raise KeyError(
+                    "Etag conflict.\nOriginal: %s\r\nCurrent: %s"
+                    % (new_value_etag, old_state_etag)
+                )
+
+            # One pickle gives both the copy and the size of the state.
+            try:
+                blob = pickle.dumps(change, pickle.HIGHEST_PROTOCOL)
+                new_state = pickle.loads(blob)
+                size = len(blob)
+            except (pickle.PicklingError, TypeError, AttributeError):
+                new_state = deepcopy(change)
+                size = 0
+
+            # If the original object didn't have an e_tag, don't set one (C# behavior)
+            if old_state_etag:
+                if isinstance(new_state, dict):
+                    new_state["e_tag"] = str(self._e_tag)
+                else:
+                    new_state.e_tag = str(self._e_tag)
+            self._e_tag += 1
+
+            self.bytes += size - self._sizes.get(key, 0)
+            self._sizes[key] = size
+            self._property_sizes.pop(key, None)
+            self.memory[key] = new_state
+            self._touch(key, now)
+
+        self._expire(now)
+        self._evict()
+
+    async def write_properties(
+        self, key: str, state: Dict[str, object], changed: List[str], removed: List[str]
+    ) -> bool:
+        """Write only some properties of a state already stored.
+
+        Args:
+            key (str): the key of the state.
+            state (Dict[str, object]): the state, holding the properties changed.
+            changed (List[str]): the properties to copy from state.
+            removed (List[str]): the properties to remove.
+
+        Returns:
+            bool: False when the state is not stored, to be written whole.
+        """
+        stored = self.memory.get(key)
+        if not isinstance(stored, dict):
+            return False
+        e_tag, stored_e_tag = state.get("e_tag"), stored.get("e_tag")
+        if e_tag not in (None, "*") and stored_e_tag is not None and e_tag != stored_e_tag:
+            raise KeyError("Etag conflict.\nOriginal: %s\r\nCurrent: %s" % (e_tag, stored_e_tag))
+
+        try:
+            blobs = {name: pickle.dumps(state[name], pickle.HIGHEST_PROTOCOL) for name in changed}
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return False
+
+        sizes = self._property_sizes.setdefault(key, {})
+        exact = all(name in sizes for name in changed + removed)
+        size_change = 0
+        for name in removed:
+            stored.pop(name, None)
+            size_change -= sizes.pop(name, 0)
+        for name, blob in blobs.items():
+            stored[name] = pickle.loads(blob)
+            size_change += len(blob) - sizes.get(name, 0)
+            sizes[name] = len(blob)
+        if stored_e_tag is not None:
+            stored["e_tag"] = str(self._e_tag)
+        self._e_tag += 1
+
+        # The size of the state is measured again until its properties are known.
+        old_size = self._sizes.get(key, 0)
+        size = old_size + size_change if exact else len(pickle.dumps(stored, pickle.HIGHEST_PROTOCOL))
+        self.bytes += size - old_size
+        self._sizes[key] = size
+        now = time.monotonic()
+        self._touch(key, now)
+        self._expire(now)
+        self._evict()
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        """Return the counters of the storage.
+
+        Returns:
+            Dict[str, int]: entries, bytes held, evictions and expirations.
+        """
+        return {
+            "entries": len(self.memory),
+            "bytes": self.bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
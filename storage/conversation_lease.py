@@ -0,0 +1,152 @@
+"""Leases on the conversations, so only one worker runs a turn of each."""
+
+import asyncio
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+from turn_dispatcher import TurnRejected
+
+
+class ConversationLeases:
+    """Leases of one process: nothing to hold.
+
+    TurnDispatcher already runs the turns of a conversation one after the
+    other within the process.
+    """
+
+    def __init__(self):
+        self.acquired = 0
+        self.contended = 0
+        self.refused = 0
+
+    @asynccontextmanager
+    async def hold(self, conversation_id: str) -> AsyncIterator[None]:
+        """Hold the conversation during a turn.
+
+        Args:
+            conversation_id (str): id of the conversation of the activity.
+        """
+        self.acquired += 1
+        yield
+
+    def stats(self) -> Dict[str, int]:
+        """Return the counters of the leases.
+
+        Returns:
+            Dict[str, int]: leases acquired, acquired after waiting for
+                another worker, and refused after waiting too long.
+        """
+        return {
+            "acquired": self.acquired,
+            "contended": self.contended,
+            "refused": self.refused,
+        }
+
+
+class SqliteConversationLeases(ConversationLeases):
+    """Leases shared by the worker processes through SQLite.
+
+    The kernel gives a connection to any worker, so two messages of a
+    conversation may run on two workers and race on its state. A turn first
+    takes the lease of its conversation in the database of the states, and
+    waits while another worker holds it. A lease not released, e.g. by a
+    worker killed, expires after ttl seconds.
+    """
+
+    # Seconds between two tries to take a lease held, doubled up to the last.
+    POLL_DELAYS = (0.005, 0.01, 0.02, 0.05, 0.1)
+
+    def __init__(self, path: str, ttl: float = 30.0, wait: float = 5.0, retry_after: int = 1):
+        """Init the class.
+
+        Args:
+            path (str): the file of the database.
+            ttl (float, optional): seconds a lease lasts when not released.
+                Defaults to 30.0.
+            wait (float, optional): seconds a turn waits for the lease before
+                being refused. Defaults to 5.0.
+            retry_after (int, optional): seconds given to the channel when
+                the turn is refused. Defaults to 1.
+        """
+        super(SqliteConversationLeases, self).__init__()
+        self.path = path
+        self.ttl = ttl
+        self.wait = wait
+        self.retry_after = retry_after
+        self._connection: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Return the thread of the database of this process."""
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite_lease")
+            self._connection = None
+            self._pid = os.getpid()
+        return self._executor
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Open the database on first use."""
+        if self._connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS lease ("
+                "key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            self._connection = connection
+        return self._connection
+
+    def _acquire(self, key: str, owner: str) -> bool:
+        """Take a lease free or expired, return False when it is held."""
+        now = time.time()
+        cursor = self._get_connection().execute(
+            "INSERT INTO lease(key, owner, expires) VALUES(?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET owner=excluded.owner, expires=excluded.expires "
+            "WHERE expires < ?",
+            (key, owner, now + self.ttl, now),
+        )
+        return cursor.rowcount > 0
+
+    def _release(self, key: str, owner: str) -> None:
+        """Release a lease, unless it expired and was taken by another."""
+        self._get_connection().execute(
+            "DELETE FROM lease WHERE key=? AND owner=?", (key, owner)
+        )
+
+    @asynccontextmanager
+    async def hold(self, conversation_id: str) -> AsyncIterator[None]:
+        """Hold the conversation during a turn.
+
+        Args:
+            conversation_id (str): id of the conversation of the activity.
+
+        Raises:
+            TurnRejected: when another worker held it for wait seconds.
+        """
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + self.wait
+        attempt = 0
+        while not await loop.run_in_executor(executor, self._acquire, conversation_id, owner):
+            if time.monotonic() >= deadline:
+                self.refused += 1
+                raise TurnRejected("conversation held by another worker", self.retry_after)
+            await asyncio.sleep(self.POLL_DELAYS[min(attempt, len(self.POLL_DELAYS) - 1)])
+            attempt += 1
+        self.acquired += 1
+        if attempt:
+            self.contended += 1
+        try:
+            yield
+        finally:
+            await loop.run_in_executor(executor, self._release, conversation_id, owner)
@@ -0,0 +1,126 @@
+"""Bot states writing only what changed during the turn.
+
+BotState fingerprints a state with jsonpickle when it is loaded and twice
+more when it is saved, and writes the whole state when the fingerprint
+changed. Here each property of the state is fingerprinted by the digest of
+its pickle, computed once at the load and once at the save:
+- a state unchanged is not written;
+- a storage with write_properties() receives only the properties changed
+  and removed, the others receive the whole state.
+"""
+
+import hashlib
+import pickle
+from typing import Dict, Optional, Tuple
+
+from botbuilder.core import ConversationState, TurnContext, UserState
+from botbuilder.core.bot_state import CachedBotState
+from jsonpickle.pickler import Pickler
+
+# Key of the version of a state, which is not a property.
+E_TAG = "e_tag"
+
+# Per property: the digest of its pickle and the length of the pickle.
+Fingerprint = Dict[str, Tuple[bytes, int]]
+
+
+def fingerprint(state: Optional[dict]) -> Fingerprint:
+    """Return the fingerprints of the properties of a state."""
+    prints: Fingerprint = {}
+    for name, value in (state or {}).items():
+        if name == E_TAG:
+            continue
+        try:
+            blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # Compared as BotState does.
+            blob = str(Pickler().flatten(value)).encode("utf-8")
+        prints[name] = (hashlib.blake2b(blob, digest_size=16).digest(), len(blob))
+    return prints
+
+
+class _Fingerprinted_state(CachedBotState):
+    """CachedBotState whose hash is the fingerprints of its properties."""
+
+    def compute_hash(self, obj: object) -> Fingerprint:
+        return fingerprint(obj)
+
+
+class DeltaStateMixin:
+    """Mixin of a BotState, saving only the properties changed during the turn.
+
+    Placed before the BotState in the bases, e.g.
+    class DeltaConversationState(DeltaStateMixin, ConversationState).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(DeltaStateMixin, self).__init__(*args, **kwargs)
+        self.saves = 0
+        self.skipped = 0
+        self.full_writes = 0
+        self.delta_writes = 0
+        self.bytes_written = 0
+
+    async def load(self, turn_context: TurnContext, force: bool = False) -> None:
+        cached_state = self.get_cached_state(turn_context)
+        if force or not cached_state or not cached_state.state:
+            storage_key = self.get_storage_key(turn_context)
+            items = await self._storage.read([storage_key])
+            turn_context.turn_state[self._context_service_key] = _Fingerprinted_state(
+                items.get(storage_key)
+            )
+
+    async def save_changes(self, turn_context: TurnContext, force: bool = False) -> None:
+        self.saves += 1
+        cached_state = self.get_cached_state(turn_context)
+        if cached_state is None:
+            # Not loaded during the turn.
+            self.skipped += 1
+            return
+
+        loaded = cached_state.hash if isinstance(cached_state.hash, dict) else None
+        current = fingerprint(cached_state.state)
+        changed = [
+            name for name, value in current.items() if not loaded or loaded.get(name) != value
+        ]
+        removed = [name for name in loaded or () if name not in current]
+        if not (force or changed or removed or loaded is None):
+            self.skipped += 1
+            return
+
+        storage_key = self.get_storage_key(turn_context)
+        write_properties = getattr(self._storage, "write_properties", None)
+        if loaded and write_properties is not None and not force and await write_properties(
+            storage_key, cached_state.state, changed, removed
+        ):
+            self.delta_writes += 1
+            self.bytes_written += sum(current[name][1] for name in changed)
+        else:
+            await self._storage.write({storage_key: cached_state.state})
+            self.full_writes += 1
+            self.bytes_written += sum(size for _, size in current.values())
+        cached_state.hash = current
+
+    def stats(self) -> Dict[str, int]:
+        """Return the counters of the saves.
+
+        Returns:
+            Dict[str, int]: saves asked, skipped as nothing changed, writes
+                of the whole state and of the properties changed, and the
+                bytes of the properties written.
+        """
+        return {
+            "saves": self.saves,
+            "skipped": self.skipped,
+            "full_writes": self.full_writes,
+            "delta_writes": self.delta_writes,
+            "bytes_written": self.bytes_written,
+        }
+
+
+class DeltaConversationState(DeltaStateMixin, ConversationState):
+    """ConversationState saving only what changed."""
+
+
+class DeltaUserState(DeltaStateMixin, UserState):
+    """UserState saving only what changed."""
@@ -0,0 +1,321 @@
+"""Storage of the states in a SQLite file shared by the worker processes."""
+
+import asyncio
+import os
+import pickle
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from botbuilder.core import Storage, StoreItem
+
+
+class StateConflict(KeyError):
+    """A state was written by another process since it was read.
+
+    The turn is not saved; the state written by the other process is kept.
+    """
+
+
+class SqliteStorage(Storage):
+    """Storage of pickled states in SQLite, in WAL mode.
+
+    - Optimistic concurrency: every state read gets the e_tag of its row. A
+      write with an e_tag other than "*" fails with a StateConflict, a
+      KeyError as for MemoryStorage, when another process wrote the row in
+      between.
+    - Batched writes: the writes of the concurrent turns are committed
+      together, in one transaction, each in its own savepoint.
+    - Read cache: the last pickles read or written are kept with their e_tag
+      and only the e_tags are read back to validate them.
+
+    The database is only used from one thread per process, created lazily so
+    the storage can be built before the workers fork.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        idle_ttl: float = 0.0,
+        batch_delay: float = 0.0,
+        cache_size: int = 10000,
+    ):
+        """Init the class.
+
+        Args:
+            path (str): the file of the database.
+            idle_ttl (float, optional): seconds a state is kept without being
+                written, 0 for ever. Defaults to 0.0.
+            batch_delay (float, optional): seconds a write waits for others
+                to share its transaction. The writes arriving while a
+                transaction commits are batched anyway. Defaults to 0.0.
+            cache_size (int, optional): pickles kept in the read cache, 0 for
+                no cache. Defaults to 10000.
+        """
+        super(SqliteStorage, self).__init__()
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self.batch_delay = batch_delay
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Tuple[int, bytes]]" = OrderedDict()
+        self._pending: List[Tuple[List[Tuple[str, Optional[int], bytes]], asyncio.Future]] = []
+        self._flusher: Optional[asyncio.Future] = None
+        self._connection: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._last_purge = time.time()
+        self.reads = 0
+        self.cache_hits = 0
+        self.writes = 0
+        self.transactions = 0
+        self.conflicts = 0
+
+    #
+    # Database, used from the thread of the executor only
+    #
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Return the thread of the database of this process."""
+        if self._executor is None or self._pid != os.getpid():
+            # After a fork, the thread and connection of the parent are unusable.
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+            self._connection = None
+            self._pid = os.getpid()
+            self._pending = []
+            self._flusher = None
+        return self._executor
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Open the database on first use."""
+        if self._connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS state ("
+                "key TEXT PRIMARY KEY, e_tag INTEGER NOT NULL, "
+                "data BLOB NOT NULL, updated REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS state_updated ON state(updated)")
+            self._connection = connection
+        return self._connection
+
+    def _read_rows(
+        self, keys: List[str], cached: Dict[str, int]
+    ) -> Dict[str, Tuple[int, Optional[bytes]]]:
+        """Read the rows, without the data of the ones still in the cache."""
+        connection = self._get_connection()
+        marks = ",".join("?" * len(keys))
+        e_tags = dict(
+            connection.execute(f"SELECT key, e_tag FROM state WHERE key IN ({marks})", keys)
+        )
+        rows = {key: (e_tag, None) for key, e_tag in e_tags.items() if cached.get(key) == e_tag}
+        stale = [key for key in e_tags if key not in rows]
+        if stale:
+            marks = ",".join("?" * len(stale))
+            for key, e_tag, data in connection.execute(
+                f"SELECT key, e_tag, data FROM state WHERE key IN ({marks})", stale
+            ):
+                rows[key] = (e_tag, data)
+        return rows
+
+    def _write_one(
+        self, connection: sqlite3.Connection, key: str, e_tag: Optional[int], data: bytes, now: float
+    ) -> int:
+        """Write a row and return its new e_tag."""
+        if e_tag is None:
+            connection.execute(
+                "INSERT INTO state(key, e_tag, data, updated) VALUES(?, 1, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET "
+                "e_tag=e_tag+1, data=excluded.data, updated=excluded.updated",
+                (key, data, now),
+            )
+        else:
+            cursor = connection.execute(
+                "UPDATE state SET e_tag=e_tag+1, data=?, updated=? WHERE key=? AND e_tag=?",
+                (data, now, key, e_tag),
+            )
+            if cursor.rowcount == 0:
+                current = connection.execute(
+                    "SELECT e_tag FROM state WHERE key=?", (key,)
+                ).fetchone()
+                if current is not None:
+                    raise StateConflict(
+                        "Etag conflict.\nOriginal: %s\r\nCurrent: %s" % (e_tag, current[0])
+                    )
+                connection.execute(
+                    "INSERT INTO state(key, e_tag, data, updated) VALUES(?, 1, ?, ?)",
+                    (key, data, now),
+                )
+        return connection.execute("SELECT e_tag FROM state WHERE key=?", (key,)).fetchone()[0]
+
+    def _write_batch(
+        self, batch: List[List[Tuple[str, Optional[int], bytes]]]
+    ) -> List[object]:
+        """Commit the writes of several turns in one transaction.
+
+        Returns:
+            List[object]: for each write, the new e_tags or the StateConflict.
+        """
+        connection = self._get_connection()
+        now = time.time()
+        results = []
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for entries in batch:
+                connection.execute("SAVEPOINT turn")
+                try:
+                    results.append(
+                        {key: self._write_one(connection, key, e_tag, data, now)
+                         for key, e_tag, data in entries}
+                    )
+                    connection.execute("RELEASE turn")
+                except StateConflict as error:
+                    connection.execute("ROLLBACK TO turn")
+                    connection.execute("RELEASE turn")
+                    results.append(error)
+            if self.idle_ttl > 0 and now - self._last_purge > 60:
+                connection.execute("DELETE FROM state WHERE updated < ?", (now - self.idle_ttl,))
+                self._last_purge = now
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return results
+
+    def _delete_rows(self, keys: List[str]) -> None:
+        """Delete the rows."""
+        marks = ",".join("?" * len(keys))
+        self._get_connection().execute(f"DELETE FROM state WHERE key IN ({marks})", keys)
+
+    #
+    # Cache
+    #
+    def _remember(self, key: str, e_tag: int, data: bytes) -> None:
+        """Keep a pickle in the read cache."""
+        if self.cache_size <= 0:
+            return
+        self._cache[key] = (e_tag, data)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    @staticmethod
+    def _with_e_tag(item: object, e_tag: int) -> object:
+        """Give the e_tag of its row to a state."""
+        if isinstance(item, dict):
+            item["e_tag"] = str(e_tag)
+        elif hasattr(item, "e_tag"):
+            item.e_tag = str(e_tag)
+        return item
+
+    @staticmethod
+    def _expected_e_tag(item: object) -> Optional[int]:
+        """Return the e_tag a write expects, None for an unconditional one."""
+        e_tag = item.get("e_tag") if isinstance(item, dict) else getattr(item, "e_tag", None)
+        if e_tag == "":
+            raise Exception("sqlite_storage.write(): etag missing")
+        if e_tag is None or e_tag == "*":
+            return None
+        try:
+            return int(e_tag)
+        except ValueError:
+            return None
+
+    #
+    # Storage
+    #
+    async def read(self, keys: List[str]) -> Dict[str, object]:
+        if not keys:
+            return {}
+        executor = self._get_executor()
+        # The pickles are taken now: another turn may delete or evict them
+        # from the cache while the rows are read.
+        cached = {key: self._cache[key] for key in keys if key in self._cache}
+        rows = await asyncio.get_running_loop().run_in_executor(
+            executor,
+            self._read_rows,
+            list(keys),
+            {key: e_tag for key, (e_tag, _) in cached.items()},
+        )
+        data = {}
+        for key, (e_tag, blob) in rows.items():
+            self.reads += 1
+            if blob is None:
+                self.cache_hits += 1
+                blob = cached[key][1]
+            self._remember(key, e_tag, blob)
+            data[key] = self._with_e_tag(pickle.loads(blob), e_tag)
+        return data
+
+    async def write(self, changes: Dict[str, StoreItem]):
+        if changes is None:
+            raise Exception("Changes are required when writing")
+        if not changes:
+            return
+        executor = self._get_executor()
+        entries = [
+            (key, self._expected_e_tag(change), pickle.dumps(change, pickle.HIGHEST_PROTOCOL))
+            for key, change in changes.items()
+        ]
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((entries, future))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.ensure_future(self._flush(executor))
+        new_e_tags = await future
+        for key, _, blob in entries:
+            self._remember(key, new_e_tags[key], blob)
+
+    async def _flush(self, executor: ThreadPoolExecutor) -> None:
+        """Commit the pending writes, batch after batch."""
+        loop = asyncio.get_running_loop()
+        while self._pending:
+            await asyncio.sleep(self.batch_delay)
+            batch, self._pending = self._pending, []
+            try:
+                results = await loop.run_in_executor(
+                    executor, self._write_batch, [entries for entries, _ in batch]
+                )
+            except Exception as error:  # pylint: disable=broad-except
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            self.transactions += 1
+            for (_, future), result in zip(batch, results):
+                self.writes += 1
+                if future.done():
+                    # The turn was cancelled, the write is committed anyway.
+                    continue
+                if isinstance(result, StateConflict):
+                    self.conflicts += 1
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    async def delete(self, keys: List[str]):
+        if not keys:
+            return
+        executor = self._get_executor()
+        for key in keys:
+            self._cache.pop(key, None)
+        await asyncio.get_running_loop().run_in_executor(executor, self._delete_rows, list(keys))
+
+    def stats(self) -> Dict[str, int]:
+        """Return the counters of the storage.
+
+        Returns:
+            Dict[str, int]: reads, read cache hits, writes, transactions,
+                e_tag conflicts and pickles cached.
+        """
+        return {
+            "reads": self.reads,
+            "cache_hits": self.cache_hits,
+            "writes": self.writes,
+            "transactions": self.transactions,
+            "conflicts": self.conflicts,
+            "cached": len(self._cache),
+        }
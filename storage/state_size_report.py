@@ -0,0 +1,160 @@
+"""Report the size of the states of the conversations replayed through the bot.
+
+The conversations (the Frames dialogs, or a JSON file holding a list of
+conversations, each a list of texts) are played one after the other through
+the dialogs of the bot, in memory. Every state written is pickled as the
+storages do, and the distribution of the sizes is reported with the time
+taken by the pickling, overall and per turn of the conversations. The
+messages are recognized as by app.py, e.g. by the replayed LUIS answers:
+
+    python shared_code/load_testing/luis_replay_server.py --port 5050
+    set LuisAPIHostName=http://localhost:5050
+    python storage/state_size_report.py --conversations convs.json --max-turns 30
+"""
+
+# Load the libraries
+from typing import Dict, List
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import pickle
+import sys
+import time
+
+sys.path.append(os.getcwd())
+from botbuilder.core import ConversationState, StoreItem, UserState
+from botbuilder.core.adapters import TestAdapter
+from botbuilder.schema import ChannelAccount, ConversationAccount, ConversationReference
+from config import DefaultConfig
+from storage import BoundedMemoryStorage
+
+PERCENTILES = (50, 90, 99)
+
+
+class _Measuring_storage(BoundedMemoryStorage):
+    """BoundedMemoryStorage noting the pickle of the conversation states written."""
+
+    def __init__(self):
+        super(_Measuring_storage, self).__init__(0, 0)
+        self.turn = 0
+        # Per state written: the turn, its size, and the seconds to pickle and unpickle it.
+        self.writes: List[tuple] = []
+
+    async def write(self, changes: Dict[str, StoreItem]):
+        for key, change in changes.items():
+            if "/conversations/" in key:
+                started = time.perf_counter()
+                blob = pickle.dumps(change, pickle.HIGHEST_PROTOCOL)
+                dumped = time.perf_counter()
+                pickle.loads(blob)
+                loaded = time.perf_counter()
+                self.writes.append((self.turn, len(blob), dumped - started, loaded - dumped))
+        await super(_Measuring_storage, self).write(changes)
+
+
+def distribution(values: List[float], scale: float = 1.0) -> Dict[str, float]:
+    """Summarize values by their percentiles, mean and maximum."""
+    if not values:
+        return {}
+    ordered = sorted(values)
+    summary = {
+        f"p{percentile}": round(
+            scale * ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))], 1
+        )
+        for percentile in PERCENTILES
+    }
+    summary["mean"] = round(scale * sum(ordered) / len(ordered), 1)
+    summary["max"] = round(scale * ordered[-1], 1)
+    return summary
+
+
+def create_bot(config: DefaultConfig, storage: BoundedMemoryStorage):
+    """Create the bot as app.py does, on storage."""
+    from bots import DialogAndWelcomeBot
+    from cascading_recognizer import Cascading_recognizer
+    from dialogs.main_dialog import MainDialog
+    from dialogs.slot_filling_dialog import Slot_filling_dialog
+    from dialogs.specifying_dialog import Specifying_dialog
+    from journey_details import UtteranceLog
+    from journey_specifier_recognizer import Journey_specifier_recognizer
+    from local_journey_recognizer import Local_journey_recognizer
+
+    UtteranceLog.max_utterances = config.UTTERANCE_LOG_SIZE
+    local_recognizer = Local_journey_recognizer(config)
+    recognizer = Journey_specifier_recognizer(
+        config, fallback=local_recognizer if local_recognizer.is_configured else None
+    )
+    if not recognizer.is_configured and local_recognizer.is_configured:
+        recognizer = local_recognizer
+    recognizer = Cascading_recognizer(config, recognizer, local_recognizer.model)
+    specifying_dialog = (
+        Slot_filling_dialog() if config.DIALOG_MODE == "slot_filling" else Specifying_dialog()
+    )
+    dialog = MainDialog(recognizer, specifying_dialog)
+    return DialogAndWelcomeBot(ConversationState(storage), UserState(storage), dialog, None)
+
+
+async def main(arguments: argparse.Namespace) -> Dict[str, object]:
+    """Replay the conversations and report the sizes of their states."""
+    from shared_code.load_testing.load_generator import load_conversations
+
+    storage = _Measuring_storage()
+    bot = create_bot(DefaultConfig(), storage)
+    conversations = load_conversations(arguments.conversations, arguments.max_turns)
+    if arguments.limit:
+        conversations = conversations[: arguments.limit]
+    errors = 0
+    for index, conversation in enumerate(conversations):
+        adapter = TestAdapter(
+            bot.on_turn,
+            ConversationReference(
+                channel_id="test",
+                service_url="https://test.com",
+                user=ChannelAccount(id=f"user{index}", name="user"),
+                bot=ChannelAccount(id="bot", name="Bot"),
+                conversation=ConversationAccount(id=f"conversation{index}"),
+            ),
+        )
+        for storage.turn, text in enumerate(conversation, 1):
+            try:
+                await adapter.send(text)
+            except Exception:  # pylint: disable=broad-except
+                errors += 1
+
+    per_turn: Dict[int, List[int]] = {}
+    for turn, size, _, _ in storage.writes:
+        per_turn.setdefault(turn, []).append(size)
+    last_per_turn = max(per_turn) if per_turn else 0
+    return {
+        "conversations": len(conversations),
+        "states_written": len(storage.writes),
+        "turn_errors": errors,
+        "state_bytes": distribution([size for _, size, _, _ in storage.writes]),
+        "pickle_us": distribution([dump for _, _, dump, _ in storage.writes], 1e6),
+        "unpickle_us": distribution([load for _, _, _, load in storage.writes], 1e6),
+        "state_bytes_per_turn": {
+            turn: distribution(per_turn[turn])
+            for turn in range(1, last_per_turn + 1, arguments.turn_step)
+            if turn in per_turn
+        },
+    }
+
+
+# Run the report
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--conversations", help="JSON file of conversations, else Frames")
+    parser.add_argument("--max-turns", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=0, help="conversations replayed, 0 for all")
+    parser.add_argument("--turn-step", type=int, default=5, help="turns between the rows per turn")
+    parser.add_argument("--output", help="JSON file of the report, else printed")
+    ARGUMENTS = parser.parse_args()
+    logging.disable(logging.WARNING)
+    REPORT = asyncio.run(main(ARGUMENTS))
+    if ARGUMENTS.output:
+        with open(ARGUMENTS.output, "w", encoding="utf-8") as file:
+            json.dump(REPORT, file, indent=2)
+    print(json.dumps(REPORT, indent=2))
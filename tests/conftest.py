@@ -0,0 +1,104 @@
+"""Fixtures shared by the tests."""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from botbuilder.core import TurnContext
+from botbuilder.core.adapters import TestAdapter
+from botbuilder.schema import Activity, ActivityTypes, ChannelAccount, ConversationAccount
+
+from local_journey_recognizer import Local_journey_model, features
+
+# Words of each intent of the model built for the tests.
+TRAINING = {
+    "Specify_journey": "i want to go to paris from london fly travel trip",
+    "Greetings": "hi hello hey good morning",
+    "Help": "help what can you do",
+    "None": "the weather is nice today",
+}
+CITIES = ["paris", "london", "new york", "berlin"]
+
+
+def make_activity(text: str, conversation_id: str = "conversation", activity_id: str = "1") -> Activity:
+    """Return a message activity of the tests."""
+    return Activity(
+        type=ActivityTypes.message,
+        id=activity_id,
+        text=text,
+        channel_id="test",
+        service_url="https://test.com",
+        conversation=ConversationAccount(id=conversation_id),
+        from_property=ChannelAccount(id="user"),
+        recipient=ChannelAccount(id="bot"),
+    )
+
+
+def make_turn_context(text: str, conversation_id: str = "conversation", activity_id: str = "1") -> TurnContext:
+    """Return the context of a turn receiving a message."""
+    return TurnContext(TestAdapter(), make_activity(text, conversation_id, activity_id))
+
+
+@pytest.fixture
+def local_model() -> Local_journey_model:
+    """A small model: each intent is known by a few words."""
+    intents = list(TRAINING)
+    vocabulary = sorted({feature for text in TRAINING.values() for feature in features(text.split())})
+    counts = np.ones((len(intents), len(vocabulary)))
+    for row, text in enumerate(TRAINING.values()):
+        for feature in features(text.split()):
+            counts[row, vocabulary.index(feature)] += 10
+    return Local_journey_model(
+        intents=intents,
+        vocabulary=vocabulary,
+        log_prior=np.log(np.full(len(intents), 1 / len(intents))),
+        log_likelihood=np.log(counts / counts.sum(axis=1, keepdims=True)),
+        cities=CITIES,
+    )
+
+
+@pytest.fixture
+def local_model_path(tmp_path, local_model) -> str:
+    """The file of the small model."""
+    path = str(tmp_path / "model.npz")
+    local_model.save(path)
+    return path
+
+
+def make_bot(recognizer, specifying_dialog=None, storage=None):
+    """Return the bot of app.py on a recognizer, with its states in memory."""
+    from botbuilder.core import ConversationState, MemoryStorage, UserState
+
+    from bots import DialogAndWelcomeBot
+    from dialogs.main_dialog import MainDialog
+    from dialogs.specifying_dialog import Specifying_dialog
+
+    storage = storage if storage is not None else MemoryStorage()
+    dialog = MainDialog(recognizer, specifying_dialog or Specifying_dialog())
+    return DialogAndWelcomeBot(ConversationState(storage), UserState(storage), dialog, None)
+
+
+async def converse(bot, texts, conversation_id: str = "conversation"):
+    """Send the texts to the bot, one turn each, and return the replies of each turn."""
+    from botbuilder.schema import ConversationReference
+
+    adapter = TestAdapter(
+        bot.on_turn,
+        ConversationReference(
+            channel_id="test",
+            service_url="https://test.com",
+            user=ChannelAccount(id="user"),
+            bot=ChannelAccount(id="bot"),
+            conversation=ConversationAccount(id=conversation_id),
+        ),
+    )
+    replies = []
+    for text in texts:
+        adapter.activity_buffer.clear()
+        await adapter.send(text)
+        replies.append([activity.text for activity in adapter.activity_buffer])
+    return replies
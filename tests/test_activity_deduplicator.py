@@ -0,0 +1,78 @@
+"""Tests of the suppression of the activities posted again by the channel."""
+
+import asyncio
+
+from storage import ActivityDeduplicator, SqliteActivityDeduplicator
+from storage import activity_deduplicator
+
+
+def _run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def _clock(monkeypatch, start=1000.0):
+    now = [start]
+    monkeypatch.setattr(activity_deduplicator.time, "time", lambda: now[0])
+    return now
+
+
+def test_key():
+    assert ActivityDeduplicator.key("conversation", "1") == "conversation/1"
+    assert ActivityDeduplicator.key(None, "1") == "/1"
+    assert ActivityDeduplicator.key("conversation", None) is None
+
+
+def test_retry_within_the_window(monkeypatch):
+    now = _clock(monkeypatch)
+    deduplicator = ActivityDeduplicator(window=60)
+
+    assert not _run(deduplicator.is_duplicate("c/1"))
+    now[0] += 30
+    assert _run(deduplicator.is_duplicate("c/1"))
+    assert not _run(deduplicator.is_duplicate("c/2"))
+    assert not _run(deduplicator.is_duplicate(None))
+    assert deduplicator.stats() == {"activities": 3, "duplicates": 1, "remembered": 2}
+
+
+def test_retry_after_the_window(monkeypatch):
+    now = _clock(monkeypatch)
+    deduplicator = ActivityDeduplicator(window=60)
+    _run(deduplicator.is_duplicate("c/1"))
+    now[0] += 61
+
+    assert not _run(deduplicator.is_duplicate("c/1"))
+
+
+def test_oldest_forgotten_beyond_the_limit():
+    deduplicator = ActivityDeduplicator(max_entries=2)
+    for key in ("c/1", "c/2", "c/3"):
+        _run(deduplicator.is_duplicate(key))
+
+    assert not _run(deduplicator.is_duplicate("c/1"))
+    assert deduplicator.stats()["remembered"] == 2
+
+
+def test_forget_failed_turn():
+    deduplicator = ActivityDeduplicator()
+    _run(deduplicator.is_duplicate("c/1"))
+
+    _run(deduplicator.forget("c/1"))
+
+    assert not _run(deduplicator.is_duplicate("c/1"))
+
+
+def test_shared_between_processes(tmp_path, monkeypatch):
+    now = _clock(monkeypatch)
+    path = str(tmp_path / "state.db")
+    # Each deduplicator on the file stands for a worker.
+    first = SqliteActivityDeduplicator(path, window=60)
+
+    assert not _run(first.is_duplicate("c/1"))
+    assert _run(SqliteActivityDeduplicator(path, window=60).is_duplicate("c/1"))
+
+    _run(first.forget("c/1"))
+    assert not _run(SqliteActivityDeduplicator(path, window=60).is_duplicate("c/1"))
+
+    _run(first.is_duplicate("c/2"))
+    now[0] += 61
+    assert not _run(SqliteActivityDeduplicator(path, window=60).is_duplicate("c/2"))
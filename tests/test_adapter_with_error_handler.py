@@ -0,0 +1,77 @@
+"""Tests of the adapter: the errors of the turns and the messages held."""
+
+import asyncio
+
+import pytest
+from botbuilder.core import BotFrameworkAdapterSettings, ConversationState, MemoryStorage
+
+from adapter_with_error_handler import AdapterWithErrorHandler
+from helpers.outbound_batching import OutboundBatchPolicy
+from storage import StateConflict
+
+from tests.conftest import make_activity
+
+
+def _adapter(policy: str = ""):
+    """Return an adapter recording the activities it sends, and its state."""
+    conversation_state = ConversationState(MemoryStorage())
+    adapter = AdapterWithErrorHandler(
+        BotFrameworkAdapterSettings("", ""),
+        conversation_state,
+        OutboundBatchPolicy.from_setting(policy),
+    )
+    adapter.sent = []
+
+    async def send(context, activities):
+        adapter.sent.append([activity.text for activity in activities])
+        return []
+
+    adapter._send = send
+    return adapter, conversation_state
+
+
+async def _turn(adapter, conversation_state, error: Exception = None):
+    """Run a turn saving a property, sending two messages and raising error."""
+
+    async def logic(context):
+        await conversation_state.load(context)
+        await conversation_state.create_property("turns").set(context, 1)
+        await conversation_state.save_changes(context)
+        await context.send_activity("first")
+        await context.send_activity("second")
+        if error is not None:
+            raise error
+
+    await adapter.process_activity(make_activity("hi"), "", logic)
+
+
+def _saved(conversation_state) -> bool:
+    return bool(conversation_state._storage.memory)
+
+
+def test_messages_merged_at_the_end_of_the_turn():
+    adapter, conversation_state = _adapter("test:merge")
+    asyncio.run(_turn(adapter, conversation_state))
+    assert adapter.sent == [["first\n\nsecond"]]
+
+
+def test_error_clears_the_state():
+    adapter, conversation_state = _adapter("test:merge")
+    asyncio.run(_turn(adapter, conversation_state, RuntimeError("bug")))
+    assert adapter.sent[0] == ["first\n\nsecond"]
+    assert "The bot encountered an error or bug." in adapter.sent[1]
+    assert not _saved(conversation_state)
+
+
+@pytest.mark.parametrize("policy", ["", "test:merge"])
+def test_state_conflict_keeps_the_state(policy):
+    adapter, conversation_state = _adapter(policy)
+    with pytest.raises(StateConflict):
+        asyncio.run(_turn(adapter, conversation_state, StateConflict("Etag conflict")))
+    assert _saved(conversation_state)
+    if policy:
+        # Held, the messages are dropped: the retry of the turn sends them.
+        assert adapter.sent == []
+    else:
+        # Already sent, they will be sent again by the retry.
+        assert adapter.sent == [["first"], ["second"]]
@@ -0,0 +1,88 @@
+"""Tests of the memory storage bounded in size and idle time."""
+
+import asyncio
+import pickle
+
+import pytest
+
+from storage import BoundedMemoryStorage
+from storage import bounded_memory_storage
+
+
+def _run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_least_recently_used_evicted():
+    storage = BoundedMemoryStorage(max_entries=2, idle_ttl=0)
+    _run(storage.write({"a": {"value": 1}, "b": {"value": 2}}))
+    _run(storage.read(["a"]))
+
+    _run(storage.write({"c": {"value": 3}}))
+
+    assert sorted(_run(storage.read(["a", "b", "c"]))) == ["a", "c"]
+    assert storage.stats()["evictions"] == 1
+
+
+def test_idle_state_expires(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(bounded_memory_storage.time, "monotonic", lambda: now[0])
+    storage = BoundedMemoryStorage(max_entries=0, idle_ttl=60)
+    _run(storage.write({"idle": {"value": 1}}))
+    now[0] += 30
+    _run(storage.write({"used": {"value": 2}}))
+    now[0] += 40
+
+    assert list(_run(storage.read(["idle", "used"]))) == ["used"]
+    assert storage.stats()["expirations"] == 1
+
+
+def test_e_tag_conflict():
+    storage = BoundedMemoryStorage()
+    _run(storage.write({"key": {"value": 0, "e_tag": "*"}}))
+    _run(storage.write({"key": {"value": 1, "e_tag": "*"}}))
+    stored = dict(_run(storage.read(["key"]))["key"])
+
+    _run(storage.write({"key": dict(stored, value=2)}))
+
+    with pytest.raises(KeyError):
+        _run(storage.write({"key": dict(stored, value=3)}))
+    assert _run(storage.read(["key"]))["key"]["value"] == 2
+
+
+def test_bytes_follow_the_writes():
+    storage = BoundedMemoryStorage()
+    state = {"value": "x" * 100}
+    _run(storage.write({"key": state}))
+
+    assert storage.stats()["bytes"] == len(pickle.dumps(state, pickle.HIGHEST_PROTOCOL))
+
+    _run(storage.delete(["key"]))
+
+    assert storage.stats() == {"entries": 0, "bytes": 0, "evictions": 0, "expirations": 0}
+
+
+def test_write_properties():
+    storage = BoundedMemoryStorage()
+    state = {"kept": 1, "changed": 1, "removed": 1, "e_tag": "*"}
+    _run(storage.write({"key": state}))
+    _run(storage.write({"key": state}))
+    stored = dict(_run(storage.read(["key"]))["key"])
+
+    written = _run(
+        storage.write_properties("key", dict(stored, changed=2), ["changed"], ["removed"])
+    )
+
+    after = _run(storage.read(["key"]))["key"]
+    assert written
+    assert (after["kept"], after["changed"], "removed" in after) == (1, 2, False)
+    assert after["e_tag"] != stored["e_tag"]
+    assert storage.stats()["bytes"] == len(pickle.dumps(after, pickle.HIGHEST_PROTOCOL))
+    with pytest.raises(KeyError):
+        _run(storage.write_properties("key", dict(stored, changed=3), ["changed"], []))
+
+
+def test_write_properties_of_unknown_state():
+    storage = BoundedMemoryStorage()
+
+    assert not _run(storage.write_properties("key", {"changed": 1}, ["changed"], []))
@@ -0,0 +1,68 @@
+"""Tests of the card templates and of their reload."""
+
+import json
+import os
+
+from helpers.card_templates import CardTemplate, CardTemplateEngine
+
+TEMPLATE = {
+    "type": "AdaptiveCard",
+    "body": [
+        {"type": "TextBlock", "text": "${sentences.title}"},
+        {"type": "TextBlock", "text": "Hello ${user}, ${missing}!"},
+    ],
+}
+
+
+def test_render_fills_the_placeholders():
+    card = CardTemplate(TEMPLATE).render({"sentences": {"title": "Fly me"}, "user": "Ann"})
+    assert card["body"][0]["text"] == "Fly me"
+    assert card["body"][1]["text"] == "Hello Ann, ${missing}!"
+    # The template is left untouched.
+    assert TEMPLATE["body"][0]["text"] == "${sentences.title}"
+
+
+def _write(path, content, mtime):
+    with open(path, "w", encoding="utf-8") as card_file:
+        card_file.write(content if isinstance(content, str) else json.dumps(content))
+    os.utime(path, (mtime, mtime))
+
+
+def _engine(tmp_path):
+    template_path, data_path = str(tmp_path / "card.json"), str(tmp_path / "data.json")
+    _write(template_path, TEMPLATE, 1000)
+    _write(data_path, {"sentences": {"title": "First"}}, 1000)
+    engine = CardTemplateEngine(check_interval=0)
+    engine.register("welcome", template_path, data_path)
+    return engine, data_path
+
+
+def _title(engine) -> str:
+    return engine.attachment("welcome").content["body"][0]["text"]
+
+
+def test_changed_file_is_reloaded(tmp_path):
+    engine, data_path = _engine(tmp_path)
+    first = engine.attachment("welcome")
+    assert engine.attachment("welcome") is first
+
+    _write(data_path, {"sentences": {"title": "Second"}}, 2000)
+    assert _title(engine) == "Second"
+    assert engine.reloads == 1
+
+
+def test_file_caught_while_written_keeps_the_card(tmp_path):
+    engine, data_path = _engine(tmp_path)
+    _write(data_path, '{"sentences": {"ti', 2000)
+    assert _title(engine) == "First"
+    assert engine.reloads == 0
+
+    # Loaded at the next check, once written.
+    _write(data_path, {"sentences": {"title": "Second"}}, 3000)
+    assert _title(engine) == "Second"
+
+
+def test_file_being_replaced_keeps_the_card(tmp_path):
+    engine, data_path = _engine(tmp_path)
+    os.remove(data_path)
+    assert _title(engine) == "First"
@@ -0,0 +1,100 @@
+"""Tests of the local tier answering the prompts before LUIS."""
+
+import asyncio
+
+from botbuilder.core import IntentScore, Recognizer, RecognizerResult
+
+from cascading_recognizer import LOCAL_TIER, LUIS_TIER, Cascading_recognizer, parse_thresholds
+from config import DefaultConfig
+from helpers.recognition_cache import EXPECTED_PROMPT_KEY, TurnRecognitionCache
+
+from tests.conftest import make_turn_context
+
+
+class _Counting_recognizer(Recognizer):
+    """Stand-in for LUIS counting its calls."""
+
+    is_configured = True
+
+    def __init__(self, cities=()):
+        self.calls = 0
+        self.cities = list(cities)
+
+    async def recognize(self, turn_context):
+        self.calls += 1
+        return RecognizerResult(
+            text=turn_context.activity.text,
+            intents={"Specify_journey": IntentScore(0.9)},
+            entities={"geographyV2_city": self.cities} if self.cities else {},
+        )
+
+
+def _recognize(recognizer, text, prompt=None, turn_context=None):
+    turn_context = turn_context or make_turn_context(text)
+    if prompt is not None:
+        turn_context.turn_state[EXPECTED_PROMPT_KEY] = prompt
+    return asyncio.run(recognizer.recognize(turn_context))
+
+
+def test_parse_thresholds():
+    assert parse_thresholds("destination:0.5, budget : 0.6,bad") == {"destination": 0.5, "budget": 0.6}
+    assert parse_thresholds("") == {}
+
+
+def test_known_city_answered_locally(local_model):
+    luis = _Counting_recognizer()
+    recognizer = Cascading_recognizer(DefaultConfig(), luis, local_model)
+
+    result = _recognize(recognizer, "to New York please", "destination")
+
+    assert result.entities["To_place"] == ["New York"]
+    assert luis.calls == 0
+    assert recognizer.stats() == {LOCAL_TIER: {"destination": 1}, LUIS_TIER: {}}
+
+
+def test_date_and_budget_answered_locally(local_model):
+    luis = _Counting_recognizer()
+    recognizer = Cascading_recognizer(DefaultConfig(), luis, local_model)
+
+    date = _recognize(recognizer, "June 5 2023", "departure_date")
+    budget = _recognize(recognizer, "500", "budget")
+
+    assert date.entities["datetime"] == [{"type": "date", "timex": ["2023-06-05"]}]
+    assert budget.entities["money"] == [{"number": 500.0, "units": "Euro"}]
+    assert luis.calls == 0
+
+
+def test_long_answer_goes_to_luis(local_model):
+    luis = _Counting_recognizer()
+    recognizer = Cascading_recognizer(DefaultConfig(), luis, local_model)
+
+    _recognize(recognizer, "Paris but only if the hotel has a pool", "destination")
+    _recognize(recognizer, "between June 5 and June 9", "departure_date")
+    _recognize(recognizer, "hello")
+
+    assert luis.calls == 3
+    assert recognizer.stats()[LUIS_TIER] == {"destination": 1, "departure_date": 1, "none": 1}
+
+
+def test_cities_of_luis_are_learned(local_model):
+    luis = _Counting_recognizer(cities=["Lisbon"])
+    recognizer = Cascading_recognizer(DefaultConfig(), luis, local_model)
+
+    _recognize(recognizer, "to Lisbon please", "destination")
+    result = _recognize(recognizer, "to Lisbon please", "destination")
+
+    assert result.entities["To_place"] == ["Lisbon"]
+    assert luis.calls == 1
+
+
+def test_luis_asked_once_per_turn(local_model):
+    luis = _Counting_recognizer()
+    recognizer = Cascading_recognizer(DefaultConfig(), luis, local_model)
+    turn_context = make_turn_context("somewhere warm")
+
+    # Two steps of one turn ask for the same text with different prompts.
+    _recognize(recognizer, "somewhere warm", "destination", turn_context)
+    _recognize(recognizer, "somewhere warm", "origin", turn_context)
+
+    assert luis.calls == 1
+    assert TurnRecognitionCache.TURN_STATE_KEY in turn_context.turn_state
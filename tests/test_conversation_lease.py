@@ -0,0 +1,90 @@
+"""Tests of the leases of the conversations shared by the workers."""
+
+import asyncio
+
+import pytest
+
+from storage import ConversationLeases, SqliteConversationLeases
+from turn_dispatcher import TurnRejected
+
+
+def test_in_process_leases_never_wait():
+    leases = ConversationLeases()
+
+    async def run():
+        async with leases.hold("conversation"):
+            async with leases.hold("conversation"):
+                pass
+
+    asyncio.run(run())
+    assert leases.stats() == {"acquired": 2, "contended": 0, "refused": 0}
+
+
+def test_second_worker_waits_for_the_release(tmp_path):
+    path = str(tmp_path / "state.db")
+    first, second = SqliteConversationLeases(path), SqliteConversationLeases(path)
+    order = []
+
+    async def turn(leases, name, duration):
+        async with leases.hold("conversation"):
+            order.append(f"{name} start")
+            await asyncio.sleep(duration)
+            order.append(f"{name} end")
+
+    async def run():
+        held = asyncio.ensure_future(turn(first, "first", 0.1))
+        await asyncio.sleep(0.02)
+        await turn(second, "second", 0)
+        await held
+
+    asyncio.run(run())
+    assert order == ["first start", "first end", "second start", "second end"]
+    assert second.stats()["contended"] == 1
+
+
+def test_other_conversations_are_not_held(tmp_path):
+    path = str(tmp_path / "state.db")
+    first, second = SqliteConversationLeases(path), SqliteConversationLeases(path, wait=0)
+
+    async def run():
+        async with first.hold("conversation 1"):
+            async with second.hold("conversation 2"):
+                pass
+
+    asyncio.run(run())
+    assert second.stats()["refused"] == 0
+
+
+def test_refused_after_waiting(tmp_path):
+    path = str(tmp_path / "state.db")
+    first = SqliteConversationLeases(path)
+    second = SqliteConversationLeases(path, wait=0.05, retry_after=3)
+
+    async def run():
+        async with first.hold("conversation"):
+            async with second.hold("conversation"):
+                pass
+
+    with pytest.raises(TurnRejected) as rejection:
+        asyncio.run(run())
+    assert rejection.value.retry_after == 3
+    assert second.stats()["refused"] == 1
+
+
+def test_expired_lease_is_taken(tmp_path):
+    path = str(tmp_path / "state.db")
+    # A worker killed during its turn never releases its lease.
+    dead = SqliteConversationLeases(path, ttl=0.05)
+    assert dead._acquire("conversation", "dead worker")
+    alive = SqliteConversationLeases(path, wait=1)
+
+    async def run():
+        async with alive.hold("conversation"):
+            pass
+
+    asyncio.run(run())
+    assert alive.stats()["acquired"] == 1
+    # The release of the dead worker does not free the lease of another.
+    assert alive._acquire("conversation", "next")
+    dead._release("conversation", "dead worker")
+    assert not alive._acquire("conversation", "other")
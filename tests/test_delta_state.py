@@ -0,0 +1,106 @@
+"""Tests of the states writing only what changed during the turn."""
+
+import asyncio
+
+from botbuilder.core import MemoryStorage
+
+from storage import BoundedMemoryStorage, DeltaConversationState
+
+from tests.conftest import make_turn_context
+
+
+class _Recording_storage(BoundedMemoryStorage):
+    """BoundedMemoryStorage recording the writes it receives."""
+
+    def __init__(self):
+        super(_Recording_storage, self).__init__()
+        self.written = []
+
+    async def write(self, changes):
+        self.written.append(("write", sorted(next(iter(changes.values())))))
+        await super(_Recording_storage, self).write(changes)
+
+    async def write_properties(self, key, state, changed, removed):
+        self.written.append(("write_properties", sorted(changed), sorted(removed)))
+        return await super(_Recording_storage, self).write_properties(key, state, changed, removed)
+
+
+def _turn(state, change=None, load=True, force=False):
+    """Run a turn loading the state, applying change to it and saving it."""
+
+    async def run():
+        context = make_turn_context("hi")
+        if load:
+            await state.load(context)
+            if change is not None:
+                change(state.get_cached_state(context).state)
+        await state.save_changes(context, force)
+
+    asyncio.run(run())
+
+
+def _set(**values):
+    return lambda state: state.update(values)
+
+
+def test_only_the_changed_properties_written():
+    storage = _Recording_storage()
+    state = DeltaConversationState(storage)
+
+    _turn(state, _set(dialog="a", details="x"))
+    _turn(state)
+    _turn(state, _set(dialog="b"))
+    _turn(state, lambda values: values.pop("details"))
+
+    assert storage.written == [
+        ("write", ["details", "dialog"]),
+        ("write_properties", ["dialog"], []),
+        ("write_properties", [], ["details"]),
+    ]
+    stats = state.stats()
+    assert (stats["saves"], stats["skipped"], stats["full_writes"], stats["delta_writes"]) == (4, 1, 1, 2)
+    assert next(iter(storage.memory.values())) == {"dialog": "b"}
+
+
+def test_change_inside_a_property_seen():
+    storage = _Recording_storage()
+    state = DeltaConversationState(storage)
+    _turn(state, _set(details={"city": "Paris"}))
+
+    _turn(state, lambda values: values["details"].update(city="Berlin"))
+
+    assert storage.written[-1] == ("write_properties", ["details"], [])
+
+
+def test_state_not_loaded_not_written():
+    storage = _Recording_storage()
+    state = DeltaConversationState(storage)
+
+    _turn(state, load=False)
+
+    assert storage.written == []
+    assert state.stats()["skipped"] == 1
+
+
+def test_forced_save_writes_the_whole_state():
+    storage = _Recording_storage()
+    state = DeltaConversationState(storage)
+    _turn(state, _set(dialog="a"))
+
+    _turn(state, force=True)
+
+    assert storage.written[-1] == ("write", ["dialog"])
+    assert state.stats()["full_writes"] == 2
+
+
+def test_storage_without_write_properties():
+    storage = MemoryStorage()
+    state = DeltaConversationState(storage)
+    _turn(state, _set(dialog="a", details="x"))
+
+    _turn(state, _set(dialog="b"))
+    _turn(state)
+
+    stats = state.stats()
+    assert (stats["full_writes"], stats["delta_writes"], stats["skipped"]) == (2, 0, 1)
+    assert next(iter(storage.memory.values()))["dialog"] == "b"
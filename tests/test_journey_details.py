@@ -0,0 +1,104 @@
+"""Tests of the compact pickles of the journey details and the utterances."""
+
+import copyreg
+import pickle
+
+import pytest
+
+from journey_details import Journey_details, UtteranceLog
+
+
+class _Pickled_before_the_slots:
+    """Pickles an object as the classes did with their __dict__."""
+
+    def __init__(self, cls, state):
+        self.cls = cls
+        self.state = state
+
+    def __reduce__(self):
+        return (copyreg._reconstructor, (self.cls, object, None), self.state)
+
+
+def _round_trip(value):
+    return pickle.loads(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+
+@pytest.fixture
+def small_log(monkeypatch):
+    monkeypatch.setattr(UtteranceLog, "max_utterances", 3)
+
+
+def test_log_bounded(small_log):
+    log = UtteranceLog()
+    for utterance in ["a", "b", None, "d"]:
+        log.append(utterance)
+
+    assert log.utterance_list == ["b", "", "d"]
+    assert log.overflow == 1
+    assert log.text() == "[1 earlier]\tb\t\td"
+
+
+def test_details_round_trip():
+    details = Journey_details("Paris", "London", "2023-06-05", None, 500.0)
+    details.log_utterances.append("to Paris")
+    details.log_utterances.turn_number = 2
+    details.save_next_utterance = False
+
+    copy = _round_trip(details)
+
+    assert (copy.destination, copy.origin, copy.departure_date, copy.return_date, copy.max_budget) == (
+        "Paris", "London", "2023-06-05", None, 500.0
+    )
+    assert copy.save_next_utterance is False
+    assert copy.log_utterances.utterance_list == ["to Paris"]
+    assert copy.log_utterances.turn_number == 2
+
+
+def test_pickle_names_no_field():
+    blob = pickle.dumps(Journey_details("Paris"), pickle.HIGHEST_PROTOCOL)
+
+    assert b"destination" not in blob
+    assert b"UtteranceLog" not in blob
+
+
+def test_legacy_pickle_read(small_log):
+    log = _Pickled_before_the_slots(
+        UtteranceLog, {"utterance_list": ["a", "b", "c", "d"], "_turn_number": 4}
+    )
+    details = _Pickled_before_the_slots(
+        Journey_details,
+        {
+            "destination": "Paris",
+            "origin": None,
+            "departure_date": "2023-06-05",
+            "return_date": None,
+            "max_budget": 500.0,
+            "log_utterances": log,
+        },
+    )
+
+    copy = _round_trip(details)
+
+    assert isinstance(copy, Journey_details)
+    assert (copy.destination, copy.departure_date, copy.max_budget) == ("Paris", "2023-06-05", 500.0)
+    assert copy.save_next_utterance is True
+    assert copy.log_utterances.turn_number == 4
+    assert copy.log_utterances.utterance_list == ["b", "c", "d"]
+    assert copy.log_utterances.overflow == 1
+
+
+def test_legacy_pickle_without_log():
+    copy = _round_trip(_Pickled_before_the_slots(Journey_details, {"destination": "Paris"}))
+
+    assert copy.destination == "Paris"
+    assert copy.log_utterances.utterance_list == []
+
+
+def test_merge():
+    details = Journey_details("Paris", max_budget=500.0)
+
+    details.merge(Journey_details("Berlin", "London", max_budget=800.0))
+    assert (details.destination, details.origin, details.max_budget) == ("Paris", "London", 500.0)
+
+    details.merge(Journey_details("Berlin"), replace_when_exist=True)
+    assert (details.destination, details.origin) == ("Berlin", "London")
@@ -0,0 +1,59 @@
+"""Tests of the LUIS recognizer falling back to the local one."""
+
+import asyncio
+import socket
+
+from cascading_recognizer import Cascading_recognizer
+from config import DefaultConfig
+from journey_specifier_recognizer import Journey_specifier_recognizer
+from local_journey_recognizer import Local_journey_recognizer
+from luis_transport import CircuitBreaker
+
+from tests.conftest import converse, make_bot
+
+
+def _closed_port() -> int:
+    """Return a port nobody listens on."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class _Unreachable_luis_config(DefaultConfig):
+    """LUIS configured on a port refusing the connections."""
+
+    LUIS_APP_ID = "12345678-1234-1234-1234-123456789012"
+    LUIS_API_KEY = "12345678123412341234123456789012"
+    LUIS_API_HOST_NAME = f"http://127.0.0.1:{_closed_port()}"
+    LUIS_POOLED_TRANSPORT = True
+    LUIS_CACHE_SIZE = 0
+    LUIS_TIMEOUT = 0.5
+    LUIS_DEADLINE = 1.0
+    LUIS_MAX_RETRIES = 0
+    LUIS_BREAKER_FAILURES = 1
+    LUIS_BREAKER_RESET = 60
+    LUIS_HEDGE = False
+    LUIS_RECORD_PATH = ""
+
+
+def test_conversation_with_the_circuit_open(local_model_path):
+    # Built as app.py does.
+    config = _Unreachable_luis_config()
+    local_recognizer = Local_journey_recognizer(config, local_model_path)
+    recognizer = Journey_specifier_recognizer(config, fallback=local_recognizer)
+    bot = make_bot(Cascading_recognizer(config, recognizer, local_recognizer.model))
+
+    async def run():
+        try:
+            return await converse(bot, ["hi", "I want to go to Paris", "London"])
+        finally:
+            await recognizer.close()
+
+    replies = asyncio.run(run())
+
+    assert recognizer.transport_stats["circuit"]["state"] == CircuitBreaker.OPEN
+    assert recognizer.fallback_answers >= 2
+    assert replies[1] == ["From which city will you be travelling?"]
+    assert replies[2] == ["When do you want to leave?"]
+    assert not any("error" in text for turn in replies for text in turn)
+
@@ -0,0 +1,99 @@
+"""Tests of the local model decoding the messages without LUIS."""
+
+from datetime import date
+
+import numpy as np
+import pytest
+
+from config import DefaultConfig
+from local_journey_recognizer import (
+    ENTITY_CONFIDENCE,
+    Local_journey_model,
+    Local_journey_recognizer,
+    extract_dates,
+    extract_money,
+    tokenize,
+)
+
+
+def test_tokenize():
+    assert tokenize("I'd fly to Paris for $500!") == ["i'd", "fly", "to", "paris", "for", "$", "500"]
+    assert tokenize(None) == []
+
+
+def test_extract_dates():
+    dates = extract_dates("leave on June 5th 2023, back 12/06 or tomorrow", today=date(2023, 6, 1))
+
+    assert [(text, timex) for _, _, text, timex in dates] == [
+        ("June 5th 2023", "2023-06-05"),
+        ("12/06", "XXXX-12-06"),
+        ("tomorrow", "2023-06-02"),
+    ]
+
+
+def test_extract_dates_skips_impossible_days():
+    assert extract_dates("on 13/45") == []
+
+
+@pytest.mark.parametrize(
+    "text,number,units",
+    [
+        ("up to 1,500 euros", 1500.0, "Euro"),
+        ("$2k", 2000.0, "Dollar"),
+        ("budget 300", 300.0, "Euro"),
+        ("400 pounds", 400.0, "British pound"),
+    ],
+)
+def test_extract_money(text, number, units):
+    [(_, _, _, value)] = extract_money(text)
+
+    assert value == {"number": number, "units": units}
+
+
+def test_extract_money_needs_a_cue():
+    assert extract_money("500") == []
+    assert extract_money("on the 5th") == []
+    assert [value["number"] for _, _, _, value in extract_money("500", whole_text_is_amount=True)] == [500.0]
+
+
+def test_model_saved_and_loaded(local_model, tmp_path):
+    path = str(tmp_path / "model.npz")
+    local_model.save(path)
+
+    loaded = Local_journey_model.load(path)
+
+    assert loaded.intents == local_model.intents
+    assert loaded.predict_intents(["hello"]) == pytest.approx(local_model.predict_intents(["hello"]), rel=1e-5)
+
+
+def test_predict_intents(local_model):
+    scores = local_model.predict_intents(tokenize("hello there"))
+
+    assert max(scores, key=scores.get) == "Greetings"
+    assert np.isclose(sum(scores.values()), 1.0)
+
+
+def test_recognize_journey(local_model_path):
+    recognizer = Local_journey_recognizer(DefaultConfig(), local_model_path)
+
+    result = recognizer.recognize_text("I want to go to Paris from New York on June 5 2023, budget 500 euros")
+
+    assert result.entities["To_place"] == ["Paris"]
+    assert result.entities["From_place"] == ["New York"]
+    assert result.entities["From_date"] == ["June 5 2023"]
+    assert result.entities["datetime"] == [{"type": "date", "timex": ["2023-06-05"]}]
+    assert result.entities["money"] == [{"number": 500.0, "units": "Euro"}]
+    assert result.intents["Specify_journey"].score >= ENTITY_CONFIDENCE
+
+
+def test_recognize_greetings(local_model_path):
+    recognizer = Local_journey_recognizer(DefaultConfig(), local_model_path)
+
+    result = recognizer.recognize_text("hello")
+
+    assert result.entities == {}
+    assert max(result.intents, key=lambda name: result.intents[name].score) == "Greetings"
+
+
+def test_not_configured_without_model(tmp_path):
+    assert not Local_journey_recognizer(DefaultConfig(), str(tmp_path / "missing.npz")).is_configured
@@ -0,0 +1,73 @@
+"""Tests of LuisHelper.execute_luis_query."""
+
+import asyncio
+
+from botbuilder.core import IntentScore, RecognizerResult
+
+from config import DefaultConfig
+from helpers.luis_helper import LuisHelper
+from journey_details import Journey_details
+from local_journey_recognizer import Local_journey_recognizer
+
+from tests.conftest import make_turn_context
+
+
+class _Fixed_recognizer:
+    """Recognizer answering the same result to every message."""
+
+    def __init__(self, result: RecognizerResult):
+        self.result = result
+
+    async def recognize(self, turn_context):
+        return self.result
+
+
+def _query(recognizer, text: str, prompt: str = None):
+    return asyncio.run(
+        LuisHelper.execute_luis_query(recognizer, make_turn_context(text), prompt=prompt)
+    )
+
+
+def test_top_intent_of_several_scores():
+    result = RecognizerResult(
+        text="hi",
+        intents={
+            "Specify_journey": IntentScore(0.1),
+            "Greetings": IntentScore(0.85),
+            "Help": IntentScore(0.05),
+        },
+        entities={},
+    )
+
+    assert _query(_Fixed_recognizer(result), "hi") == ("Greetings", "Hey")
+
+
+def test_top_intent_below_threshold():
+    result = RecognizerResult(
+        text="hmm",
+        intents={"Greetings": IntentScore(0.1), "Help": IntentScore(0.15)},
+        entities={"money": [{"number": 5}]},
+    )
+
+    assert _query(_Fixed_recognizer(result), "hmm") == (None, {"money": [{"number": 5}]})
+
+
+def test_local_recognizer_result(local_model_path):
+    recognizer = Local_journey_recognizer(DefaultConfig(), local_model_path)
+    assert len(recognizer.recognize_text("hello").intents) > 1
+
+    assert _query(recognizer, "hello") == ("Greetings", "Hey")
+
+    intent, journey = _query(recognizer, "I want to go to Paris from London for 500 euros")
+    assert intent == "Specify_journey"
+    assert isinstance(journey, Journey_details)
+    assert (journey.destination, journey.origin) == ("Paris", "London")
+    assert journey.max_budget["number"] == 500
+
+
+def test_failing_recognizer():
+    class _Failing_recognizer:
+        async def recognize(self, turn_context):
+            raise RuntimeError("down")
+
+    assert _query(_Failing_recognizer(), "hi") == (None, None)
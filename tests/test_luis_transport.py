@@ -0,0 +1,95 @@
+"""Tests of the circuit breaker and of the hedging of the LUIS requests."""
+
+import asyncio
+
+import pytest
+
+from luis_transport import CircuitBreaker, LuisUnavailableError, RequestHedger
+
+
+def test_circuit_opens_after_the_failures_and_probes_once():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # After the reset timeout, a single request tests the service.
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_open_circuit_rejects():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    assert not breaker.allow()
+    assert breaker.stats()["rejected"] == 1
+
+
+def _answer_after(seconds: float, answer: str = None, error: Exception = None):
+    async def call():
+        await asyncio.sleep(seconds)
+        if error is not None:
+            raise error
+        return answer
+
+    return call
+
+
+def _run(coroutine):
+    async def run():
+        result = await coroutine
+        # Let the requests cancelled record their latency.
+        await asyncio.sleep(0.01)
+        return result
+
+    return asyncio.run(run())
+
+
+def test_fast_answer_is_not_hedged():
+    hedger = RequestHedger(default_delay=0.1, budget=1)
+    assert _run(hedger.run(_answer_after(0, "first"), _answer_after(0, "second"))) == "first"
+    assert hedger.stats()["fired"] == 0
+
+
+def test_slow_answer_is_hedged_within_the_budget():
+    hedger = RequestHedger(default_delay=0.02, budget=1, min_delay=0)
+    result = _run(hedger.run(_answer_after(1, "first"), _answer_after(0, "second")))
+    assert result == "second"
+    assert (hedger.fired, hedger.won) == (1, 1)
+
+    hedger = RequestHedger(default_delay=0.02, budget=0.5, min_delay=0)
+    result = _run(hedger.run(_answer_after(0.05, "first"), _answer_after(0, "second")))
+    assert result == "first"
+    assert hedger.denied == 1
+
+
+def test_abandoned_and_failed_calls_are_recorded():
+    hedger = RequestHedger(default_delay=0.02, budget=1, min_delay=0, max_latency=0.5)
+    _run(hedger.run(_answer_after(10, "first"), _answer_after(0.05, "second")))
+    # The primary was cancelled when the hedge won: both are recorded.
+    latencies = sorted(hedger._latencies)
+    assert len(latencies) == 2
+    assert latencies[0] >= 0.05 and latencies[1] >= 0.05
+
+    hedger = RequestHedger(default_delay=1, max_latency=0.5)
+    with pytest.raises(LuisUnavailableError):
+        _run(hedger.run(_answer_after(0.01, error=LuisUnavailableError("down")), None))
+    assert len(hedger._latencies) == 1
+
+
+def test_recorded_latency_is_capped():
+    hedger = RequestHedger(max_latency=0.5, min_samples=1, min_delay=0)
+    hedger.record(30)
+    assert hedger.delay() == 0.5
+
+
+def test_delay_follows_the_percentile():
+    hedger = RequestHedger(percentile=90, min_samples=10, min_delay=0)
+    for latency in range(1, 11):
+        hedger.record(latency / 100)
+    assert hedger.delay() == 0.1
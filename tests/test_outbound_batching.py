@@ -0,0 +1,66 @@
+"""Tests of the merge of the messages a turn sends."""
+
+from botbuilder.schema import Activity, ActivityTypes, CardAction, SuggestedActions
+
+from helpers.outbound_batching import OutboundBatchPolicy, merge_activities
+
+
+def _text(text, speak=None):
+    return Activity(type=ActivityTypes.message, text=text, speak=speak)
+
+
+def _prompt(text):
+    return Activity(
+        type=ActivityTypes.message,
+        text=text,
+        input_hint="expectingInput",
+        suggested_actions=SuggestedActions(actions=[CardAction(title="Yes", value="Yes")]),
+    )
+
+
+def test_policy_from_setting():
+    policy = OutboundBatchPolicy.from_setting("*:merge, msteams:OFF")
+
+    assert policy.merges("webchat")
+    assert not policy.merges("msteams")
+    assert not OutboundBatchPolicy.from_setting("").merges("webchat")
+
+
+def test_texts_merged_into_the_prompt():
+    prompt = _prompt("Is that right?")
+
+    merged = merge_activities([_text("You go to Paris."), _text("You leave on June 5."), prompt])
+
+    assert merged == [prompt]
+    assert prompt.text == "You go to Paris.\n\nYou leave on June 5.\n\nIs that right?"
+    assert prompt.input_hint == "expectingInput"
+    assert prompt.suggested_actions is not None
+
+
+def test_order_kept_around_other_activities():
+    typing = Activity(type=ActivityTypes.typing)
+    card = Activity(type=ActivityTypes.message, attachments=[{"contentType": "card"}])
+
+    merged = merge_activities([_text("a"), _text("b"), typing, _text("c"), card, _text("d")])
+
+    assert [(activity.type, activity.text) for activity in merged] == [
+        (ActivityTypes.message, "a\n\nb"),
+        (ActivityTypes.typing, None),
+        (ActivityTypes.message, "c"),
+        (ActivityTypes.message, "d"),
+    ]
+    assert merged[2].attachments == [{"contentType": "card"}]
+    assert merged[2].text == "c"
+
+
+def test_speak_merged():
+    merged = merge_activities([_text("Hello.", speak="Hi."), _text("Where to?")])
+
+    assert [(activity.text, activity.speak) for activity in merged] == [("Hello.\n\nWhere to?", "Hi. Where to?")]
+
+
+def test_single_activity_unchanged():
+    activity = _text("alone")
+
+    assert merge_activities([activity]) == [activity]
+    assert merge_activities([]) == []
@@ -0,0 +1,74 @@
+"""Tests of the dialog asking for the slots one by one."""
+
+import asyncio
+
+import pytest
+
+from cascading_recognizer import Cascading_recognizer
+from config import DefaultConfig
+from dialogs.slot_filling_dialog import Slot_filling_dialog, missing_date_parts
+from dialogs.specifying_dialog import Journey_dialog, Specifying_dialog
+from local_journey_recognizer import Local_journey_recognizer
+
+from tests.conftest import converse, make_bot
+
+
+@pytest.mark.parametrize(
+    "timex,missing",
+    [
+        ("2023-06-01", None),
+        ("XXXX-06-05", "the year"),
+        ("2023-06", "the day"),
+        ("2023-W23", "the day and the month"),
+        ("(2023-06-01,2023-06-05,P4D)", "the day"),
+    ],
+)
+def test_missing_date_parts(timex, missing):
+    assert missing_date_parts(timex) == missing
+
+
+def test_dialogs_are_siblings():
+    dialog = Slot_filling_dialog()
+
+    assert isinstance(dialog, Journey_dialog)
+    assert not isinstance(dialog, Specifying_dialog)
+    assert dialog.id == Slot_filling_dialog.__name__
+    assert dialog.telemetry_client is not None
+
+
+def _bot(local_model_path, specifying_dialog):
+    config = DefaultConfig()
+    local_recognizer = Local_journey_recognizer(config, local_model_path)
+    recognizer = Cascading_recognizer(config, local_recognizer, local_recognizer.model)
+    return make_bot(recognizer, specifying_dialog)
+
+
+def test_range_is_asked_again(local_model_path):
+    bot = _bot(local_model_path, Slot_filling_dialog())
+
+    replies = asyncio.run(
+        converse(
+            bot,
+            [
+                "hi",
+                "I want to go to Paris from London",
+                "next week",
+                "in June 2023",
+                "June 1 2023",
+            ],
+        )
+    )
+
+    assert replies[1] == ["When do you want to leave?"]
+    assert replies[2] == ["Please be more precise."]
+    assert replies[3] == ["Please be more precise."]
+    assert replies[4] == ["When do you want to come back?"]
+
+
+def test_specifying_dialog_still_asks(local_model_path):
+    bot = _bot(local_model_path, Specifying_dialog())
+
+    replies = asyncio.run(converse(bot, ["hi", "I want to go to Paris", "London"]))
+
+    assert replies[1] == ["From which city will you be travelling?"]
+    assert replies[2] == ["When do you want to leave?"]
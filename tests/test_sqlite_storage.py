@@ -0,0 +1,92 @@
+"""Tests of the SQLite storage shared by the worker processes."""
+
+import asyncio
+
+import pytest
+
+from storage import SqliteStorage, StateConflict
+
+
+def _run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_written_state_read_back(tmp_path):
+    storage = SqliteStorage(str(tmp_path / "state.db"))
+    _run(storage.write({"key": {"value": 1, "e_tag": "*"}}))
+
+    state = _run(storage.read(["key", "missing"]))
+
+    assert state == {"key": {"value": 1, "e_tag": "1"}}
+
+
+def test_e_tag_conflict_between_processes(tmp_path):
+    # Two storages on one file stand for two workers.
+    first = SqliteStorage(str(tmp_path / "state.db"))
+    second = SqliteStorage(str(tmp_path / "state.db"))
+    _run(first.write({"key": {"value": 0, "e_tag": "*"}}))
+    read_by_first = _run(first.read(["key"]))["key"]
+    read_by_second = _run(second.read(["key"]))["key"]
+
+    _run(second.write({"key": dict(read_by_second, value=2)}))
+
+    with pytest.raises(StateConflict):
+        _run(first.write({"key": dict(read_by_first, value=1)}))
+    assert _run(first.read(["key"]))["key"] == {"value": 2, "e_tag": "2"}
+    assert first.stats()["conflicts"] == 1
+
+
+def test_unconditional_write(tmp_path):
+    storage = SqliteStorage(str(tmp_path / "state.db"))
+    _run(storage.write({"key": {"value": 1}}))
+
+    _run(storage.write({"key": {"value": 2, "e_tag": "*"}}))
+
+    assert _run(storage.read(["key"]))["key"] == {"value": 2, "e_tag": "2"}
+
+
+def test_read_cache(tmp_path):
+    storage = SqliteStorage(str(tmp_path / "state.db"))
+    other = SqliteStorage(str(tmp_path / "state.db"))
+    _run(storage.write({"key": {"value": 1}}))
+
+    _run(storage.read(["key"]))
+    assert storage.stats()["cache_hits"] == 1
+
+    # A write by another worker makes the cached pickle stale.
+    _run(other.write({"key": {"value": 2}}))
+    assert _run(storage.read(["key"]))["key"]["value"] == 2
+    assert storage.stats()["cache_hits"] == 1
+
+
+def test_concurrent_writes_batched(tmp_path):
+    storage = SqliteStorage(str(tmp_path / "state.db"))
+    _run(storage.write({"stale": {"value": 0}}))
+    stale = _run(storage.read(["stale"]))["stale"]
+    _run(storage.write({"stale": {"value": 1}}))
+    transactions = storage.stats()["transactions"]
+
+    async def run():
+        return await asyncio.gather(
+            storage.write({"a": {"value": 1}}),
+            storage.write({"stale": dict(stale, value=2)}),
+            storage.write({"b": {"value": 1}}),
+            return_exceptions=True,
+        )
+
+    results = _run(run())
+
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], StateConflict)
+    assert storage.stats()["transactions"] == transactions + 1
+    assert sorted(_run(storage.read(["a", "b"]))) == ["a", "b"]
+
+
+def test_delete(tmp_path):
+    storage = SqliteStorage(str(tmp_path / "state.db"))
+    _run(storage.write({"key": {"value": 1}}))
+
+    _run(storage.delete(["key"]))
+
+    assert _run(storage.read(["key"])) == {}
+    assert storage.stats()["cached"] == 0
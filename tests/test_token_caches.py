@@ -0,0 +1,161 @@
+"""Tests of the caches of the tokens received and sent by the bot."""
+
+import asyncio
+
+import jwt
+from botframework.connector.auth import ClaimsIdentity
+
+import auth_cache
+import connector_pool
+from auth_cache import ValidatedTokenCache
+from connector_pool import AppTokenCache
+
+
+def _clock(monkeypatch, module, start=1000.0):
+    now = [start]
+    monkeypatch.setattr(module.time, "time", lambda: now[0])
+    return now
+
+
+def _identity(exp, is_authenticated=True):
+    return ClaimsIdentity({"aud": "bot", "exp": exp}, is_authenticated)
+
+
+def test_identity_kept_until_its_token_expires(monkeypatch):
+    now = _clock(monkeypatch, auth_cache)
+    cache = ValidatedTokenCache()
+    key = ValidatedTokenCache.key("Bearer token", "webchat", "https://service")
+    cache.put(key, _identity(exp=1100))
+
+    now[0] = 1099
+    identity = cache.get(key)
+    now[0] = 1100
+    expired = cache.get(key)
+
+    assert identity.claims["aud"] == "bot"
+    assert expired is None
+    assert cache.stats() == {"identities": 0, "hits": 1, "misses": 1}
+
+
+def test_identity_kept_at_most_max_ttl(monkeypatch):
+    now = _clock(monkeypatch, auth_cache)
+    cache = ValidatedTokenCache(max_ttl=60)
+    cache.put("key", _identity(exp=5000))
+
+    now[0] += 61
+
+    assert cache.get("key") is None
+
+
+def test_identities_not_kept():
+    cache = ValidatedTokenCache()
+    cache.put("anonymous", _identity(exp=10 ** 10, is_authenticated=False))
+    cache.put("expired", _identity(exp=1))
+    cache.put("no expiry", ClaimsIdentity({}, True))
+
+    assert cache.stats()["identities"] == 0
+
+
+def test_key_depends_on_the_channel():
+    assert ValidatedTokenCache.key("Bearer token", "webchat", "https://a") != ValidatedTokenCache.key(
+        "Bearer token", "msteams", "https://a"
+    )
+
+
+def test_identity_copied():
+    cache = ValidatedTokenCache()
+    cache.put("key", _identity(exp=10 ** 10))
+
+    cache.get("key").claims["aud"] = "changed"
+
+    assert cache.get("key").claims["aud"] == "bot"
+
+
+def test_least_recently_used_identity_forgotten():
+    cache = ValidatedTokenCache(max_entries=2)
+    cache.put("a", _identity(exp=10 ** 10))
+    cache.put("b", _identity(exp=10 ** 10))
+    cache.get("a")
+    cache.put("c", _identity(exp=10 ** 10))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+
+
+class _Credentials:
+    """Stand-in for the AppCredentials of the bot."""
+
+    microsoft_app_id = "app"
+    oauth_scope = "https://api.botframework.com/.default"
+
+    def __init__(self, exp=None, authorize=True):
+        self.fetched = 0
+        self.exp = exp
+        self.authorize = authorize
+
+    def _should_authorize(self, session):
+        return self.authorize
+
+    def get_access_token(self):
+        self.fetched += 1
+        claims = {"n": self.fetched}
+        if self.exp is not None:
+            claims["exp"] = self.exp
+        return jwt.encode(claims, "a signing key of the tests, long enough", algorithm="HS256")
+
+
+def test_app_token_fetched_again_before_its_expiry(monkeypatch):
+    now = _clock(monkeypatch, connector_pool)
+    cache = AppTokenCache(refresh_margin=300)
+    credentials = _Credentials(exp=1000 + 3600)
+
+    async def run():
+        first = await cache.get(credentials)
+        now[0] += 3600 - 301
+        second = await cache.get(credentials)
+        now[0] += 2
+        third = await cache.get(credentials)
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+
+    assert first == second != third
+    assert credentials.fetched == 2
+    assert cache.stats() == {"tokens": 1, "hits": 1, "misses": 2}
+
+
+def test_app_token_without_exp(monkeypatch):
+    now = _clock(monkeypatch, connector_pool)
+    cache = AppTokenCache(refresh_margin=0, default_lifetime=60)
+    credentials = _Credentials()
+
+    async def run():
+        await cache.get(credentials)
+        now[0] += 59
+        await cache.get(credentials)
+        now[0] += 2
+        await cache.get(credentials)
+
+    asyncio.run(run())
+
+    assert credentials.fetched == 2
+
+
+def test_app_token_fetched_once_for_concurrent_requests():
+    cache = AppTokenCache()
+    credentials = _Credentials(exp=10 ** 10)
+
+    async def run():
+        return await asyncio.gather(*(cache.get(credentials) for _ in range(5)))
+
+    tokens = asyncio.run(run())
+
+    assert len(set(tokens)) == 1
+    assert credentials.fetched == 1
+
+
+def test_no_app_token_without_authorization():
+    credentials = _Credentials(authorize=False)
+
+    assert asyncio.run(AppTokenCache().get(credentials)) is None
+    assert credentials.fetched == 0
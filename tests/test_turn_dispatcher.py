@@ -0,0 +1,112 @@
+"""Tests of the serialization and admission of the turns."""
+
+import asyncio
+
+import pytest
+
+from turn_dispatcher import TurnDispatcher, TurnRejected
+
+
+def _turn(log, name, gate=None):
+    async def turn():
+        log.append(f"{name} start")
+        await (gate.wait() if gate is not None else asyncio.sleep(0))
+        log.append(f"{name} end")
+        return name
+
+    return turn
+
+
+def test_turns_of_a_conversation_in_order():
+    async def run():
+        dispatcher = TurnDispatcher()
+        log = []
+        gate = asyncio.Event()
+        first = asyncio.ensure_future(dispatcher.dispatch("a", _turn(log, "1", gate)))
+        second = asyncio.ensure_future(dispatcher.dispatch("a", _turn(log, "2")))
+        other = asyncio.ensure_future(dispatcher.dispatch("b", _turn(log, "3")))
+        await other
+        gate.set()
+        return log, await asyncio.gather(first, second), dispatcher.stats()
+
+    log, results, stats = asyncio.run(run())
+
+    # The turn of the other conversation did not wait for the first one.
+    assert log == ["1 start", "3 start", "3 end", "1 end", "2 start", "2 end"]
+    assert results == ["1", "2"]
+    assert (stats["turns"], stats["conversations"], stats["waiting"]) == (3, 0, 0)
+
+
+def test_in_flight_capped():
+    async def run():
+        dispatcher = TurnDispatcher(max_in_flight=1)
+        log = []
+        gate = asyncio.Event()
+        first = asyncio.ensure_future(dispatcher.dispatch("a", _turn(log, "1", gate)))
+        second = asyncio.ensure_future(dispatcher.dispatch("b", _turn(log, "2")))
+        await asyncio.sleep(0.01)
+        stats = dispatcher.stats()
+        gate.set()
+        await asyncio.gather(first, second)
+        return log, stats
+
+    log, stats = asyncio.run(run())
+
+    assert log == ["1 start", "1 end", "2 start", "2 end"]
+    assert (stats["in_flight"], stats["waiting"]) == (1, 1)
+
+
+def test_conversation_queue_full():
+    async def run():
+        dispatcher = TurnDispatcher(max_per_conversation=1, retry_after=3)
+        gate = asyncio.Event()
+        first = asyncio.ensure_future(dispatcher.dispatch("a", _turn([], "1", gate)))
+        await asyncio.sleep(0)
+        try:
+            with pytest.raises(TurnRejected) as rejected:
+                await dispatcher.dispatch("a", _turn([], "2"))
+            await dispatcher.dispatch("b", _turn([], "3"))
+        finally:
+            gate.set()
+            await first
+        return rejected.value, dispatcher.stats()
+
+    rejected, stats = asyncio.run(run())
+
+    assert rejected.retry_after == 3
+    assert str(rejected) == "too many turns in the conversation"
+    assert (stats["turns"], stats["rejected"]) == (2, 1)
+
+
+def test_too_many_waiting():
+    async def run():
+        dispatcher = TurnDispatcher(max_in_flight=1, max_waiting=1)
+        gate = asyncio.Event()
+        first = asyncio.ensure_future(dispatcher.dispatch("a", _turn([], "1", gate)))
+        second = asyncio.ensure_future(dispatcher.dispatch("b", _turn([], "2")))
+        await asyncio.sleep(0)
+        try:
+            with pytest.raises(TurnRejected, match="too many turns waiting"):
+                await dispatcher.dispatch("c", _turn([], "3"))
+        finally:
+            gate.set()
+            await asyncio.gather(first, second)
+
+    asyncio.run(run())
+
+
+def test_failed_turn_releases_its_conversation():
+    async def run():
+        dispatcher = TurnDispatcher(max_per_conversation=1)
+
+        async def failing():
+            raise ValueError("turn failed")
+
+        with pytest.raises(ValueError):
+            await dispatcher.dispatch("a", failing)
+        return await dispatcher.dispatch("a", _turn([], "2")), dispatcher.stats()
+
+    result, stats = asyncio.run(run())
+
+    assert result == "2"
+    assert (stats["in_flight"], stats["conversations"]) == (0, 0)
@@ -0,0 +1,149 @@
+"""Run the turns of a conversation one after the other, and not too many at once.
+
+Two messages of the same conversation delivered together would read the same
+dialog state and the last write would win. The dispatcher queues the turns
+per conversation id and caps the number of turns running. When the queues
+are full, the turn is rejected so the channel retries later.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, TypeVar
+
+T = TypeVar("T")
+
+
+class TurnRejected(Exception):
+    """The turn was not queued, the bot is overloaded."""
+
+    def __init__(self, reason: str, retry_after: int):
+        """Init the class.
+
+        Args:
+            reason (str): which limit was reached.
+            retry_after (int): seconds the channel should wait.
+        """
+        super(TurnRejected, self).__init__(reason)
+        self.retry_after = retry_after
+
+
+class _Conversation_queue:
+    """Turns of one conversation, waiting or running."""
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.depth = 0
+
+
+class TurnDispatcher:
+    """Serialize the turns per conversation and admit a limited number."""
+
+    def __init__(
+        self,
+        max_in_flight: int = 64,
+        max_waiting: int = 500,
+        max_per_conversation: int = 10,
+        retry_after: int = 1,
+        window: int = 1000,
+    ):
+        """Init the class.
+
+        Args:
+            max_in_flight (int, optional): turns running at once. Defaults to 64.
+            max_waiting (int, optional): turns waiting, beyond which the new
+                ones are rejected. Defaults to 500.
+            max_per_conversation (int, optional): turns of a conversation
+                waiting or running. Defaults to 10.
+            retry_after (int, optional): seconds given to the channel in the
+                Retry-After header. Defaults to 1.
+            window (int, optional): number of wait times kept for the
+                percentiles. Defaults to 1000.
+        """
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.max_per_conversation = max_per_conversation
+        self.retry_after = retry_after
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._conversations: Dict[str, _Conversation_queue] = {}
+        self._waits: Deque[float] = deque(maxlen=window)
+        self.waiting = 0
+        self.in_flight = 0
+        self.turns = 0
+        self.rejected = 0
+
+    async def dispatch(self, conversation_id: str, turn: Callable[[], Awaitable[T]]) -> T:
+        """Run a turn after the previous ones of its conversation.
+
+        Args:
+            conversation_id (str): id of the conversation of the activity.
+            turn (Callable[[], Awaitable[T]]): starts the turn.
+
+        Raises:
+            TurnRejected: when the queues are full.
+
+        Returns:
+            T: the result of the turn.
+        """
+        queue = self._conversations.get(conversation_id)
+        if self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise TurnRejected("too many turns waiting", self.retry_after)
+        if queue is not None and queue.depth >= self.max_per_conversation:
+            self.rejected += 1
+            raise TurnRejected("too many turns in the conversation", self.retry_after)
+        if queue is None:
+            queue = self._conversations[conversation_id] = _Conversation_queue()
+
+        queue.depth += 1
+        self.waiting += 1
+        queued_at = time.monotonic()
+        waiting = True
+        try:
+            async with queue.lock:
+                async with self._semaphore:
+                    self.waiting -= 1
+                    waiting = False
+                    self._waits.append(time.monotonic() - queued_at)
+                    self.in_flight += 1
+                    self.turns += 1
+                    try:
+                        return await turn()
+                    finally:
+                        self.in_flight -= 1
+        finally:
+            if waiting:
+                self.waiting -= 1
+            queue.depth -= 1
+            if queue.depth == 0 and self._conversations.get(conversation_id) is queue:
+                del self._conversations[conversation_id]
+
+    @property
+    def conversations(self) -> int:
+        """Return the number of conversations with a turn running or waiting."""
+        return len(self._conversations)
+
+    def stats(self) -> Dict[str, object]:
+        """Return the state of the queues.
+
+        Returns:
+            Dict[str, object]: turns running and waiting, conversations with
+                turns queued, the deepest queue, turns run and rejected, and
+                the wait percentiles in milliseconds.
+        """
+        waits = sorted(self._waits)
+
+        def percentile(value: float) -> float:
+            if not waits:
+                return 0.0
+            return round(1000 * waits[min(len(waits) - 1, int(len(waits) * value / 100))], 2)
+
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "conversations": self.conversations,
+            "max_depth": max((queue.depth for queue in self._conversations.values()), default=0),
+            "turns": self.turns,
+            "rejected": self.rejected,
+            "wait_ms": {"p50": percentile(50), "p99": percentile(99), "max": percentile(100)},
+        }